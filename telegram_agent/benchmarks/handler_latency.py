@@ -0,0 +1,145 @@
+# handler_latency.py
+#
+# Drives TelegramBot.message_handler with synthetic forum messages at a fixed rate and reports
+# the handler latency (from the message's scheduled arrival to the handler returning) and how long the
+# write-behind ingest queue takes to store everything. With --mode sync, the handler instead
+# stores each message with the synchronous store_message on the event loop, as before the
+# ingest queue, for comparison.
+#
+#   python -m telegram_agent.benchmarks.handler_latency [--rate 1000] [--seconds 5] [--mode queue|sync]
+
+# Imports -------------------------------------------------------------------------------------------------------------
+import argparse
+import asyncio
+import contextlib
+import os
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+# A fresh file database, so commits pay for real disk I/O, unless one is configured explicitly
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='handler_latency_')}/bench.db"
+)
+
+from pyrogram import types
+from pyrogram.enums import ChatType
+
+# Local Imports -------------------------------------------------------------------------------------------------------
+from telegram_agent.src.telegram.bot import TelegramBot
+from telegram_agent.src.telegram.database import engine, get_session
+from telegram_agent.src.telegram.utils import extract_context, store_message
+
+# Constants -----------------------------------------------------------------------------------------------------------
+CHAT_ID = -1001
+TOPICS = 20
+USERS = 200
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+def make_message(i: int) -> types.Message:
+    topic = i % TOPICS + 1
+    return types.Message(
+        id=i,
+        chat=types.Chat(id=CHAT_ID, type=ChatType.SUPERGROUP, title="benchmark"),
+        from_user=types.User(id=i % USERS + 1, username=f"user{i % USERS + 1}"),
+        date=datetime.now(),
+        text=f"message {i} " + "lorem ipsum " * 8,
+        topic=types.ForumTopic(
+            id=topic,
+            title=f"topic {topic}",
+            date=None,
+            icon_color=None,
+            top_message=None,
+            read_inbox_max_id=0,
+            read_outbox_max_id=0,
+            unread_count=0,
+            unread_mentions_count=0,
+            unread_reactions_count=0,
+            from_id=None,
+        ),
+    )
+
+
+async def ignore(client, context):
+    pass
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def drive(mode: str, rate: int, seconds: float) -> List[str]:
+    bot = TelegramBot(
+        api_id=1, api_hash="benchmark", bot_name="benchmark", message_processor=ignore
+    )
+    session = get_session()
+
+    async def sync_handler(client, message):
+        # The handler before the ingest queue: decode, then store on the event loop
+        context = await extract_context(message)
+        store_message(session, context)
+
+    handler = bot.message_handler if mode == "queue" else sync_handler
+    loop = asyncio.get_running_loop()
+    latencies: List[float] = []
+
+    async def handle(message, arrival):
+        await handler(bot.client, message)
+        latencies.append((loop.time() - arrival) * 1000)
+
+    messages = [make_message(i) for i in range(1, int(rate * seconds) + 1)]
+    if mode == "queue":
+        # What TelegramBot.start does besides connecting the client
+        bot.ingest_queue.start()
+        bot.scheduler.start()
+    start = loop.time()
+    tasks = []
+    for index, message in enumerate(messages):
+        # Messages arrive on a fixed schedule, whether or not the handlers keep up; latency
+        # is counted from the scheduled arrival, so a stalled event loop shows up in it
+        arrival = start + index / rate
+        await asyncio.sleep(max(arrival - loop.time(), 0))
+        tasks.append(asyncio.create_task(handle(message, arrival)))
+    await asyncio.gather(*tasks)
+    sent = loop.time() - start
+
+    drain_start = time.perf_counter()
+    if mode == "queue":
+        await bot.scheduler.stop()
+        await bot.ingest_queue.stop()
+    drain_ms = (time.perf_counter() - drain_start) * 1000
+    session.close()
+
+    report = [
+        f"mode={mode}: {len(messages)} messages in {sent:.2f}s ({len(messages) / sent:.0f} msg/s), {engine.url}",
+        f"  handler latency ms: p50={statistics.median(latencies):.2f} "
+        f"p99={percentile(latencies, 0.99):.2f} max={max(latencies):.2f}",
+        f"  storage done {drain_ms:.0f} ms after the last handler returned",
+    ]
+    if mode == "queue":
+        report.append(f"  ingest: {bot.ingest_queue.snapshot()}")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure message handler latency under a steady message rate"
+    )
+    parser.add_argument("--rate", type=int, default=1000, help="messages per second")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--mode", choices=("queue", "sync"), default="queue")
+    args = parser.parse_args()
+
+    # The handlers print every message; keep the report readable
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        report = asyncio.run(drive(args.mode, args.rate, args.seconds))
+    print("\n".join(report))
+
+
+if __name__ == "__main__":
+    main()
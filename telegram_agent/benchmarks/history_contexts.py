@@ -0,0 +1,140 @@
+# history_contexts.py
+#
+# Times loading a topic's history as MessageContext objects: the joined query used by
+# ChatContext.get_history_contexts against the previous path, which selected the messages
+# alone and looked up each sender and chat with session.get.
+#
+#   python -m telegram_agent.benchmarks.history_contexts [--messages 10000] [--users 1000]
+
+# Imports -------------------------------------------------------------------------------------------------------------
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List, Tuple
+
+# An in-memory database unless one is configured explicitly
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from sqlalchemy import event
+from sqlmodel import select
+
+# Local Imports -------------------------------------------------------------------------------------------------------
+from telegram_agent.src.models.models import Chat, Message, MessageContext, User
+from telegram_agent.src.telegram.chat.chat_base import TopicContext
+from telegram_agent.src.telegram.database import engine, get_session, init_db
+from telegram_agent.src.telegram.utils import bulk_sync_messages
+
+# Constants -----------------------------------------------------------------------------------------------------------
+CHAT_ID = -1001
+THREAD_ID = 1
+REPEATS = 3
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+def seed(session, messages: int, users: int):
+    chat = Chat(id=CHAT_ID, type="supergroup", title="benchmark")
+    start = datetime(2024, 1, 1)
+    contexts = [
+        MessageContext(
+            msg_id=i,
+            user_id=i % users + 1,
+            chat_id=CHAT_ID,
+            chat_type="supergroup",
+            chat_title="benchmark",
+            message_thread_id=THREAD_ID,
+            message_thread_name="topic",
+            date=start + timedelta(seconds=i),
+            text=f"message {i} " + "lorem ipsum " * 8,
+            user=User(id=i % users + 1, username=f"user{i % users + 1}"),
+            chat=chat,
+        )
+        for i in range(1, messages + 1)
+    ]
+    bulk_sync_messages(session, CHAT_ID, contexts)
+
+
+def legacy_history_contexts(topic: TopicContext) -> List[MessageContext]:
+    # The path replaced by get_history_contexts: one query for the messages, then
+    # session.get for each sender and chat (answered from the identity map after the
+    # first lookup of each)
+    session = topic.session
+    query = (
+        select(Message)
+        .where(*topic._history_conditions())
+        .order_by(Message.date, Message.id)
+    )
+    contexts = []
+    for message in session.exec(query):
+        user = session.get(User, message.user_id) if message.user_id else None
+        chat = session.get(Chat, message.chat_id) if message.chat_id else None
+        contexts.append(
+            MessageContext(
+                msg_id=message.msg_id,
+                user_id=message.user_id,
+                chat_id=message.chat_id,
+                chat_type=message.chat_type,
+                chat_title=message.chat_title,
+                message_thread_id=message.message_thread_id,
+                message_thread_name=message.message_thread_name,
+                date=message.date,
+                text=message.text,
+                user=user,
+                chat=chat,
+            )
+        )
+    return contexts
+
+
+def measure(
+    load: Callable[[TopicContext], List[MessageContext]]
+) -> Tuple[float, int, int]:
+    """
+    Runs `load` on a fresh session REPEATS times.
+
+    Returns:
+        Tuple[float, int, int]: Best time in ms, SQL statements and contexts of one run.
+    """
+    statements = []
+    count = lambda *args: statements.append(1)
+    event.listen(engine, "before_cursor_execute", count)
+    best = float("inf")
+    try:
+        for _ in range(REPEATS):
+            statements.clear()
+            with get_session() as session:
+                topic = TopicContext(
+                    chat_id=CHAT_ID, message_thread_id=THREAD_ID, session=session
+                )
+                start = time.perf_counter()
+                contexts = load(topic)
+                best = min(best, (time.perf_counter() - start) * 1000)
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+    return best, len(statements), len(contexts)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time loading a topic history as MessageContext objects"
+    )
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    args = parser.parse_args()
+
+    init_db()
+    with get_session() as session:
+        seed(session, args.messages, args.users)
+
+    print(f"{args.messages} messages from {args.users} users, {engine.url}")
+    for name, load in (
+        ("per-message lookups", legacy_history_contexts),
+        ("get_history_contexts", lambda topic: topic.get_history_contexts()),
+    ):
+        ms, statements, contexts = measure(load)
+        print(f"{name:>22}: {ms:8.1f} ms, {statements:5} SQL statements, {contexts} contexts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+# history_lookup.py
+#
+# Grows a Message table step by step (to millions of rows by default) and, at every size,
+# times the hot lookups with the schema's indexes and again with them dropped:
+#   - the newest page of a topic (ChatContext.get_history with a limit),
+#   - a keyset page from the middle of a topic (ChatContext.get_history_page),
+#   - the (chat_id, msg_id) lookup used by upserts.
+# Messages are spread over many chats and topics, so one topic is a small slice of the table.
+# The full-text index is not created, to keep seeding fast.
+#
+#   python -m telegram_agent.benchmarks.history_lookup [--sizes 10000,100000,1000000,3000000]
+
+# Imports -------------------------------------------------------------------------------------------------------------
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+# A fresh file database unless one is configured explicitly
+os.environ.setdefault(
+    "DATABASE_URL", f"sqlite:///{tempfile.mkdtemp(prefix='history_lookup_')}/bench.db"
+)
+
+from sqlalchemy import text
+from sqlmodel import SQLModel, select
+
+# Local Imports -------------------------------------------------------------------------------------------------------
+from telegram_agent.src.models.models import Chat, Message, User
+from telegram_agent.src.telegram.chat.chat_base import TopicContext
+from telegram_agent.src.telegram.database import engine, get_session
+
+# Constants -----------------------------------------------------------------------------------------------------------
+CHATS = 50
+TOPICS_PER_CHAT = 20
+USERS = 500
+PAGE_SIZE = 50
+INSERT_CHUNK = 50_000
+REPEATS = 20
+# The measured topic
+CHAT_ID = -1000
+THREAD_ID = 1
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+def seed_reference_rows():
+    with engine.begin() as conn:
+        conn.execute(
+            User.__table__.insert(),
+            [{"id": i, "username": f"user{i}"} for i in range(1, USERS + 1)],
+        )
+        conn.execute(
+            Chat.__table__.insert(),
+            [
+                {"id": CHAT_ID - i, "type": "supergroup", "title": f"chat {i}"}
+                for i in range(CHATS)
+            ],
+        )
+
+
+def grow(start: int, stop: int):
+    """
+    Appends messages start+1 .. stop, round-robin over chats and topics, one second apart.
+    """
+    epoch = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for chunk_start in range(start, stop, INSERT_CHUNK):
+            rows = []
+            for i in range(chunk_start + 1, min(chunk_start + INSERT_CHUNK, stop) + 1):
+                chat = i % CHATS
+                rows.append(
+                    {
+                        "msg_id": i,
+                        "user_id": i % USERS + 1,
+                        "chat_id": CHAT_ID - chat,
+                        "chat_type": "supergroup",
+                        "chat_title": f"chat {chat}",
+                        "message_thread_id": (i // CHATS) % TOPICS_PER_CHAT + 1,
+                        "date": epoch + timedelta(seconds=i),
+                        "text": f"message {i}",
+                        "deleted": False,
+                    }
+                )
+            conn.execute(Message.__table__.insert(), rows)
+
+
+def set_indexes(enabled: bool):
+    with engine.begin() as conn:
+        for index in Message.__table__.indexes:
+            if enabled:
+                index.create(conn, checkfirst=True)
+            else:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+
+def best_ms(query: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        query()
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return best
+
+
+def measure(size: int) -> Dict[str, float]:
+    with get_session() as session:
+        topic = TopicContext(chat_id=CHAT_ID, message_thread_id=THREAD_ID, session=session)
+        # A cursor about half way through the topic's history
+        middle = session.exec(
+            select(Message.date, Message.id)
+            .where(Message.id == size // 2 // (CHATS * TOPICS_PER_CHAT) * CHATS * TOPICS_PER_CHAT)
+        ).first()
+        assert middle is not None
+        timings = {
+            "newest page": best_ms(lambda: topic.get_history(limit=PAGE_SIZE)),
+            "keyset page": best_ms(
+                lambda: topic.get_history_page(after=tuple(middle), page_size=PAGE_SIZE)
+            ),
+            "upsert lookup": best_ms(
+                lambda: session.exec(
+                    select(Message.id).where(
+                        Message.chat_id == CHAT_ID, Message.msg_id == size // 2
+                    )
+                ).first()
+            ),
+        }
+        # Keep the identity map from growing across repeats
+        session.expunge_all()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Time history lookups as the Message table grows, with and without indexes"
+    )
+    parser.add_argument(
+        "--sizes",
+        default="10000,100000,1000000,3000000",
+        help="comma-separated table sizes to measure at",
+    )
+    parser.add_argument(
+        "--skip-unindexed",
+        action="store_true",
+        help="only measure with the indexes (dropping and rebuilding them is slow on big tables)",
+    )
+    args = parser.parse_args()
+    sizes: List[int] = sorted(int(size) for size in args.sizes.split(","))
+
+    SQLModel.metadata.create_all(engine)
+    seed_reference_rows()
+    print(f"{CHATS} chats x {TOPICS_PER_CHAT} topics, best of {REPEATS} runs, {engine.url}")
+    print(f"{'rows':>10} {'indexes':>8} {'newest page':>12} {'keyset page':>12} {'upsert lookup':>14}")
+
+    current = 0
+    for size in sizes:
+        start = time.perf_counter()
+        grow(current, size)
+        current = size
+        seeded_s = time.perf_counter() - start
+        runs = [True] if args.skip_unindexed else [True, False]
+        for indexed in runs:
+            set_indexes(indexed)
+            timings = measure(size)
+            print(
+                f"{size:>10} {'yes' if indexed else 'no':>8} "
+                + " ".join(
+                    f"{timings[name]:>{width}.3f}"
+                    for name, width in (
+                        ("newest page", 12),
+                        ("keyset page", 12),
+                        ("upsert lookup", 14),
+                    )
+                )
+                + (f"   (seeded in {seeded_s:.1f}s)" if indexed else "")
+            )
+        set_indexes(True)
+    print("times in ms")
+
+
+if __name__ == "__main__":
+    main()
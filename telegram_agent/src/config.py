@@ -6,3 +6,20 @@ load_dotenv()
 
 
 openai_api_key = os.getenv("OPENAI_API_KEY")
+# Any OpenAI-compatible endpoint, e.g. a local Ollama or vLLM server; None uses api.openai.com
+openai_base_url = os.getenv("OPENAI_BASE_URL")
+llm_model = os.getenv("LLM_MODEL", "gpt-4o-mini")
+llm_timeout = float(os.getenv("LLM_TIMEOUT_S", 120))
+# Stream /ask responses into an edited placeholder message instead of posting them when complete
+llm_stream = os.getenv("LLM_STREAM", "true").lower() in ("1", "true", "yes")
+# Tokens of goal, prompt and history sent with each question; older messages are left out
+llm_context_tokens = int(os.getenv("LLM_CONTEXT_TOKENS", 8000))
+# Topic summaries: messages per summarized span, summaries merged into the next level, and the
+# newest messages always left raw
+llm_summary_span = int(os.getenv("LLM_SUMMARY_SPAN", 50))
+llm_summary_fanout = int(os.getenv("LLM_SUMMARY_FANOUT", 4))
+llm_summary_keep_recent = int(os.getenv("LLM_SUMMARY_KEEP_RECENT", 20))
+# LLM response cache: an SQLite file; responses expire after the TTL (0 disables the cache)
+llm_cache_path = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+llm_cache_ttl_s = float(os.getenv("LLM_CACHE_TTL_S", 24 * 60 * 60))
+llm_cache_max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 10_000))
@@ -0,0 +1,247 @@
+# cache.py
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from telegram_agent.src.config import (
+    llm_cache_path,
+    llm_cache_ttl_s,
+    llm_cache_max_entries,
+)
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("LLMCache")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_response (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+)
+"""
+CACHE_INDEX = "CREATE INDEX IF NOT EXISTS ix_llm_response_accessed ON llm_response (accessed)"
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+def fingerprint(model: str, template: str, **inputs: Any) -> str:
+    """
+    Returns the cache key of an LLM call: a hash of the model, the prompt template and
+    the template inputs.
+
+    Args:
+        model (str): The model name.
+        template (str): The prompt template.
+        **inputs: The values filled into the template.
+
+    Returns:
+        str: A SHA-256 hex digest.
+    """
+    payload = json.dumps(
+        {"model": model, "template": template, "inputs": inputs},
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Classes -------------------------------------------------------------------------------------------------------------
+
+
+class CacheMetrics:
+    """
+    Counters describing the use of an LLMCache.
+
+    Attributes:
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that found nothing usable.
+        expired (int): Misses caused by an entry older than the TTL.
+        stores (int): Responses written.
+        evictions (int): Entries removed to stay within the size limit.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LLMCache:
+    """
+    A persistent, content-addressed cache of LLM responses.
+
+    Entries live in a SQLite file so they survive restarts, and several processes may
+    share it. An entry older than `ttl` seconds counts as a miss and is removed; beyond
+    `max_entries`, the least recently used entries are evicted in the same transaction as
+    the store. The file is opened on first use, and lookups and stores run in a worker
+    thread, so the event loop is never blocked on disk I/O.
+
+    Args:
+        path (str): The SQLite file, or ":memory:".
+        ttl (float): Seconds a response stays valid.
+        max_entries (int): Maximum number of cached responses.
+    """
+
+    def __init__(
+        self,
+        path: str = llm_cache_path,
+        ttl: float = llm_cache_ttl_s,
+        max_entries: int = llm_cache_max_entries,
+    ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.metrics = CacheMetrics()
+        self.conn: Optional[sqlite3.Connection] = None
+        # Worker threads share the connection, one statement sequence at a time
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._count()
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Returns the cached response for a key, if present and not expired.
+
+        Args:
+            key (str): The call fingerprint.
+
+        Returns:
+            Optional[str]: The response, or None on a miss.
+        """
+        return await asyncio.to_thread(self._get, key)
+
+    async def put(self, key: str, response: str):
+        """
+        Stores a response, evicting the least recently used entries beyond the size limit.
+
+        Args:
+            key (str): The call fingerprint.
+            response (str): The response text.
+        """
+        await asyncio.to_thread(self._put, key, response)
+
+    def clear(self):
+        """
+        Removes every cached response.
+        """
+        with self._lock:
+            self._connection().execute("DELETE FROM llm_response")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the cache metrics.
+
+        Returns:
+            Dict[str, Any]: Size, hit/miss counters and hit rate.
+        """
+        return {
+            "entries": len(self),
+            "hits": self.metrics.hits,
+            "misses": self.metrics.misses,
+            "hit_rate": self.metrics.hit_rate,
+            "expired": self.metrics.expired,
+            "stores": self.metrics.stores,
+            "evictions": self.metrics.evictions,
+        }
+
+    def _connection(self) -> sqlite3.Connection:
+        # Called with the lock held, from a worker thread
+        if self.conn is None:
+            conn = sqlite3.connect(
+                self.path, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(CACHE_SCHEMA)
+            conn.execute(CACHE_INDEX)
+            self.conn = conn
+            logger.info(
+                f"Opened LLM cache {self.path} ({self._count()} entries, ttl={self.ttl}s)"
+            )
+        return self.conn
+
+    def _count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM llm_response").fetchone()[0]
+
+    def _get(self, key: str) -> Optional[str]:
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT response, created FROM llm_response WHERE key = ?", (key,)
+            ).fetchone()
+            now = time.time()
+            if row is None:
+                self.metrics.misses += 1
+                return None
+            response, created = row
+            if now - created > self.ttl:
+                conn.execute("DELETE FROM llm_response WHERE key = ?", (key,))
+                self.metrics.misses += 1
+                self.metrics.expired += 1
+                return None
+            conn.execute("UPDATE llm_response SET accessed = ? WHERE key = ?", (now, key))
+            self.metrics.hits += 1
+            return response
+
+    def _put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            # Other processes sharing the file store too, so the size is only known inside
+            # the write transaction
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT INTO llm_response (key, response, created, accessed) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET "
+                    "response = excluded.response, created = excluded.created, accessed = excluded.accessed",
+                    (key, response, now, now),
+                )
+                evicted = conn.execute(
+                    "DELETE FROM llm_response WHERE key IN "
+                    "(SELECT key FROM llm_response ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                ).rowcount
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            self.metrics.stores += 1
+            self.metrics.evictions += evicted
+
+
+# Functions -----------------------------------------------------------------------------------------------------------
+_llm_cache: Optional[LLMCache] = None
+
+
+def get_llm_cache() -> Optional[LLMCache]:
+    """
+    Returns the process-wide LLM response cache, creating it on first use, or None when
+    caching is disabled (LLM_CACHE_TTL_S=0). Creating it does no I/O.
+
+    Returns:
+        Optional[LLMCache]: The shared cache.
+    """
+    global _llm_cache
+    if _llm_cache is None and llm_cache_ttl_s > 0:
+        _llm_cache = LLMCache()
+    return _llm_cache
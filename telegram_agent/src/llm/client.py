@@ -0,0 +1,13 @@
+# client.py
+
+from openai import AsyncOpenAI
+
+from telegram_agent.src.config import openai_api_key, openai_base_url, llm_timeout
+
+# LLM Client ----------------------------------------------------------------------------------------------------------
+# Shared by the async calls so concurrent requests reuse one connection pool
+async_client = AsyncOpenAI(
+    api_key=openai_api_key or "unset",  # fails on the first request instead of at import
+    base_url=openai_base_url,
+    timeout=llm_timeout,
+)
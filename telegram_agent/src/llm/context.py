@@ -0,0 +1,200 @@
+# context.py
+
+from contextlib import aclosing
+from functools import lru_cache
+from typing import Callable, List, Optional, Set
+
+from pydantic import BaseModel
+
+from telegram_agent.src.config import llm_model, llm_context_tokens
+from telegram_agent.src.models.models import Message, TopicSummary
+from telegram_agent.src.telegram.chat.chat_base import ChatContext
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("LLMContext")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+# Rough size of a token in English text, used when tiktoken is not installed
+CHARS_PER_TOKEN = 4
+# History messages fetched per query; most questions only need the first page or two
+CONTEXT_PAGE_SIZE = 100
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+@lru_cache(maxsize=None)
+def get_token_counter(model: str = llm_model) -> Callable[[str], int]:
+    """
+    Returns a function counting the tokens of a text for `model`: exact with tiktoken
+    (the `tokens` extra), estimated from the text length otherwise.
+
+    Args:
+        model (str): The model name, e.g. "gpt-4o-mini".
+
+    Returns:
+        Callable[[str], int]: The token counter.
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken is not installed; estimating token counts")
+        return lambda text: -(-len(text) // CHARS_PER_TOKEN)
+
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding("o200k_base")
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def format_history_line(message: Message) -> str:
+    """
+    Formats a stored message as a line of conversation history.
+
+    Args:
+        message (Message): The message, with its user loaded.
+
+    Returns:
+        str: "name: text".
+    """
+    user = message.user
+    name = (user.username or user.first_name) if user else None
+    return f"{name or 'Unknown'}: {message.text}"
+
+
+# Classes -------------------------------------------------------------------------------------------------------------
+
+
+class ContextWindow(BaseModel):
+    """
+    The pinned configuration and recent history selected for an LLM call.
+
+    Attributes:
+        goal (Optional[str]): The latest [Goal] message text of the chat.
+        prompt (Optional[str]): The latest [Prompt] message text of the topic.
+        summary (str): Summaries of the older history, oldest first.
+        history (str): The selected messages, oldest first, one per line.
+        tokens (int): Tokens used by goal, prompt, summary and history together.
+        budget (int): The token budget the window was built for.
+        summarized (int): History messages covered by the included summaries.
+        included (int): History messages included.
+        omitted (int): Older history messages left out to fit the budget.
+    """
+
+    goal: Optional[str] = None
+    prompt: Optional[str] = None
+    summary: str = ""
+    history: str = ""
+    tokens: int = 0
+    budget: int = 0
+    summarized: int = 0
+    included: int = 0
+    omitted: int = 0
+
+    @property
+    def truncated(self) -> bool:
+        return self.omitted > 0
+
+    @property
+    def text(self) -> str:
+        """
+        The summary and recent messages, as sent to the LLM as the conversation so far.
+        """
+        if not self.summary:
+            return self.history
+        return f"Summary of the earlier conversation:\n{self.summary}\n\nRecent messages:\n{self.history}"
+
+
+async def build_context_window(
+    chat_context: ChatContext,
+    budget: int = llm_context_tokens,
+    max_messages: Optional[int] = None,
+    model: str = llm_model,
+    summaries: Optional[List[TopicSummary]] = None,
+) -> ContextWindow:
+    """
+    Selects the pinned [Goal] and [Prompt] messages, the summaries of the older history
+    and as many of the most recent messages as fit in a token budget.
+
+    The pinned messages are counted first, then the summaries, newest first. History is
+    then streamed newest first through the async session, a page at a time, until it
+    reaches the summarized messages. Messages past the budget are counted as omitted
+    rather than formatted, and the included ones are joined oldest first in one pass. The
+    pinned messages and bot commands are not part of the history.
+
+    Args:
+        chat_context (ChatContext): The chat or topic to build the context for.
+        budget (int): Maximum tokens for goal, prompt, summaries and history together.
+        max_messages (Optional[int]): Also stop after this many history messages.
+        model (str): The model whose tokenizer is used for counting.
+        summaries (Optional[List[TopicSummary]]): The topic's current summaries, oldest
+            first (see `get_current_summaries`).
+
+    Returns:
+        ContextWindow: The selected context and how much of the history was left out.
+    """
+    count_tokens = get_token_counter(model)
+    window = ContextWindow(budget=budget)
+    pinned_ids: Set[int] = set()
+
+    goal = await chat_context.get_config_async("Goal", all=True)
+    prompt = await chat_context.get_config_async("Prompt")
+    for entry, field in ((goal, "goal"), (prompt, "prompt")):
+        if entry:
+            setattr(window, field, entry.text)
+            window.tokens += count_tokens(entry.text)
+            pinned_ids.add(entry.msg_id)
+
+    # Summaries that do not fit are dropped oldest first, and their messages are omitted
+    included_summaries: List[TopicSummary] = []
+    for index, summary in reversed(list(enumerate(summaries or []))):
+        tokens = count_tokens(summary.text) + 2
+        if window.tokens + tokens > budget:
+            window.omitted = sum(s.message_count for s in summaries[: index + 1])
+            break
+        included_summaries.insert(0, summary)
+        window.tokens += tokens
+    window.summary = "\n\n".join(summary.text for summary in included_summaries)
+    window.summarized = sum(summary.message_count for summary in included_summaries)
+    cursor = max((summary.last_msg_id for summary in summaries or []), default=0)
+
+    lines: List[str] = []
+    full = False
+    history = chat_context.iter_history(page_size=CONTEXT_PAGE_SIZE, newest_first=True)
+    async with aclosing(history):
+        async for message in history:
+            if message.msg_id <= cursor:
+                break
+            # Bot commands (e.g. the /ask being answered) are instructions, not discussion;
+            # leaving them out also keeps repeated questions on an unchanged topic cacheable
+            if (
+                message.msg_id in pinned_ids
+                or not message.text
+                or message.text.startswith("/")
+            ):
+                continue
+            if not full and max_messages is not None and len(lines) >= max_messages:
+                full = True
+            if not full:
+                line = format_history_line(message)
+                # +1 for the newline joining it to the next line
+                tokens = count_tokens(line) + 1
+                if window.tokens + tokens > budget:
+                    full = True
+                else:
+                    lines.append(line)
+                    window.tokens += tokens
+                    continue
+            window.omitted += 1
+
+    lines.reverse()
+    window.history = "\n".join(lines)
+    window.included = len(lines)
+    if window.truncated:
+        logger.warning(
+            f"Context for chat {chat_context.chat_id} truncated: {window.included} messages "
+            f"({window.tokens}/{budget} tokens) included, {window.omitted} older ones omitted"
+        )
+    return window
@@ -1,6 +1,6 @@
 # Imports -------------------------------------------------------------------------------------------------------------
 from pydantic import BaseModel, PrivateAttr
-from typing import Any, Optional, List, Dict, Union
+from typing import Any, AsyncIterator, Optional, List, Dict, Union
 from openai import OpenAI
 from mirascope.core import openai, prompt_template
 from pyrogram import Client
@@ -9,10 +9,14 @@ from pyrogram.types import Message as PyroMessage
 from sqlmodel import Session
 import pprint
 
-from time import sleep
 
 # Library Imports -----------------------------------------------------------------------------------------------------
-from telegram_agent.src.config import openai_api_key
+from telegram_agent.src.config import (
+    openai_api_key,
+    llm_model,
+    llm_stream,
+    llm_context_tokens,
+)
 from telegram_agent.src.telegram.utils import (
     extract_context,
     store_message,
@@ -22,6 +26,13 @@ from telegram_agent.log.logger import get_logger
 from telegram_agent.src.models.models import User, Chat, Message, MessageContext
 from telegram_agent.src.telegram.chat.chat_base import ChatContext, TopicContext
 from telegram_agent.src.telegram.database import get_session, init_db
+from telegram_agent.src.telegram.api import call_api
+from telegram_agent.src.telegram.rate_limit import throttle
+from telegram_agent.src.telegram.streaming import stream_message
+from telegram_agent.src.llm.cache import fingerprint, get_llm_cache
+from telegram_agent.src.llm.client import async_client
+from telegram_agent.src.llm.context import ContextWindow, build_context_window
+from telegram_agent.src.llm.summary import get_current_summaries
 
 # LLM Client ----------------------------------------------------------------------------------------------------------
 
@@ -38,13 +49,8 @@ logger = get_logger("TelegramLLMBase")
 
 # Base system prompt:
 
-
-# Functions -----------------------------------------------------------------------------------------------------------
-
-
-# Topic Chat Call:
-@openai.call("gpt-4o-mini")
-@prompt_template("""{combined_prompt}
+# Prompt templates, shared by the sync and async calls
+CHAT_RESPONSE_PROMPT = """{combined_prompt}
 
 Here's what's been discussed thus far: 
 {context}
@@ -59,13 +65,9 @@ Please use the context of the conversation thus far to help meet the system prom
 **DO NOT** concern yourself or the user about normal aspects of designing a project (performance, documentation, maintenance, testing, etc.)
 **ONLY** focus on high level system/structural consequences, assuming the user implements what they talk about in their message. 
 **RESPOND WITH 3-5 BULLET POINTS ONLY**
-""")
-def chat_response(combined_prompt: str, context: str, message: str) -> str: ...
-
+"""
 
-# Rework existing response:
-@openai.call("gpt-4o-mini")
-@prompt_template("""{combined_prompt}
+REWORK_RESPONSE_PROMPT = """{combined_prompt}
 
 Here's what's been discussed thus far: 
 {context}
@@ -76,12 +78,126 @@ Please update the previous response, in accordance to the user's latest message.
 Previous Response: {previous_response}
 
 User Message: {user_message}
-""")
+"""
+
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+# Topic Chat Call:
+@openai.call(llm_model)
+@prompt_template(CHAT_RESPONSE_PROMPT)
+def chat_response(combined_prompt: str, context: str, message: str) -> str: ...
+
+
+@openai.call(llm_model, client=async_client)
+@prompt_template(CHAT_RESPONSE_PROMPT)
+async def chat_response_async(combined_prompt: str, context: str, message: str): ...
+
+
+@openai.call(llm_model, stream=True, client=async_client)
+@prompt_template(CHAT_RESPONSE_PROMPT)
+async def chat_response_stream(combined_prompt: str, context: str, message: str): ...
+
+
+async def stream_text(stream) -> AsyncIterator[str]:
+    """
+    Yields the text of a streamed mirascope call as it arrives.
+
+    Args:
+        stream: The awaited result of a `stream=True` call, e.g. `chat_response_stream`.
+
+    Yields:
+        str: The content of each chunk.
+    """
+    async for chunk, _ in stream:
+        if chunk.content:
+            yield chunk.content
+
+
+async def cached_chat_response(combined_prompt: str, context: str, message: str) -> str:
+    """
+    Returns the `chat_response_async` text, from the LLM cache when the same model,
+    template and inputs were answered before.
+
+    Args:
+        combined_prompt (str): The goal and topic prompt.
+        context (str): The conversation so far.
+        message (str): The user's message.
+
+    Returns:
+        str: The response text.
+    """
+    cache = get_llm_cache()
+    key = fingerprint(
+        llm_model,
+        CHAT_RESPONSE_PROMPT,
+        combined_prompt=combined_prompt,
+        context=context,
+        message=message,
+    )
+    if cache is not None:
+        cached = await cache.get(key)
+        if cached is not None:
+            return cached
+    response = await chat_response_async(combined_prompt, context, message)
+    if cache is not None:
+        await cache.put(key, response.content)
+    return response.content
+
+
+async def cached_chat_response_stream(
+    combined_prompt: str, context: str, message: str
+) -> AsyncIterator[str]:
+    """
+    Streams the `chat_response_stream` text, or yields the cached response in one piece
+    when the same call was answered before. Only completed streams are cached.
+
+    Args:
+        combined_prompt (str): The goal and topic prompt.
+        context (str): The conversation so far.
+        message (str): The user's message.
+
+    Yields:
+        str: The response, piece by piece.
+    """
+    cache = get_llm_cache()
+    key = fingerprint(
+        llm_model,
+        CHAT_RESPONSE_PROMPT,
+        combined_prompt=combined_prompt,
+        context=context,
+        message=message,
+    )
+    if cache is not None:
+        cached = await cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+    stream = await chat_response_stream(combined_prompt, context, message)
+    parts = []
+    async for text in stream_text(stream):
+        parts.append(text)
+        yield text
+    if cache is not None:
+        await cache.put(key, "".join(parts))
+
+
+# Rework existing response:
+@openai.call(llm_model)
+@prompt_template(REWORK_RESPONSE_PROMPT)
 def rework_response(
     combined_prompt: str, context: str, previous_response: str, user_message: str
 ): ...
 
 
+@openai.call(llm_model, client=async_client)
+@prompt_template(REWORK_RESPONSE_PROMPT)
+async def rework_response_async(
+    combined_prompt: str, context: str, previous_response: str, user_message: str
+): ...
+
+
 # Classes -------------------------------------------------------------------------------------------------------------
 
 
@@ -90,31 +206,33 @@ class LLMconfig(BaseModel):
     goal: Optional[str] = None
     prompt: Optional[str] = None
     history: Optional[str] = None
-
-    def init_llm(self, topic_context: TopicContext):
-        prompt_text = ""
-        goal = topic_context.get_configuration_messages("Goal", all=True)
-
-        # print(f"\nGoal:\n")
-        for g in goal:
-            # print(f"\nGoal: {g.text}")
-            self.goal = g.text
-            prompt_text += g.text
-        prompt = topic_context.get_configuration_messages("Prompt")
-        for p in prompt:
-            # print(f"\nPrompt: {p.text}")
-            self.prompt = p.text
-            prompt_text += p.text
-        history_text = ""
-        history_list = topic_context.get_history()
-        session = get_session()
-
-        for msg in history_list:
-            msg_context = build_message_context_from_db(session, msg)
-            history_text += f"\n{msg_context.user.username or msg_context.user.first_name}: {msg_context.text}\n"
-        self.history = history_text
-
-        return prompt_text
+    # Most recent messages included in the history; None only limits it by tokens
+    history_limit: Optional[int] = None
+    # Tokens for goal, prompt and history together
+    token_budget: int = llm_context_tokens
+    # Send the stored topic summaries instead of the messages they cover
+    use_summaries: bool = True
+    window: Optional[ContextWindow] = None
+
+    async def init_llm(self, topic_context: TopicContext):
+        # Config, summaries and history are read through the async session
+        summaries = None
+        if self.use_summaries:
+            summaries = await get_current_summaries(
+                topic_context.chat_id,
+                getattr(topic_context, "message_thread_id", None),
+            )
+        window = await build_context_window(
+            topic_context,
+            budget=self.token_budget,
+            max_messages=self.history_limit,
+            summaries=summaries,
+        )
+        self.window = window
+        self.goal = window.goal
+        self.prompt = window.prompt
+        self.history = window.text
+        return (window.goal or "") + (window.prompt or "")
 
     def ask(self, message: PyroMessage):
         if not self.goal:
@@ -129,6 +247,42 @@ class LLMconfig(BaseModel):
         # await message.reply_text(response)
         return response
 
+    async def ask_async(self, message: PyroMessage) -> Optional[str]:
+        """
+        Like `ask`, but awaits the completion so the event loop keeps handling other
+        messages meanwhile.
+
+        Args:
+            message (PyroMessage): The user's message.
+
+        Returns:
+            Optional[str]: The response text, or None without a project goal.
+        """
+        if not self.goal:
+            logger.error("No project goal configured; not asking the LLM")
+            return None
+        prompt_text = self.goal + "\n\n" + (self.prompt or "") + "\n\n"
+        return await cached_chat_response(prompt_text, self.history, message.text)
+
+    async def ask_stream(self, message: PyroMessage) -> AsyncIterator[str]:
+        """
+        Like `ask_async`, but yields the response text as the LLM generates it.
+
+        Args:
+            message (PyroMessage): The user's message.
+
+        Yields:
+            str: The response, piece by piece; nothing without a project goal.
+        """
+        if not self.goal:
+            logger.error("No project goal configured; not asking the LLM")
+            return
+        prompt_text = self.goal + "\n\n" + (self.prompt or "") + "\n\n"
+        async for text in cached_chat_response_stream(
+            prompt_text, self.history, message.text
+        ):
+            yield text
+
     def update(self, message: PyroMessage):
         pass
 
@@ -153,26 +307,20 @@ class LLMbot(BaseModel):
 
     def _build_prompts(self):
         """
-        Builds the system and user prompts by searching for configuration messages.
+        Builds the system and user prompts from the latest configuration messages.
         """
-        # Search for system prompt messages
-        system_prompt_messages = self.context.get_configuration_messages(
-            "SYSTEM_PROMPT"
-        )
-        if system_prompt_messages:
-            # Assuming the last configuration message is the most recent
-            self._system_prompt = (
-                system_prompt_messages[-1].text.split("]", 1)[1].strip()
-            )
+        # Latest configuration values, kept current by the storage path
+        system_prompt = self.context.get_config("SYSTEM_PROMPT")
+        if system_prompt:
+            self._system_prompt = system_prompt.value
         else:
             self._system_prompt = (
                 "You are a helpful assistant."  # default system prompt
             )
 
-        # Search for user prompt messages
-        user_prompt_messages = self.context.get_configuration_messages("USER_PROMPT")
-        if user_prompt_messages:
-            self._user_prompt = user_prompt_messages[-1].text.split("]", 1)[1].strip()
+        user_prompt = self.context.get_config("USER_PROMPT")
+        if user_prompt:
+            self._user_prompt = user_prompt.value
         else:
             self._user_prompt = ""  # default empty user prompt
 
@@ -241,11 +389,9 @@ class TelegramLLMBase(BaseModel):
     async def get_combined_topic_prompt(self):
         goal_message = await self.get_message_match("[Goal]")
         # print(f"\nGoal: \n\n{goal_message}\n\n")
-        sleep(0.25)
         goal_text = goal_message.text
         topic_prompt_message = await self.get_message_match("[Prompt]", self.topic_id)
         # print(f"\nPrompt: \n\n{topic_prompt_message}\n\n")
-        sleep(0.25)
         topic_prompt_text = topic_prompt_message.text
         combined_prompt = topic_prompt_text.replace("{goal}", "\n\n" + goal_text)
         print(f"\n\nCombined Prompt: \n\n{combined_prompt}\n\n")
@@ -258,14 +404,28 @@ class TelegramLLMBase(BaseModel):
         if self.user_prompt:
             prompt_list.append(self.user_prompt)
 
-    async def generate_chat_response(self, message: PyroMessage):
+    async def generate_chat_response(
+        self, message: PyroMessage, stream: bool = llm_stream
+    ):
         combined_prompt = await self.get_combined_topic_prompt()
         print(f"\n\nCombined_prompt: \n\n{combined_prompt}\n\n")
         context = await self.build_topic_summary()
         print(f"\n\nContext:\n\n{context}\n\n")
         parsed_message = await self.parse_message(message)
         print(f"\n\nMessage:\n\n{parsed_message.text}\n\n")
-        response = chat_response(combined_prompt, context, parsed_message.text)
+        if stream:
+            await stream_message(
+                self.bot_tg_client,
+                self.chat_id,
+                cached_chat_response_stream(
+                    combined_prompt, context, parsed_message.text
+                ),
+                message_thread_id=self.topic_id,
+            )
+            return
+        response = await cached_chat_response(
+            combined_prompt, context, parsed_message.text
+        )
         print(f"\n\nResponse...\n\n{response}\n")
         await self.post_message(response)
 
@@ -279,7 +439,6 @@ class TelegramLLMBase(BaseModel):
         self.topic_messages = topic_messages
 
     async def parse_message(self, message: PyroMessage) -> MessageContext:
-        sleep(0.25)
         parsed_message = await extract_context(message)
         return parsed_message
 
@@ -287,7 +446,7 @@ class TelegramLLMBase(BaseModel):
         """
         Get all messages in a superthread.
         """
-        sleep(0.5)
+        await throttle(self.user_tg_client, self.chat_id)
         all_messages = self.user_tg_client.get_chat_history(self.chat_id)
         message_list = []
         async for msg in all_messages:
@@ -301,7 +460,8 @@ class TelegramLLMBase(BaseModel):
         Retrieve messages from the specified chat and topic.
         """
         message_list = []
-        sleep(0.5)
+        if self.chat_id:
+            await throttle(self.user_tg_client, self.chat_id)
         if self.chat_id and self.topic_id:
             all_messages = self.user_tg_client.get_discussion_replies(
                 self.chat_id, self.topic_id
@@ -330,7 +490,6 @@ class TelegramLLMBase(BaseModel):
                 if match_str in msg.text:
                     return msg
         else:
-            sleep(0.5)
             messages = await self.get_all_messages()
             for msg in messages:
                 if match_str in msg.text:
@@ -361,8 +520,12 @@ class TelegramLLMBase(BaseModel):
 
     async def post_message(self, message_str: str):
         """Post a message to the chat and/or topic."""
-        await self.bot_tg_client.send_message(
-            chat_id=self.chat_id, message_thread_id=self.topic_id, text=message_str
+        await call_api(
+            self.bot_tg_client,
+            self.bot_tg_client.send_message,
+            chat_id=self.chat_id,
+            message_thread_id=self.topic_id,
+            text=message_str,
         )
 
 
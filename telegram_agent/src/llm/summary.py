@@ -0,0 +1,246 @@
+# summary.py
+
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from mirascope.core import openai, prompt_template
+from sqlalchemy.orm import joinedload
+from sqlmodel import func, select
+
+from telegram_agent.src.config import (
+    llm_model,
+    llm_summary_span,
+    llm_summary_fanout,
+    llm_summary_keep_recent,
+)
+from telegram_agent.src.llm.client import async_client
+from telegram_agent.src.llm.context import format_history_line
+from telegram_agent.src.models.models import Message, TopicSummary
+from telegram_agent.src.telegram.database import get_async_session
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("TopicSummary")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+# Spans summarized per update; a long backlog is caught up over several updates
+MAX_SPANS_PER_UPDATE = 20
+
+SUMMARIZE_MESSAGES_PROMPT = """SYSTEM:
+You summarize part of a project planning conversation so it can be continued without the transcript.
+Keep every decision, requirement, open question and idea, and who raised it. Drop greetings and chatter.
+Be concise and use bullet points.
+
+USER:
+Summarize this part of the conversation:
+
+{transcript}
+"""
+
+MERGE_SUMMARIES_PROMPT = """SYSTEM:
+You merge consecutive summaries of one project planning conversation into a single summary.
+Keep every decision, requirement and open question; when a later summary changes an earlier decision, keep only the outcome.
+Be concise and use bullet points.
+
+USER:
+Merge these summaries, oldest first:
+
+{summaries}
+"""
+
+# Functions -----------------------------------------------------------------------------------------------------------
+_locks: Dict[Tuple[int, int], asyncio.Lock] = defaultdict(asyncio.Lock)
+_tasks: Set[asyncio.Task] = set()
+
+
+@openai.call(llm_model, client=async_client)
+@prompt_template(SUMMARIZE_MESSAGES_PROMPT)
+async def summarize_messages(transcript: str): ...
+
+
+@openai.call(llm_model, client=async_client)
+@prompt_template(MERGE_SUMMARIES_PROMPT)
+async def merge_summaries(summaries: str): ...
+
+
+def _topic_conditions(model, chat_id: int, message_thread_id: Optional[int]) -> list:
+    return [model.chat_id == chat_id, model.message_thread_id == (message_thread_id or 0)]
+
+
+async def get_current_summaries(
+    chat_id: int, message_thread_id: Optional[int] = None
+) -> List[TopicSummary]:
+    """
+    Returns the summaries currently covering a topic's older history, oldest first.
+
+    Args:
+        chat_id (int): The ID of the chat.
+        message_thread_id (Optional[int]): The forum topic, or None for the whole chat.
+
+    Returns:
+        List[TopicSummary]: The summaries not merged into a higher level, in order.
+    """
+    query = (
+        select(TopicSummary)
+        .where(
+            *_topic_conditions(TopicSummary, chat_id, message_thread_id),
+            TopicSummary.parent_id == None,
+        )
+        .order_by(TopicSummary.first_msg_id)
+    )
+    async with get_async_session() as session:
+        return list((await session.exec(query)).all())
+
+
+async def update_topic_summary(
+    chat_id: int,
+    message_thread_id: Optional[int] = None,
+    span: int = llm_summary_span,
+    fanout: int = llm_summary_fanout,
+    keep_recent: int = llm_summary_keep_recent,
+) -> int:
+    """
+    Extends a topic's summaries with the messages stored since the last update.
+
+    Unsummarized messages, except the `keep_recent` newest, are summarized in spans of
+    `span` messages; each complete run of `fanout` summaries on a level is then merged into
+    one summary on the next level. Every summary is committed as soon as it is written, so
+    an LLM failure only loses the span being worked on. Updates of the same topic run one
+    at a time.
+
+    Args:
+        chat_id (int): The ID of the chat.
+        message_thread_id (Optional[int]): The forum topic, or None for the whole chat.
+        span (int): Messages per level 0 summary.
+        fanout (int): Summaries merged into one on the next level.
+        keep_recent (int): Newest messages left out of the summaries.
+
+    Returns:
+        int: The number of summaries written.
+    """
+    key = (chat_id, message_thread_id or 0)
+    async with _locks[key]:
+        async with get_async_session() as session:
+            written = await _summarize_new_spans(
+                session, chat_id, message_thread_id, span, keep_recent
+            )
+            written += await _roll_up(session, chat_id, message_thread_id, fanout)
+    if written:
+        logger.info(f"Wrote {written} summaries for chat {chat_id}, topic {key[1]}")
+    return written
+
+
+def schedule_topic_summary(chat_id: int, message_thread_id: Optional[int] = None):
+    """
+    Starts `update_topic_summary` in the background unless the topic is already being
+    summarized.
+
+    Args:
+        chat_id (int): The ID of the chat.
+        message_thread_id (Optional[int]): The forum topic, or None for the whole chat.
+    """
+    if _locks[(chat_id, message_thread_id or 0)].locked():
+        return
+    task = asyncio.create_task(update_topic_summary(chat_id, message_thread_id))
+    _tasks.add(task)
+    task.add_done_callback(_finish_task)
+
+
+async def _summarize_new_spans(
+    session, chat_id: int, message_thread_id: Optional[int], span: int, keep_recent: int
+) -> int:
+    cursor_query = select(func.max(TopicSummary.last_msg_id)).where(
+        *_topic_conditions(TopicSummary, chat_id, message_thread_id),
+        TopicSummary.level == 0,
+    )
+    cursor = (await session.exec(cursor_query)).one() or 0
+
+    conditions = [
+        Message.chat_id == chat_id,
+        Message.deleted == False,
+        Message.text != None,
+        Message.msg_id > cursor,
+    ]
+    if message_thread_id is not None:
+        conditions.append(Message.message_thread_id == message_thread_id)
+    query = (
+        select(Message)
+        .options(joinedload(Message.user))
+        .where(*conditions)
+        .order_by(Message.msg_id)
+        .limit(MAX_SPANS_PER_UPDATE * span + keep_recent)
+    )
+    messages = list((await session.exec(query)).all())
+    if keep_recent:
+        messages = messages[:-keep_recent]
+
+    written = 0
+    for start in range(0, len(messages) - span + 1, span):
+        batch = messages[start : start + span]
+        transcript = "\n".join(format_history_line(message) for message in batch)
+        response = await summarize_messages(transcript)
+        session.add(
+            TopicSummary(
+                chat_id=chat_id,
+                message_thread_id=message_thread_id or 0,
+                level=0,
+                first_msg_id=batch[0].msg_id,
+                last_msg_id=batch[-1].msg_id,
+                message_count=len(batch),
+                text=response.content,
+            )
+        )
+        await session.commit()
+        written += 1
+    return written
+
+
+async def _roll_up(
+    session, chat_id: int, message_thread_id: Optional[int], fanout: int
+) -> int:
+    written = 0
+    level = 0
+    while True:
+        query = (
+            select(TopicSummary)
+            .where(
+                *_topic_conditions(TopicSummary, chat_id, message_thread_id),
+                TopicSummary.level == level,
+                TopicSummary.parent_id == None,
+            )
+            .order_by(TopicSummary.first_msg_id)
+        )
+        current = list((await session.exec(query)).all())
+        if not current:
+            return written
+        for start in range(0, len(current) - fanout + 1, fanout):
+            group = current[start : start + fanout]
+            response = await merge_summaries(
+                "\n\n".join(summary.text for summary in group)
+            )
+            parent = TopicSummary(
+                chat_id=chat_id,
+                message_thread_id=message_thread_id or 0,
+                level=level + 1,
+                first_msg_id=group[0].first_msg_id,
+                last_msg_id=group[-1].last_msg_id,
+                message_count=sum(summary.message_count for summary in group),
+                text=response.content,
+            )
+            session.add(parent)
+            await session.flush()
+            for summary in group:
+                summary.parent_id = parent.id
+                session.add(summary)
+            await session.commit()
+            written += 1
+        level += 1
+
+
+def _finish_task(task: asyncio.Task):
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception():
+        logger.error(f"Background topic summary failed: {task.exception()}")
+
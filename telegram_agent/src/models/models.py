@@ -1,10 +1,11 @@
 # models.py
 
 from datetime import datetime
-from typing import Optional
+from typing import Any, Optional
 
-from pydantic import BaseModel
-from sqlmodel import Field, SQLModel
+from pydantic import BaseModel, PrivateAttr
+from sqlalchemy import BigInteger, Index
+from sqlmodel import Field, Relationship, SQLModel
 
 
 class User(SQLModel, table=True):
@@ -18,7 +19,7 @@ class User(SQLModel, table=True):
         last_name (Optional[str]): The last name of the user.
     """
 
-    id: int = Field(primary_key=True)
+    id: int = Field(primary_key=True, sa_type=BigInteger)
     username: Optional[str]
     first_name: Optional[str]
     last_name: Optional[str]
@@ -37,7 +38,7 @@ class Chat(SQLModel, table=True):
         last_name (Optional[str]): The last name (if private chat).
     """
 
-    id: int = Field(primary_key=True)
+    id: int = Field(primary_key=True, sa_type=BigInteger)
     type: str
     title: Optional[str]
     username: Optional[str]
@@ -59,12 +60,33 @@ class Message(SQLModel, table=True):
         message_thread_id (Optional[int]): The forum topic ID if applicable.
         date (datetime): The date the message was sent.
         text (Optional[str]): The text content of the message.
+        deleted (bool): Whether the message was deleted from the chat.
+        config_label (Optional[str]): The bracketed label of a configuration message, e.g. "Goal".
+        user (Optional[User]): The sender, loaded through the user_id foreign key.
+        chat (Optional[Chat]): The chat, loaded through the chat_id foreign key.
+
+    Indexes:
+        uq_message_chat_id_msg_id: Unique (chat_id, msg_id), the natural key used for upserts.
+        ix_message_history: (chat_id, message_thread_id, deleted, date), covering history lookups.
+        ix_message_config_label: (chat_id, config_label, message_thread_id), for configuration lookups.
     """
 
+    __table_args__ = (
+        Index("uq_message_chat_id_msg_id", "chat_id", "msg_id", unique=True),
+        Index(
+            "ix_message_history", "chat_id", "message_thread_id", "deleted", "date"
+        ),
+        Index(
+            "ix_message_config_label", "chat_id", "config_label", "message_thread_id"
+        ),
+    )
+
     id: Optional[int] = Field(default=None, primary_key=True)
     msg_id: int  # Telegram message ID
-    user_id: Optional[int] = Field(foreign_key="user.id")
-    chat_id: Optional[int] = Field(default=None, foreign_key="chat.id")
+    user_id: Optional[int] = Field(foreign_key="user.id", sa_type=BigInteger)
+    chat_id: Optional[int] = Field(
+        default=None, foreign_key="chat.id", sa_type=BigInteger
+    )
     chat_type: Optional[str] = Field(default=None)
     chat_title: Optional[str] = Field(default=None)
     message_thread_id: Optional[int] = Field(default=None)
@@ -72,6 +94,10 @@ class Message(SQLModel, table=True):
     date: datetime
     text: Optional[str]
     deleted: bool = Field(default=False)
+    config_label: Optional[str] = Field(default=None)
+
+    user: Optional[User] = Relationship()
+    chat: Optional[Chat] = Relationship()
 
 
 class MessageContext(BaseModel):
@@ -104,3 +130,95 @@ class MessageContext(BaseModel):
     user: Optional[User]
     chat: Optional[Chat]
     deleted: bool = False
+    # Filter results shared by every pipeline handling this message (see FilterEvaluation.of)
+    _filter_evaluation: Any = PrivateAttr(default=None)
+
+
+class SyncCursor(SQLModel, table=True):
+    """
+    Tracks how far the history of a chat or forum topic has been synchronized.
+
+    Attributes:
+        chat_id (int): The ID of the chat.
+        message_thread_id (int): The forum topic ID, or 0 for the whole chat.
+        last_msg_id (int): The highest message ID synchronized so far.
+        last_synced (Optional[datetime]): When the last incremental sync completed.
+        last_reconciled (Optional[datetime]): When the last full (deep) reconcile completed.
+    """
+
+    chat_id: int = Field(primary_key=True, sa_type=BigInteger)
+    message_thread_id: int = Field(default=0, primary_key=True)
+    last_msg_id: int = Field(default=0)
+    last_synced: Optional[datetime] = Field(default=None)
+    last_reconciled: Optional[datetime] = Field(default=None)
+
+
+class ChatConfig(SQLModel, table=True):
+    """
+    The latest configuration message ("[Goal] ...", "[Prompt] ...", "[SYSTEM_PROMPT] ...")
+    for each label in a chat or forum topic, maintained as messages are stored, edited and
+    deleted.
+
+    Attributes:
+        chat_id (int): The ID of the chat.
+        message_thread_id (int): The forum topic ID, or 0 for messages outside a topic.
+        label (str): The bracketed label, e.g. "Goal".
+        msg_id (int): The Telegram message ID of the configuration message.
+        date (datetime): The date the configuration message was sent.
+        text (Optional[str]): The full message text, including the label.
+        value (Optional[str]): The message text after the label.
+    """
+
+    __table_args__ = (
+        Index("ix_chatconfig_label", "chat_id", "label", "date"),
+        Index("ix_chatconfig_message", "chat_id", "msg_id"),
+    )
+
+    chat_id: int = Field(primary_key=True, sa_type=BigInteger)
+    message_thread_id: int = Field(default=0, primary_key=True)
+    label: str = Field(primary_key=True)
+    msg_id: int
+    date: datetime
+    text: Optional[str] = Field(default=None)
+    value: Optional[str] = Field(default=None)
+
+
+class TopicSummary(SQLModel, table=True):
+    """
+    An LLM summary of a span of a chat or forum topic's history. Level 0 summaries cover
+    raw messages; a level n+1 summary merges consecutive level n summaries, which then
+    point to it through `parent_id`. Summaries without a parent are the current ones.
+
+    Attributes:
+        id (Optional[int]): The primary key.
+        chat_id (int): The ID of the chat.
+        message_thread_id (int): The forum topic ID, or 0 for messages outside a topic.
+        level (int): 0 for a summary of messages, n+1 for a summary of level n summaries.
+        first_msg_id (int): The first message covered.
+        last_msg_id (int): The last message covered.
+        message_count (int): The number of messages covered.
+        text (str): The summary.
+        created_at (datetime): When the summary was written.
+        parent_id (Optional[int]): The higher-level summary this one was merged into.
+    """
+
+    __table_args__ = (
+        Index(
+            "ix_topicsummary_topic",
+            "chat_id",
+            "message_thread_id",
+            "level",
+            "last_msg_id",
+        ),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    chat_id: int = Field(sa_type=BigInteger)
+    message_thread_id: int = Field(default=0)
+    level: int = Field(default=0)
+    first_msg_id: int
+    last_msg_id: int
+    message_count: int
+    text: str
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    parent_id: Optional[int] = Field(default=None, foreign_key="topicsummary.id")
@@ -6,13 +6,13 @@ from pyrogram import Client
 from pyrogram.errors import FloodWait, PeerFlood
 from pyrogram.types import ChatPermissions, ChatPrivileges
 from pyrogram.raw import functions, types
-from time import sleep
 from pyrogram import raw
 from pyrogram import errors
 
 
 # Local imports -------------------------------------------------------------------------------------------------------
 from telegram_agent.src.telegram.config import TELEGRAM_BOT_ID, TELEGRAM_BOT_USERNAME
+from telegram_agent.src.telegram.api import call_api
 
 # Logging -------------------------------------------------------------------------------------------------------------
 from telegram_agent.log.logger import get_logger
@@ -20,15 +20,20 @@ from telegram_agent.log.logger import get_logger
 logger = get_logger("ActionsLog")
 
 # Constants -----------------------------------------------------------------------------------------------------------
+# Text sent by a SendMessageAction configured without one
+DEFAULT_MESSAGE_TEMPLATE = "Message from {user_id}: {text}"
 
 
 # Functions ------------------------------------------------------------------------------------------------------------
 async def toggle_forum(client: Client, chat_id: int, enabled: bool = False):
     try:
-        r = await client.invoke(
+        r = await call_api(
+            client,
+            client.invoke,
             raw.functions.channels.ToggleForum(
                 channel=await client.resolve_peer(chat_id), enabled=enabled
-            )
+            ),
+            limit_chat_id=chat_id,
         )
 
         return bool(r)
@@ -51,7 +56,9 @@ def wrap_input(input_str: str, wrap_char: str = "`") -> str:
 # Create supergroup topic
 async def create_supergroup_topic(client: Client, group_id: int, topic_title: str):
     logger.info(f"Creating forum topic: {topic_title}")
-    forum_topic = await client.create_forum_topic(chat_id=group_id, title=topic_title)
+    forum_topic = await call_api(
+        client, client.create_forum_topic, chat_id=group_id, title=topic_title
+    )
     logger.info(f"Created forum topic: {forum_topic}")
     return forum_topic
 
@@ -61,13 +68,17 @@ async def post_message(
     client: Client, msg_text: str, chat_id: int, topic_id: Optional[int] = None
 ):
     if topic_id:
-        await client.send_message(
+        await call_api(
+            client,
+            client.send_message,
             chat_id=chat_id,
             message_thread_id=topic_id,
             text=msg_text,
         )
     else:
-        await client.send_message(
+        await call_api(
+            client,
+            client.send_message,
             chat_id=chat_id,
             text=msg_text,
         )
@@ -96,11 +107,12 @@ async def init_supergroup_topics(client: Client, group_id: int, group_init_dict:
 async def create_supergroup(client: Client, title: str, group_type: str):
     try:
         # Create a new supergroup
-        result = await client.create_supergroup(
+        result = await call_api(
+            client,
+            client.create_supergroup,
             title=title,
             description="Created by bot",
         )
-        sleep(0.5)
         logger.info(f"Created supergroup: {type(result)} -  {result}")
         chat_id = result.id
 
@@ -113,13 +125,14 @@ async def create_supergroup(client: Client, title: str, group_type: str):
             logger.error(f"Failed to enable topics: {e}")
         # result.is_forum = True
         logger.info(f"Supergroup deets. Is forum set to true?:\n{result}")
-        sleep(0.5)
 
         # Set chat permissions
         try:
-            permissions_result = await client.set_chat_permissions(
-                chat_id,
-                ChatPermissions(
+            permissions_result = await call_api(
+                client,
+                client.set_chat_permissions,
+                chat_id=chat_id,
+                permissions=ChatPermissions(
                     can_send_messages=True,
                     can_send_media_messages=True,
                     can_manage_topics=True,
@@ -129,20 +142,28 @@ async def create_supergroup(client: Client, title: str, group_type: str):
         except Exception as e:
             logger.error(f"Failed to update permissions: {e}")
         # Generate an invite link
-        invite_link = await client.create_chat_invite_link(chat_id)
+        invite_link = await call_api(
+            client, client.create_chat_invite_link, chat_id=chat_id
+        )
 
         # Add the bot to the chat
         bot_username = TELEGRAM_BOT_USERNAME
         if bot_username:
             logger.info(f"Adding bot to the chat: {bot_username}")
             try:
-                mem_result = await client.add_chat_members(
-                    chat_id, user_ids=bot_username
+                mem_result = await call_api(
+                    client,
+                    client.add_chat_members,
+                    chat_id=chat_id,
+                    user_ids=bot_username,
                 )
                 logger.info(f"Result of adding bot to chat: {mem_result}")
+                # Give Telegram time to register the new member before promoting it
                 await asyncio.sleep(2)
-                promo_res = await client.promote_chat_member(
-                    chat_id,
+                promo_res = await call_api(
+                    client,
+                    client.promote_chat_member,
+                    chat_id=chat_id,
                     user_id=bot_username,
                     privileges=ChatPrivileges(
                         can_delete_messages=True,
@@ -162,7 +183,6 @@ async def create_supergroup(client: Client, title: str, group_type: str):
                 "Bot username not provided, skipping adding bot to the chat."
             )
 
-        sleep(0.5)
         # Create a new forum topic (thread)
         try:
             # forum_topic = await client.create_forum_topic(chat_id, "Config")
@@ -172,7 +192,9 @@ async def create_supergroup(client: Client, title: str, group_type: str):
             )
             config_text = f"#InitSupergroup | {group_type}"
             # Send a welcome message in the new topic
-            await client.send_message(
+            await call_api(
+                client,
+                client.send_message,
                 chat_id=chat_id,
                 text=config_text,
                 message_thread_id=forum_topic.id,
@@ -180,7 +202,6 @@ async def create_supergroup(client: Client, title: str, group_type: str):
         except Exception as e:
             logger.error(f"Failed to create forum topic: {e}")
 
-        sleep(0.5)
         ## Reply to the user's message with the invite link
         # try:
         #    await message.reply_text(
@@ -198,12 +219,70 @@ async def create_supergroup(client: Client, title: str, group_type: str):
 # Classes -------------------------------------------------------------------------------------------------------------
 
 
+class _ContextFields:
+    def __init__(self, context: MessageContext):
+        self.context = context
+
+    def __getitem__(self, name: str):
+        return getattr(self.context, name)
+
+
+class ContextTemplate:
+    """
+    A string action parameter filled in from the message context on every execution,
+    e.g. ContextTemplate("Message from {user_id}: {text}") or "{user.username} wrote".
+
+    Args:
+        template (str): A str.format template over MessageContext fields.
+    """
+
+    def __init__(self, template: str):
+        self.template = template
+
+    def render(self, context: MessageContext) -> str:
+        return self.template.format_map(_ContextFields(context))
+
+    def __repr__(self):
+        return f"ContextTemplate({self.template!r})"
+
+
+def resolve_param(value: Any, context: MessageContext) -> Any:
+    """
+    Resolves an action parameter for one message. Callables are called with the message
+    context, ContextTemplates are rendered, and anything else is used as is.
+
+    Args:
+        value (Any): The configured parameter.
+        context (MessageContext): The message context.
+
+    Returns:
+        Any: The parameter value for this message.
+    """
+    if isinstance(value, ContextTemplate):
+        return value.render(context)
+    if callable(value):
+        return value(context)
+    return value
+
+
 class BaseAction:
     """
     Abstract base class for actions.
+
+    `execute` may return a result; in a PipelineGraph it is passed on to the nodes that
+    depend on this one through their `inputs`.
+
+    Actions are shared by every message a pipeline processes, possibly concurrently, so
+    `execute` must not modify the action. Parameters are resolved per message instead:
+    they may be fixed values, callables taking the MessageContext, or ContextTemplates.
     """
 
-    async def execute(self, client: Client, context: MessageContext):
+    async def execute(
+        self,
+        client: Client,
+        context: MessageContext,
+        inputs: Optional[Dict[str, Any]] = None,
+    ):
         raise NotImplementedError
 
 
@@ -222,7 +301,12 @@ class FunctionAction(BaseAction):
             raise ValueError("func must be a callable")
         self.function = function
 
-    async def execute(self, client: Client, context: MessageContext):
+    async def execute(
+        self,
+        client: Client,
+        context: MessageContext,
+        inputs: Optional[Dict[str, Any]] = None,
+    ):
         """
         Executes the provided function with the message text and chat ID,
         then sends the result as a reply to the original message.
@@ -230,6 +314,7 @@ class FunctionAction(BaseAction):
         Args:
             client (Client): The Pyrogram client.
             context (MessageContext): The message context.
+            inputs (Optional[Dict[str, Any]]): Results of upstream pipeline graph nodes.
         """
         message_text = context.text
         chat_id = context.chat_id
@@ -253,7 +338,9 @@ class FunctionAction(BaseAction):
                 result = str(result)
 
             logger.info(f"Function executed successfully. Sending reply.")
-            await client.send_message(
+            await call_api(
+                client,
+                client.send_message,
                 chat_id=chat_id,
                 text=result,
                 reply_to_message_id=msg_id,
@@ -261,7 +348,9 @@ class FunctionAction(BaseAction):
             )
         except Exception as e:
             logger.error(f"Error executing FunctionAction: {e}")
-            await client.send_message(
+            await call_api(
+                client,
+                client.send_message,
                 chat_id=chat_id,
                 text="An error occurred while processing your request.",
                 reply_to_message_id=msg_id,
@@ -272,42 +361,72 @@ class SendMessageAction(BaseAction):
     """
     Action to send a message.
 
+    Parameters left as None are taken from the message being processed: its chat and
+    topic, and DEFAULT_MESSAGE_TEMPLATE as the text.
+
     Args:
-        chat_id (int): The ID of the chat to send the message to.
-        text (str): The text of the message to send.
+        chat_id (Optional[int]): The ID of the chat to send the message to.
+        text (Optional[str]): The text of the message to send.
+        message_thread_id (Optional[int]): The forum topic to send the message to.
         kwargs (Dict[str, Any]): Additional keyword arguments for send_message.
     """
 
     def __init__(
-        self, chat_id: int, text: str, message_thread_id: Optional[int], **kwargs
+        self,
+        chat_id: Optional[int] = None,
+        text: Optional[str] = None,
+        message_thread_id: Optional[int] = None,
+        **kwargs,
     ):
         self.chat_id = chat_id
         self.text = text
         self.message_thread_id = message_thread_id
         self.kwargs = kwargs
 
-    async def execute(self, client: Client, context: MessageContext):
+    async def execute(
+        self,
+        client: Client,
+        context: MessageContext,
+        inputs: Optional[Dict[str, Any]] = None,
+    ):
         """
         Executes the action.
 
         Args:
             client (Client): The Pyrogram client.
             context (MessageContext): The message context.
+            inputs (Optional[Dict[str, Any]]): Results of upstream pipeline graph nodes.
         """
+        inputs = inputs or {}
+        chat_id = inputs.get("chat_id", resolve_param(self.chat_id, context))
+        if chat_id is None:
+            chat_id = context.chat_id
+        message_thread_id = inputs.get(
+            "message_thread_id", resolve_param(self.message_thread_id, context)
+        )
+        if message_thread_id is None and "chat_id" not in inputs:
+            message_thread_id = context.message_thread_id
+        text = inputs.get("text", resolve_param(self.text, context))
+        if text is None:
+            text = ContextTemplate(DEFAULT_MESSAGE_TEMPLATE).render(context)
         logger.info(
-            f"Sending message to chatID: {self.chat_id} | {self.text} | {self.message_thread_id}"
+            f"Sending message to chatID: {chat_id} | {text} | {message_thread_id}"
         )
-        if self.message_thread_id:
-            await client.send_message(
-                chat_id=self.chat_id,
-                text=self.text,
-                message_thread_id=self.message_thread_id,
+        if message_thread_id:
+            return await call_api(
+                client,
+                client.send_message,
+                chat_id=chat_id,
+                text=text,
+                message_thread_id=message_thread_id,
                 **self.kwargs,
             )
         else:
-            await client.send_message(
-                chat_id=self.chat_id,
-                text=self.text,
+            return await call_api(
+                client,
+                client.send_message,
+                chat_id=chat_id,
+                text=text,
                 **self.kwargs,
             )
 
@@ -317,28 +436,46 @@ class ForwardMessageAction(BaseAction):
     Action to forward a message.
 
     Args:
-        from_chat_id (int): The ID of the source chat.
+        from_chat_id (Optional[int]): The ID of the source chat, defaults to the message's chat.
         to_chat_id (int): The ID of the destination chat.
-        message_id (int): The ID of the message to forward.
+        message_id (Optional[int]): The ID of the message to forward, defaults to the message itself.
     """
 
-    def __init__(self, from_chat_id: int, to_chat_id: int, message_id: int):
+    def __init__(
+        self,
+        from_chat_id: Optional[int] = None,
+        to_chat_id: Optional[int] = None,
+        message_id: Optional[int] = None,
+    ):
         self.from_chat_id = from_chat_id
         self.to_chat_id = to_chat_id
         self.message_id = message_id
 
-    async def execute(self, client: Client, context: MessageContext):
+    async def execute(
+        self,
+        client: Client,
+        context: MessageContext,
+        inputs: Optional[Dict[str, Any]] = None,
+    ):
         """
         Executes the action.
 
         Args:
             client (Client): The Pyrogram client.
             context (MessageContext): The message context.
+            inputs (Optional[Dict[str, Any]]): Results of upstream pipeline graph nodes.
         """
-        await client.forward_messages(
-            chat_id=self.to_chat_id,
-            from_chat_id=self.from_chat_id,
-            message_ids=self.message_id,
+        inputs = inputs or {}
+        from_chat_id = inputs.get(
+            "from_chat_id", resolve_param(self.from_chat_id, context)
+        )
+        message_id = inputs.get("message_id", resolve_param(self.message_id, context))
+        return await call_api(
+            client,
+            client.forward_messages,
+            chat_id=inputs.get("to_chat_id", resolve_param(self.to_chat_id, context)),
+            from_chat_id=context.chat_id if from_chat_id is None else from_chat_id,
+            message_ids=context.msg_id if message_id is None else message_id,
         )
 
 
@@ -443,39 +580,51 @@ class CreateSupergroupAction(BaseAction):
         self.privacy = privacy
         self.bot_username = bot_username
 
-    async def execute(self, client: Client, context: MessageContext):
+    async def execute(
+        self,
+        client: Client,
+        context: MessageContext,
+        inputs: Optional[Dict[str, Any]] = None,
+    ):
         """
         Executes the action.
 
         Args:
             client (Client): The Pyrogram client.
             context (MessageContext): The message context.
+            inputs (Optional[Dict[str, Any]]): Results of upstream pipeline graph nodes.
         """
         logger.info(f"Creating new Supergroup from context: {context}")
-        if self.title is None:
-            self.title = context.text or "New Supergroup"
-        print(f"\nCreating new Supergroup: {self.title}\n")
+        inputs = inputs or {}
+        title = inputs.get("title") or resolve_param(self.title, context)
+        if title is None:
+            title = context.text or "New Supergroup"
+        bot_username = resolve_param(self.bot_username, context)
+        print(f"\nCreating new Supergroup: {title}\n")
         # Create a new supergroup
-        result = await client.create_supergroup(
-            title=self.title,
+        result = await call_api(
+            client,
+            client.create_supergroup,
+            title=title,
             description="Created by bot",
         )
-        sleep(0.5)
         logger.info(f"Created supergroup: {result}")
         chat_id = result.id
 
         # Enable topics in the supergroup
         try:
-            await client.toggle_forum_topics(chat_id=chat_id, enabled=True)
+            await call_api(
+                client, client.toggle_forum_topics, chat_id=chat_id, enabled=True
+            )
             logger.info(f"Enabled topics in supergroup: {chat_id}")
         except Exception as e:
             logger.error(f"Failed to enable topics: {e}")
 
-        sleep(0.5)
-
-        permissions_result = await client.set_chat_permissions(
-            chat_id,
-            ChatPermissions(
+        permissions_result = await call_api(
+            client,
+            client.set_chat_permissions,
+            chat_id=chat_id,
+            permissions=ChatPermissions(
                 can_send_messages=True,
                 can_send_media_messages=True,
                 can_manage_topics=True,
@@ -483,20 +632,28 @@ class CreateSupergroupAction(BaseAction):
         )
         logger.info(f"New Permissions: {permissions_result}")
         # Generate an invite link
-        invite_link = await client.create_chat_invite_link(chat_id)
+        invite_link = await call_api(
+            client, client.create_chat_invite_link, chat_id=chat_id
+        )
 
         # Add the bot to the chat
-        if self.bot_username:
-            logger.info(f"Adding bot to the chat: {self.bot_username}")
+        if bot_username:
+            logger.info(f"Adding bot to the chat: {bot_username}")
             try:
-                mem_result = await client.add_chat_members(
-                    chat_id, user_ids=self.bot_username
+                mem_result = await call_api(
+                    client,
+                    client.add_chat_members,
+                    chat_id=chat_id,
+                    user_ids=bot_username,
                 )
                 logger.info(f"Result of adding a bot to chat => {mem_result}")
+                # Give Telegram time to register the new member before promoting it
                 await asyncio.sleep(2)
-                promo_res = await client.promote_chat_member(
-                    chat_id,
-                    user_id=self.bot_username,
+                promo_res = await call_api(
+                    client,
+                    client.promote_chat_member,
+                    chat_id=chat_id,
+                    user_id=bot_username,
                     privileges=ChatPrivileges(
                         can_delete_messages=True,
                         can_restrict_members=True,
@@ -516,32 +673,38 @@ class CreateSupergroupAction(BaseAction):
             logger.warning(
                 "Bot username not provided, skipping adding bot to the chat."
             )
-        sleep(0.5)
         # Create a new forum topic (thread)
         try:
-            forum_topic = await client.create_forum_topic(
-                chat_id=chat_id, title="Config"
+            forum_topic = await call_api(
+                client,
+                client.create_forum_topic,
+                chat_id=chat_id,
+                title="Config",
             )
             logger.info(f"Created forum topic: {forum_topic}")
             # Send a welcome message in the new topic
-            await client.send_message(
+            await call_api(
+                client,
+                client.send_message,
                 chat_id=chat_id,
                 text=f"#InitSupergroup",
                 message_thread_id=forum_topic.id,
             )
         except Exception as e:
             logger.error(f"Failed to create forum topic: {e}")
-        sleep(0.5)
         # Reply to the user's message with the invite link
         try:
-            await client.send_message(
+            await call_api(
+                client,
+                client.send_message,
                 chat_id=context.chat_id,
-                text=f"A new supergroup '{self.title}' has been created! Join here: {invite_link.invite_link}",
+                text=f"A new supergroup '{title}' has been created! Join here: {invite_link.invite_link}",
                 reply_to_message_id=context.msg_id,
                 message_thread_id=context.message_thread_id,
             )
         except Exception as e:
             logger.error(f"Failed to send invite link to the user: {e}")
+        return result
 
 
 class CreateForumTopicAction(BaseAction):
@@ -559,30 +722,43 @@ class CreateForumTopicAction(BaseAction):
         self.group_id = group_id
         # self.bot_username = bot_username
 
-    async def execute(self, client: Client, context: MessageContext):
+    async def execute(
+        self,
+        client: Client,
+        context: MessageContext,
+        inputs: Optional[Dict[str, Any]] = None,
+    ):
         """
         Executes the action.
 
         Args:
             client (Client): The Pyrogram client.
             context (MessageContext): The message context.
+            inputs (Optional[Dict[str, Any]]): Results of upstream pipeline graph nodes.
         """
         logger.info(f"Creating new Forum Topic in context: {context}")
-        if self.group_id:
-            chat_id = self.group_id
+        inputs = inputs or {}
+        title = inputs.get("title", resolve_param(self.title, context))
+        group_id = resolve_param(self.group_id, context)
+        if inputs.get("chat_id"):
+            chat_id = inputs["chat_id"]
+        elif group_id:
+            chat_id = group_id
         else:
             chat_id = context.chat_id
         print(
-            f"\nCreating new Forum Topic: {self.title}"
+            f"\nCreating new Forum Topic: {title}"
         )  # " with chatID: {chat_id}\n")
         # member = await client.get_chat_member(chat_id, "me")
         # logger.info(member)
         # chat_rights =
         # Create a new forum topic (thread)
-        sleep(1)
         try:
-            forum_topic = await client.create_forum_topic(
-                chat_id=chat_id, title=self.title
+            forum_topic = await call_api(
+                client,
+                client.create_forum_topic,
+                chat_id=chat_id,
+                title=title,
             )
             logger.info(f"Created forum topic: {forum_topic}")
             # Send a welcome message in the new topic
@@ -591,6 +767,7 @@ class CreateForumTopicAction(BaseAction):
             #    text=f"#InitSupergroup",
             #    message_thread_id=forum_topic.id,
             # )
+            return forum_topic
         except Exception as e:
             logger.error(f"Failed to create forum topic: {e}")
 
@@ -1,5 +1,5 @@
 # filters.py
-from typing import Callable, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from telegram_agent.src.models.models import MessageContext
 
 from telegram_agent.log.logger import get_logger
@@ -45,24 +45,111 @@ from .models import MessageContext
 """
 
 
+class FilterEvaluation:
+    """
+    Evaluates filters for one message, running each predicate at most once.
+
+    Results are memoized per filter, so a filter shared by several steps or appearing
+    twice in a tree is still only evaluated once, and every evaluated predicate is recorded
+    in `trace` in evaluation order. Predicates skipped by short-circuiting do not run and
+    do not appear in the trace.
+
+    Args:
+        context (MessageContext): The message context the filters are evaluated against.
+    """
+
+    def __init__(self, context: MessageContext):
+        self.context = context
+        self.results: Dict[int, bool] = {}
+        self.trace: List[Tuple[str, bool]] = []
+
+    @classmethod
+    def of(cls, context: MessageContext) -> "FilterEvaluation":
+        """
+        Returns the evaluation of a message shared by every pipeline handling it, so a
+        filter used by several bots behind one Dispatcher still runs once per update.
+
+        Args:
+            context (MessageContext): The message context.
+
+        Returns:
+            FilterEvaluation: The message's evaluation, created on first use.
+        """
+        evaluation = getattr(context, "_filter_evaluation", None)
+        if evaluation is None:
+            evaluation = cls(context)
+            context._filter_evaluation = evaluation
+        return evaluation
+
+    def check(self, f: "BaseFilter") -> bool:
+        """
+        Evaluates a filter against the message, reusing an earlier result if there is one.
+
+        Args:
+            f (BaseFilter): The filter to evaluate.
+
+        Returns:
+            bool: The filter result.
+        """
+        key = id(f)
+        if key not in self.results:
+            self.results[key] = f.evaluate(self)
+            if f.is_predicate:
+                self.trace.append((f.name, self.results[key]))
+        return self.results[key]
+
+    def format_trace(self) -> str:
+        return ", ".join(f"{name}={result}" for name, result in self.trace)
+
+
 class BaseFilter:
     """
     Abstract base class for filters.
 
+    Filters combine into AND/OR/NOT trees with `&`, `|` and `~`, e.g.
+    `filters.is_supergroup & ~filters.is_idea`.
+
     Args:
         name (str): The name of the filter.
     """
 
+    # Leaf filters running a condition; combinators only arrange other filters
+    is_predicate = True
+
     def __init__(self, name: str):
         self.name = name
 
-    def __call__(self, context: MessageContext) -> bool:
+    def evaluate(self, evaluation: FilterEvaluation) -> bool:
         raise NotImplementedError
 
+    def __call__(self, context: MessageContext) -> bool:
+        """
+        Evaluates the filter against a message on its own.
+
+        Args:
+            context (MessageContext): The message context.
 
-class MessageFilter(BaseFilter):
+        Returns:
+            bool: True if the filter passes, False otherwise.
+        """
+        return FilterEvaluation(context).check(self)
+
+    def __and__(self, other: "BaseFilter") -> "AndFilter":
+        return AndFilter([self, other])
+
+    def __or__(self, other: "BaseFilter") -> "OrFilter":
+        return OrFilter([self, other])
+
+    def __invert__(self) -> "NotFilter":
+        return NotFilter(self)
+
+    def __repr__(self):
+        return self.name
+
+
+class ConditionFilter(BaseFilter):
     """
-    Filter based on message attributes.
+    Filter evaluating a condition on the message context.
 
     Args:
         name (str): The name of the filter.
@@ -73,22 +160,23 @@ class MessageFilter(BaseFilter):
         self.name = name
         self.condition = condition
 
-    def __call__(self, context: MessageContext) -> bool:
-        """
-        Evaluates the filter condition.
+    def evaluate(self, evaluation: FilterEvaluation) -> bool:
+        result = bool(self.condition(evaluation.context))
+        logger.debug(f"{type(self).__name__}: {self.name} -> {result}")
+        return result
 
-        Args:
-            context (MessageContext): The message context.
 
-        Returns:
-            bool: True if the condition is met, False otherwise.
-        """
-        logger.info(f"MessageFilter: {self.name}")
-        logger.info(f"       Result: {self.condition(context)}")
-        return self.condition(context)
+class MessageFilter(ConditionFilter):
+    """
+    Filter based on message attributes.
+
+    Args:
+        name (str): The name of the filter.
+        condition (Callable[[MessageContext], bool]): The condition to evaluate.
+    """
 
 
-class ChatFilter(BaseFilter):
+class ChatFilter(ConditionFilter):
     """
     Filter based on chat attributes.
 
@@ -98,24 +186,117 @@ class ChatFilter(BaseFilter):
     """
 
     def __init__(self, name: str, condition: Callable[[MessageContext], bool]):
-        self.name = name
-        self.condition = condition
+        super().__init__(name, condition)
         logger.info(f"Initialized ChatFilter: {self.name}")
         logger.info(f"            Condition: {self.condition}")
 
-    def __call__(self, context: MessageContext) -> bool:
-        """
-        Evaluates the filter condition.
 
-        Args:
-            context (MessageContext): The message context.
+class EqualsFilter(ChatFilter):
+    """
+    Filter passing when a message context field equals a value, e.g. chat_type == "private".
 
-        Returns:
-            bool: True if the condition is met, False otherwise.
-        """
-        logger.info(f"ChatFilter: {self.name}")
-        logger.info(f"    Result: {self.condition(context)}")
-        return self.condition(context)
+    Unlike an arbitrary condition, the field and value are known to the pipeline router,
+    which uses them to skip steps that cannot match.
+
+    Args:
+        name (str): The name of the filter.
+        field (str): The MessageContext field to compare.
+        value (Any): The value the field must equal.
+    """
+
+    def __init__(self, name: str, field: str, value: Any):
+        self.field = field
+        self.value = value
+        super().__init__(name, lambda ctx: getattr(ctx, field, None) == value)
+
+
+class KeywordFilter(MessageFilter):
+    """
+    Filter passing when the message text contains a keyword, ignoring case.
+
+    Args:
+        name (str): The name of the filter.
+        keyword (str): The keyword to look for.
+    """
+
+    def __init__(self, name: str, keyword: str):
+        self.keyword = keyword.lower()
+        super().__init__(name, lambda ctx: self.keyword in (ctx.text or "").lower())
+
+
+class AndFilter(BaseFilter):
+    """
+    Passes when all of its filters pass, stopping at the first one that fails.
+
+    Args:
+        filters (List[BaseFilter]): The filters to combine.
+    """
+
+    is_predicate = False
+
+    def __init__(self, filters: List[BaseFilter]):
+        # Nested ANDs are flattened so `a & b & c` is a single node
+        self.filters = []
+        for f in filters:
+            self.filters.extend(f.filters if isinstance(f, AndFilter) else [f])
+        self.name = "(" + " & ".join(f.name for f in self.filters) + ")"
+
+    def evaluate(self, evaluation: FilterEvaluation) -> bool:
+        return all(evaluation.check(f) for f in self.filters)
+
+
+class OrFilter(BaseFilter):
+    """
+    Passes when any of its filters passes, stopping at the first one that does.
+
+    Args:
+        filters (List[BaseFilter]): The filters to combine.
+    """
+
+    is_predicate = False
+
+    def __init__(self, filters: List[BaseFilter]):
+        self.filters = []
+        for f in filters:
+            self.filters.extend(f.filters if isinstance(f, OrFilter) else [f])
+        self.name = "(" + " | ".join(f.name for f in self.filters) + ")"
+
+    def evaluate(self, evaluation: FilterEvaluation) -> bool:
+        return any(evaluation.check(f) for f in self.filters)
+
+
+class NotFilter(BaseFilter):
+    """
+    Passes when its filter fails.
+
+    Args:
+        f (BaseFilter): The filter to negate.
+    """
+
+    is_predicate = False
+
+    def __init__(self, f: BaseFilter):
+        self.filter = f
+        self.name = f"~{f.name}"
+
+    def evaluate(self, evaluation: FilterEvaluation) -> bool:
+        return not evaluation.check(self.filter)
+
+
+def compile_filters(filters: Optional[List[BaseFilter]]) -> BaseFilter:
+    """
+    Compiles a list of filters (all of which must pass) into a single filter tree.
+
+    Args:
+        filters (Optional[List[BaseFilter]]): The filters.
+
+    Returns:
+        BaseFilter: The filter, or an AND over all of them.
+    """
+    filters = filters or []
+    if len(filters) == 1:
+        return filters[0]
+    return AndFilter(filters)
 
 
 class FilterGroup:
@@ -137,3 +318,27 @@ class FilterGroup:
                 setattr(self, f.name, f)
             else:
                 raise ValueError("Each filter must have a 'name' attribute.")
+
+    def all_of(self, *names: str) -> AndFilter:
+        """
+        Builds a filter passing when all named filters pass.
+
+        Args:
+            *names (str): Names of filters in the group.
+
+        Returns:
+            AndFilter: The combined filter.
+        """
+        return AndFilter([getattr(self, name) for name in names])
+
+    def any_of(self, *names: str) -> OrFilter:
+        """
+        Builds a filter passing when any named filter passes.
+
+        Args:
+            *names (str): Names of filters in the group.
+
+        Returns:
+            OrFilter: The combined filter.
+        """
+        return OrFilter([getattr(self, name) for name in names])
@@ -5,10 +5,22 @@ from telegram_agent.src.pipeline.actions import (
     CreateSupergroupAction,
     CreateForumTopicAction,
     FunctionAction,
+    ContextTemplate,
     wrap_input,
 )
-from telegram_agent.src.pipeline.pipeline_base import Pipeline, PipelineStep
-from telegram_agent.src.pipeline.filters import MessageFilter, ChatFilter, FilterGroup
+from telegram_agent.src.pipeline.pipeline_base import (
+    Pipeline,
+    PipelineStep,
+    PipelineGraph,
+    PipelineNode,
+)
+from telegram_agent.src.pipeline.filters import (
+    MessageFilter,
+    ChatFilter,
+    EqualsFilter,
+    KeywordFilter,
+    FilterGroup,
+)
 from telegram_agent.src.pipeline.wrapper import MessageProcessorDecorator
 
 # Constants -----------------------------------------------------------------------------------------------------------
@@ -35,8 +47,12 @@ __all__ = [
     "CreateForumTopicAction",
     "Pipeline",
     "PipelineStep",
+    "PipelineGraph",
+    "PipelineNode",
     "MessageFilter",
     "ChatFilter",
+    "EqualsFilter",
+    "KeywordFilter",
     "API_ID",
     "API_HASH",
     "BOT_TOKEN",
@@ -45,5 +61,6 @@ __all__ = [
     "MessageProcessorDecorator",
     "TELEGRAM_BOT_USERNAME",
     "FunctionAction",
+    "ContextTemplate",
     "wrap_input",
 ]
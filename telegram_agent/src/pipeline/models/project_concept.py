@@ -2,6 +2,8 @@ from pyrogram.methods.chats import create_forum_topic
 from telegram_agent.src.pipeline.models._imports import (
     ChatFilter,
     MessageFilter,
+    EqualsFilter,
+    KeywordFilter,
     API_ID,
     API_HASH,
     BOT_TOKEN,
@@ -37,34 +39,15 @@ def get_topic_chats(chat_id: int, thread_id: int): ...
 
 # Filters -------------------------------------------------------------------------------------------------------------
 filters_list = [
-    ChatFilter(
-        name="is_private_chat",
-        condition=lambda ctx: ctx.chat_type == "private",
-    ),
-    ChatFilter(
-        name="is_supergroup",
-        condition=lambda ctx: ctx.chat_type == "supergroup",
-    ),
-    ChatFilter(
-        name="is_idea",
-        condition=lambda ctx: ctx.message_thread_name == "Idea List",
-    ),
-    ChatFilter(
-        name="is_concept",
-        condition=lambda ctx: ctx.message_thread_name == "Concept",
-    ),
-    MessageFilter(
-        name="contains_init_keyword",
-        condition=lambda ctx: "initsupergroup" in (ctx.text or "").lower(),
-    ),
-    MessageFilter(
-        name="contains_urgent",
-        condition=lambda ctx: "urgent" in (ctx.text or "").lower(),
-    ),
+    EqualsFilter(name="is_private_chat", field="chat_type", value="private"),
+    EqualsFilter(name="is_supergroup", field="chat_type", value="supergroup"),
+    EqualsFilter(name="is_idea", field="message_thread_name", value="Idea List"),
+    EqualsFilter(name="is_concept", field="message_thread_name", value="Concept"),
+    KeywordFilter(name="contains_init_keyword", keyword="initsupergroup"),
+    KeywordFilter(name="contains_urgent", keyword="urgent"),
     ChatFilter(name="not_idea", condition=lambda ctx: ctx.chat.title != "Ideas"),
-    ChatFilter(
-        name="brainstorming",
-        condition=lambda ctx: ctx.message_thread_name == "Brainstorming",
+    EqualsFilter(
+        name="brainstorming", field="message_thread_name", value="Brainstorming"
     ),
     # MessageFilter(
     #    name="from_specific_user", condition=lambda ctx: ctx.user_id == ADMIN_CHAT_ID
@@ -3,12 +3,16 @@ from pyrogram.methods.chats import create_forum_topic
 from telegram_agent.src.pipeline.models._imports import (
     ChatFilter,
     MessageFilter,
+    EqualsFilter,
+    KeywordFilter,
     API_ID,
     API_HASH,
     BOT_TOKEN,
     get_logger,
     Pipeline,
     PipelineStep,
+    PipelineGraph,
+    PipelineNode,
     FilterGroup,
     SendMessageAction,
     ForwardMessageAction,
@@ -40,6 +44,14 @@ forum_topics = [
     "Brainstorming",
 ]
 
+# Scaffold topics created with a new supergroup, and the prompt seeded into each
+scaffold_topic_prompts = {
+    "Goal": "[Goal]",
+    "Brainstorming": "[Prompt] Please help the user with brainstorming for the project goal.",
+    "References": "[Prompt] The following posts could be useful for this project. Please analyze the contents of the post and describe if/how it would be useful.",
+    "Overview": "[Prompt] The following overview posts serve as a summary and 'How to' guide the user will follow to accomplish the project goal.",
+}
+
 # Functions -----------------------------------------------------------------------------------------------------------
 
 
@@ -58,25 +70,47 @@ def create_supergroup(title: str):
     return CreateSupergroupAction(title=title)
 
 
+# A graph creating a supergroup, then its topics one by one, seeding each topic's prompt as soon as it exists.
+# Topics are chained because Telegram lists them by creation time; the prompts overlap with the later topics.
+def supergroup_scaffold_graph(
+    topic_prompts: dict[str, str], filters: list = None, bot_username: str = None
+):
+    nodes = [
+        PipelineNode(
+            "supergroup", CreateSupergroupAction(bot_username=bot_username)
+        )
+    ]
+    previous_topic = None
+    for title, prompt in topic_prompts.items():
+        nodes.append(
+            PipelineNode(
+                f"topic:{title}",
+                CreateForumTopicAction(title=title),
+                inputs={"chat_id": "supergroup.id"},
+                after=[previous_topic] if previous_topic else None,
+            )
+        )
+        previous_topic = f"topic:{title}"
+        nodes.append(
+            PipelineNode(
+                f"prompt:{title}",
+                SendMessageAction(chat_id=None, text=prompt, message_thread_id=None),
+                inputs={
+                    "chat_id": "supergroup.id",
+                    "message_thread_id": f"topic:{title}.id",
+                },
+            )
+        )
+    return PipelineGraph(nodes, filters=filters)
+
+
 # Filters -------------------------------------------------------------------------------------------------------------
 filters_list = [
-    ChatFilter(
-        name="is_private_chat", condition=lambda ctx: ctx.chat_type == "private"
-    ),
-    ChatFilter(
-        name="is_supergroup", condition=lambda ctx: ctx.chat_type == "supergroup"
-    ),
-    ChatFilter(
-        name="is_idea", condition=lambda ctx: ctx.message_thread_name == "Idea List"
-    ),
-    MessageFilter(
-        name="contains_init_keyword",
-        condition=lambda ctx: "initsupergroup" in (ctx.text or "").lower(),
-    ),
-    MessageFilter(
-        name="contains_urgent",
-        condition=lambda ctx: "urgent" in (ctx.text or "").lower(),
-    ),
+    EqualsFilter(name="is_private_chat", field="chat_type", value="private"),
+    EqualsFilter(name="is_supergroup", field="chat_type", value="supergroup"),
+    EqualsFilter(name="is_idea", field="message_thread_name", value="Idea List"),
+    KeywordFilter(name="contains_init_keyword", keyword="initsupergroup"),
+    KeywordFilter(name="contains_urgent", keyword="urgent"),
     ChatFilter(name="not_idea", condition=lambda ctx: ctx.chat.title != "Ideas"),
     # MessageFilter(
     #    name="from_specific_user", condition=lambda ctx: ctx.user_id == ADMIN_CHAT_ID
@@ -121,6 +155,8 @@ pipeline_steps = [
 project_scaffold_pipeline = [
     PipelineStep(
         filters=[filters.contains_init_keyword],
+        # Sequential: forum_topics is listed in reverse display order, and Telegram shows
+        # topics in the order they are created
         actions=scaffold_actions_list,
     )
 ]
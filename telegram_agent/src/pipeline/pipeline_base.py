@@ -41,73 +41,305 @@ def chat_type_filter(chat_type: str):
 """
 # pipeline.py
 
-from typing import List
+import asyncio
+from typing import Any, Dict, List, Optional
 from telegram_agent.src.models.models import MessageContext
-from telegram_agent.src.pipeline.filters import BaseFilter
+from telegram_agent.src.pipeline.filters import (
+    BaseFilter,
+    FilterEvaluation,
+    compile_filters,
+)
 from telegram_agent.src.pipeline.actions import BaseAction
+from telegram_agent.src.pipeline.routing import PipelineRouter
 from pyrogram import Client
 from telegram_agent.log.logger import get_logger
 
 logger = get_logger("Pipeline")
 
+# Actions of a concurrent step running at once; the rate limiter paces the API calls themselves
+DEFAULT_MAX_CONCURRENCY = 5
+
 
 class PipelineStep:
     """
     Represents a step in the pipeline.
 
+    Actions run one after another in list order by default. A step whose actions do not
+    depend on each other can set `concurrent=True` to run them at the same time, at most
+    `max_concurrency` at once; a failing action is logged without cancelling the others.
+    Dependent actions belong in sequential steps, which still run in order.
+
     Args:
         filters (List[BaseFilter]): The list of filters for this step.
         actions (List[BaseAction]): The list of actions for this step.
+        concurrent (bool): Whether the actions are independent and may run concurrently.
+        max_concurrency (int): The maximum number of actions running at once.
     """
 
-    def __init__(self, filters: List[BaseFilter], actions: List[BaseAction]):
+    def __init__(
+        self,
+        filters: List[BaseFilter],
+        actions: List[BaseAction],
+        concurrent: bool = False,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
         self.filters = filters
+        self.condition = compile_filters(filters)
         self.actions = actions
+        self.concurrent = concurrent
+        self.semaphore = asyncio.Semaphore(max_concurrency)
 
-    async def process(self, client: Client, context: MessageContext):
+    async def _run_action(
+        self, action: BaseAction, client: Client, context: MessageContext
+    ):
+        async with self.semaphore:
+            await action.execute(client, context)
+
+    async def process(
+        self,
+        client: Client,
+        context: MessageContext,
+        evaluation: Optional[FilterEvaluation] = None,
+    ):
         """
         Processes the context through this pipeline step.
 
         Args:
             client (Client): The Pyrogram client.
             context (MessageContext): The message context.
+            evaluation (Optional[FilterEvaluation]): Filter results already computed for
+                this message by earlier steps.
         """
-        logger.info(
-            f"Processing Pipeline Step. Context:\n\n{context}\n\n     Filters:\n"
-        )
-        for f in self.filters:
-            logger.info(f"    Filter: {f.name}")
-            # logger.info(f"    Condition: {f.condition}")
-            logger.info(f"    Result: {f(context)}\n")
+        evaluation = evaluation or FilterEvaluation.of(context)
+        passed = evaluation.check(self.condition)
+        logger.info(f"Pipeline Step filters {self.condition.name}: {passed}")
 
-        # Evaluate all filters
-        if all(f(context) for f in self.filters):
+        if passed:
             # Execute all actions
+            if not self.concurrent:
+                for action in self.actions:
+                    await action.execute(client, context)
+                return
 
-            for action in self.actions:
-                await action.execute(client, context)
+            results = await asyncio.gather(
+                *(self._run_action(action, client, context) for action in self.actions),
+                return_exceptions=True,
+            )
+            for action, result in zip(self.actions, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Action {action} failed: {result!r}")
 
 
 class Pipeline:
     """
     Represents the message processing pipeline.
 
+    Steps are routed through a PipelineRouter, so a message is only checked against the
+    steps whose indexed filters (chat, topic, chat type, keyword) it can match.
+
     Args:
         steps (List[PipelineStep]): The list of pipeline steps.
     """
 
     def __init__(self, steps: List[PipelineStep]):
         self.steps = steps
+        self.router = PipelineRouter(steps)
 
     async def process(self, client: Client, context: MessageContext):
         """
         Processes the context through the pipeline.
 
+        Filters shared between steps, or with the other pipelines handling the same
+        message, are evaluated once per message.
+
         Args:
             client (Client): The Pyrogram client.
             context (MessageContext): The message context.
         """
-        for step in self.steps:
+        evaluation = FilterEvaluation.of(context)
+        for step in self.router.candidates(context):
             # step_result = await step.process(client, context)
             # logger.info(f"Pipeline Step Result: {step_result}")
-            await step.process(client, context)
+            await step.process(client, context, evaluation)
+        logger.info(
+            f"Filters for message {context.msg_id}: {evaluation.format_trace()}"
+        )
+
+
+class PipelineNodeSkipped(Exception):
+    """
+    Raised for a graph node that did not run because a node it depends on failed.
+    """
+
+
+class PipelineNode:
+    """
+    A node of a PipelineGraph: an action plus the upstream results it consumes.
+
+    The action's return value is published under the node's name. Each entry of `inputs`
+    maps an input name of the action to an upstream node, optionally followed by an
+    attribute path, e.g. {"chat_id": "supergroup.id"}. The node runs once every node it
+    reads from, and every node listed in `after`, has finished.
+
+    Args:
+        name (str): The unique name of the node.
+        action (BaseAction): The action to execute.
+        inputs (Optional[Dict[str, str]]): Input names mapped to "node[.attribute...]".
+        after (Optional[List[str]]): Nodes that must finish first without passing data.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        action: BaseAction,
+        inputs: Optional[Dict[str, str]] = None,
+        after: Optional[List[str]] = None,
+    ):
+        self.name = name
+        self.action = action
+        self.inputs = inputs or {}
+        self.after = after or []
+
+    @property
+    def dependencies(self) -> List[str]:
+        sources = [source.split(".", 1)[0] for source in self.inputs.values()]
+        return list(dict.fromkeys(sources + self.after))
+
+    def resolve_inputs(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Looks up this node's inputs in the results of the nodes that ran before it.
+
+        Args:
+            results (Dict[str, Any]): Node results by node name.
+
+        Returns:
+            Dict[str, Any]: The action's inputs.
+        """
+        inputs = {}
+        for input_name, source in self.inputs.items():
+            node_name, *path = source.split(".")
+            value = results[node_name]
+            if value is None:
+                raise ValueError(f"Node '{node_name}' produced no result for '{self.name}'")
+            for attribute in path:
+                value = getattr(value, attribute)
+            inputs[input_name] = value
+        return inputs
+
+    def __repr__(self):
+        return f"PipelineNode({self.name!r}, {self.action!r})"
+
+
+class PipelineGraph:
+    """
+    A pipeline whose actions form a directed acyclic graph.
+
+    Every node starts as soon as the nodes it depends on have finished, so independent
+    branches run in parallel (at most `max_concurrency` actions at once) while results flow
+    along the edges. When a node fails, the nodes that depend on it are skipped; other
+    branches carry on. A graph has the same `process` interface as a PipelineStep, so it
+    can be used wherever pipeline steps are.
+
+    Args:
+        nodes (List[PipelineNode]): The nodes of the graph.
+        filters (Optional[List[BaseFilter]]): Filters that must all pass for the graph to run.
+        max_concurrency (int): The maximum number of actions running at once.
+    """
+
+    def __init__(
+        self,
+        nodes: List[PipelineNode],
+        filters: Optional[List[BaseFilter]] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+    ):
+        self.nodes = {}
+        for node in nodes:
+            if node.name in self.nodes:
+                raise ValueError(f"A node with the name '{node.name}' already exists.")
+            self.nodes[node.name] = node
+        self.filters = filters or []
+        self.condition = compile_filters(self.filters)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.order = self._topological_order()
+
+    @property
+    def actions(self) -> List[BaseAction]:
+        return [node.action for node in self.nodes.values()]
+
+    def _topological_order(self) -> List[str]:
+        for node in self.nodes.values():
+            for dependency in node.dependencies:
+                if dependency not in self.nodes:
+                    raise ValueError(
+                        f"Node '{node.name}' depends on unknown node '{dependency}'."
+                    )
+        remaining = {name: set(node.dependencies) for name, node in self.nodes.items()}
+        order = []
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"Pipeline graph has a cycle among {sorted(remaining)}")
+            for name in ready:
+                del remaining[name]
+                order.append(name)
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return order
+
+    async def _run_node(
+        self,
+        node: PipelineNode,
+        tasks: Dict[str, asyncio.Task],
+        results: Dict[str, Any],
+        client: Client,
+        context: MessageContext,
+    ):
+        # Dependencies come earlier in the topological order, so their tasks exist
+        for dependency in node.dependencies:
+            try:
+                await tasks[dependency]
+            except Exception as e:
+                raise PipelineNodeSkipped(
+                    f"'{node.name}' skipped: '{dependency}' did not complete"
+                ) from e
+        inputs = node.resolve_inputs(results)
+        async with self.semaphore:
+            logger.info(f"Running pipeline node '{node.name}'")
+            results[node.name] = await node.action.execute(client, context, inputs)
+
+    async def process(
+        self,
+        client: Client,
+        context: MessageContext,
+        evaluation: Optional[FilterEvaluation] = None,
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Runs the graph for a message context.
+
+        Args:
+            client (Client): The Pyrogram client.
+            context (MessageContext): The message context.
+            evaluation (Optional[FilterEvaluation]): Filter results already computed for
+                this message by earlier steps.
+
+        Returns:
+            Optional[Dict[str, Any]]: The results of the nodes that completed, by node name,
+                or None if the filters did not pass.
+        """
+        evaluation = evaluation or FilterEvaluation.of(context)
+        if not evaluation.check(self.condition):
+            return None
+
+        results: Dict[str, Any] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        for name in self.order:
+            tasks[name] = asyncio.create_task(
+                self._run_node(self.nodes[name], tasks, results, client, context)
+            )
+        outcomes = await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for name, outcome in zip(tasks, outcomes):
+            if isinstance(outcome, PipelineNodeSkipped):
+                logger.warning(str(outcome))
+            elif isinstance(outcome, Exception):
+                logger.error(f"Pipeline node '{name}' failed: {outcome!r}")
+        return results
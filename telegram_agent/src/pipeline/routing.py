@@ -0,0 +1,180 @@
+# routing.py
+
+from collections import deque
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from telegram_agent.src.models.models import MessageContext
+from telegram_agent.src.pipeline.filters import (
+    AndFilter,
+    BaseFilter,
+    EqualsFilter,
+    KeywordFilter,
+    OrFilter,
+)
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("PipelineRouter")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+# When a step requires several indexable filters, it is indexed by the most selective one
+FIELD_PRIORITY = [
+    "chat_id",
+    "message_thread_id",
+    "message_thread_name",
+    "keyword",
+    "chat_type",
+]
+
+RouteKey = Tuple[str, Hashable]
+
+# Classes -------------------------------------------------------------------------------------------------------------
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton finding every keyword contained in a text in a single pass,
+    however many keywords there are.
+
+    Args:
+        keywords (Iterable[str]): The keywords to look for (matched as given, so lower-case
+            both keywords and text for case-insensitive matching).
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.output: List[Set[str]] = [set()]
+        for keyword in keywords:
+            self._add(keyword)
+        self._link()
+
+    def _add(self, keyword: str):
+        state = 0
+        for char in keyword:
+            if char not in self.goto[state]:
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(set())
+                self.goto[state][char] = len(self.goto) - 1
+            state = self.goto[state][char]
+        self.output[state].add(keyword)
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def find(self, text: str) -> Set[str]:
+        """
+        Returns the keywords contained in `text`.
+
+        Args:
+            text (str): The text to scan.
+
+        Returns:
+            Set[str]: The keywords found.
+        """
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.output[state]:
+                found |= self.output[state]
+        return found
+
+
+def route_keys(f: BaseFilter) -> Optional[List[RouteKey]]:
+    """
+    Returns index keys such that a message can only pass `f` if it matches one of them,
+    or None if the filter cannot be indexed.
+
+    Args:
+        f (BaseFilter): A compiled filter.
+
+    Returns:
+        Optional[List[RouteKey]]: The keys, e.g. [("chat_type", "private")].
+    """
+    if isinstance(f, EqualsFilter):
+        return [(f.field, f.value)]
+    if isinstance(f, KeywordFilter):
+        return [("keyword", f.keyword)]
+    if isinstance(f, AndFilter):
+        # Any one required filter is enough; pick the most selective
+        options = [keys for keys in map(route_keys, f.filters) if keys]
+        if not options:
+            return None
+        return min(options, key=lambda keys: max(_priority(key) for key in keys))
+    if isinstance(f, OrFilter):
+        options = [route_keys(child) for child in f.filters]
+        if not all(options):
+            return None
+        return [key for keys in options for key in keys]
+    return None
+
+
+def _priority(key: RouteKey) -> int:
+    field = key[0]
+    return FIELD_PRIORITY.index(field) if field in FIELD_PRIORITY else len(FIELD_PRIORITY)
+
+
+class PipelineRouter:
+    """
+    Indexes pipeline steps by the keys their filters require, so each message is only
+    checked against the steps that could match it.
+
+    Steps whose filters require a field value (EqualsFilter on chat_id, chat_type,
+    message_thread_name, ...) are stored in a hash map under that value; steps requiring
+    a keyword are found with one Aho-Corasick pass over the message text. Steps without
+    an indexable filter are candidates for every message. Candidates keep their pipeline
+    order and still have their full filters evaluated.
+
+    Args:
+        steps (List[Any]): Pipeline steps (or graphs) exposing a compiled `condition`.
+    """
+
+    def __init__(self, steps: List[Any]):
+        self.steps = steps
+        self.index: Dict[RouteKey, List[int]] = {}
+        self.unindexed: List[int] = []
+        for position, step in enumerate(steps):
+            keys = route_keys(getattr(step, "condition", None))
+            if keys is None:
+                self.unindexed.append(position)
+                continue
+            for key in keys:
+                self.index.setdefault(key, []).append(position)
+        self.fields = {field for field, _ in self.index if field != "keyword"}
+        keywords = [value for field, value in self.index if field == "keyword"]
+        self.matcher = KeywordMatcher(keywords) if keywords else None
+        logger.info(
+            f"Indexed {len(steps) - len(self.unindexed)} of {len(steps)} steps under {len(self.index)} keys"
+        )
+
+    def candidates(self, context: MessageContext) -> List[Any]:
+        """
+        Returns the steps that may match a message, in pipeline order.
+
+        Args:
+            context (MessageContext): The message context.
+
+        Returns:
+            List[Any]: The candidate steps.
+        """
+        positions = set(self.unindexed)
+        for field in self.fields:
+            positions.update(self.index.get((field, getattr(context, field, None)), ()))
+        if self.matcher and context.text:
+            for keyword in self.matcher.find(context.text.lower()):
+                positions.update(self.index[("keyword", keyword)])
+        return [self.steps[position] for position in sorted(positions)]
@@ -1,8 +1,7 @@
 # Imports -------------------------------------------------------------------------------------------------------------
-import asyncio
 from telegram_agent.src.models.models import User, Chat, Message, MessageContext
-from telegram_agent.src.telegram.database import get_session, init_db
-from telegram_agent.src.telegram.utils import extract_context, store_message
+from telegram_agent.src.telegram.database import init_db
+from telegram_agent.src.telegram.utils import extract_context
 from telegram_agent.src.pipeline.pipeline_base import Pipeline, PipelineStep
 from telegram_agent.src.pipeline.actions import (
     SendMessageAction,
@@ -43,69 +42,28 @@ class MessageProcessorDecorator:
             class: The wrapped TelegramBot class with the custom message processor.
         """
 
+        pipeline = Pipeline(steps=self.pipeline_steps)
+
         # Define the message_processor function
         async def message_processor(client, context: MessageContext):
             """
-            Custom message processor that stores messages and processes them through the pipeline.
+            Custom message processor that runs messages through the pipeline. The bot or
+            dispatcher receiving the message has already queued it for storage.
 
             Args:
                 client (Client): The Pyrogram client.
                 context (MessageContext): The message context.
             """
-            # Store the message
             logger.info(f"Processing message with context: \n\n{context}\n")
-            logger.debug("Storing the message.")
-            with get_session() as session:
-                store_message(session, context)
 
             # Check if the message text is blank
             if not context.text or not context.text.strip():
                 logger.info("Received a blank message. Skipping processing.")
                 return
 
-            # Update dynamic fields in actions
-            logger.debug("Updating dynamic fields in actions.")
-            for step in self.pipeline_steps:
-                await asyncio.sleep(0.5)
-                for action in step.actions:
-                    await asyncio.sleep(0.5)
-                    if isinstance(action, SendMessageAction):
-                        logger.info(f"Processing SendMessageAction: {action}")
-                        # Set dynamic chat_id and message_thread_id
-                        action.chat_id = context.chat_id
-                        action.message_thread_id = context.message_thread_id
-                        if action.text is None:
-                            action.text = (
-                                f"Message from {context.user_id}: {context.text}"
-                            )
-                    elif isinstance(action, ForwardMessageAction):
-                        logger.info(f"Processing ForwardMessageAction: {action}")
-                        action.from_chat_id = context.chat_id
-                        action.message_id = context.msg_id
-
-                    elif isinstance(action, CreateSupergroupAction):
-                        logger.info(
-                            f"Processing CreateSupergroupAction: {action} from context:\n\n{context}\n"
-                        )
-                        # Set dynamic title if needed
-                        # if action.title is None:
-                        #    action.title = context.text or "New Supergroup"
-                        ## Ensure bot username is set
-                        # if self.bot_username is None:
-                        #    raise ValueError(
-                        #        "Bot username must be provided for CreateSupergroupAction."
-                        #    )
-                        # action.bot_username = self.bot_username
-                    elif isinstance(action, CreateForumTopicAction):
-                        logger.info(f"Processing CreateForumTopicAction: {action}")
-                        # Set dynamic title if needed
-                        # if action.title is None:
-                        #    action.title = context.text or "New Forum Topic"
-
-            # Create and process the pipeline
+            # Actions resolve their parameters from the context on every execution, so
+            # one pipeline serves all messages, including ones processed concurrently
             logger.debug("Processing the pipeline.")
-            pipeline = Pipeline(steps=self.pipeline_steps)
-            logger.info(f"Processing pipeline with pipeline: {pipeline}")
             await pipeline.process(client, context)
 
         # Define a new class that wraps bot_class
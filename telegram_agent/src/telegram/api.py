@@ -0,0 +1,171 @@
+# api.py
+
+import asyncio
+import random
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pyrogram import Client
+from pyrogram.errors import (
+    Flood,
+    InternalServerError,
+    RPCError,
+    ServiceUnavailable,
+)
+
+from telegram_agent.src.telegram.config import (
+    TG_API_MAX_RETRIES,
+    TG_API_MAX_FLOOD_WAIT,
+    TG_API_BACKOFF_BASE,
+    TG_API_BACKOFF_MAX,
+)
+from telegram_agent.src.telegram.rate_limit import get_rate_limiter
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("TelegramAPI")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+# Server-side failures and dropped connections are worth retrying; any other RPCError
+# (bad request, forbidden, unauthorized, ...) will fail the same way again.
+TRANSIENT_ERRORS = (
+    InternalServerError,
+    ServiceUnavailable,
+    OSError,  # includes ConnectionError
+    asyncio.TimeoutError,
+)
+
+# Classes -------------------------------------------------------------------------------------------------------------
+
+
+class ApiMetrics:
+    """
+    Counters describing the Telegram API calls made through `call_api`.
+
+    Attributes:
+        calls (int): Calls started.
+        retries (int): Attempts repeated after a FloodWait or a transient error.
+        flood_waits (int): FloodWait / SlowmodeWait responses received.
+        flood_wait_time (float): Seconds Telegram asked us to wait, in total.
+        backoff_time (float): Seconds spent backing off after transient errors.
+        transient_errors (int): Transient errors received.
+        permanent_errors (int): Calls that failed with a non-retryable error.
+        exhausted (int): Calls that failed after running out of retries.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.flood_waits = 0
+        self.flood_wait_time = 0.0
+        self.backoff_time = 0.0
+        self.transient_errors = 0
+        self.permanent_errors = 0
+        self.exhausted = 0
+
+    def snapshot(self) -> Dict[str, float]:
+        return dict(vars(self))
+
+
+# Functions -----------------------------------------------------------------------------------------------------------
+api_metrics = ApiMetrics()
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Tells whether a failed call may succeed when repeated.
+
+    Args:
+        error (Exception): The error raised by the call.
+
+    Returns:
+        bool: True for flood limits, server errors and connection problems.
+    """
+    return isinstance(error, (Flood,) + TRANSIENT_ERRORS)
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Returns a "full jitter" exponential backoff delay for a retry attempt.
+
+    Args:
+        attempt (int): The number of the retry, starting at 0.
+
+    Returns:
+        float: Seconds to wait.
+    """
+    return random.uniform(0, min(TG_API_BACKOFF_MAX, TG_API_BACKOFF_BASE * 2**attempt))
+
+
+async def call_api(
+    client: Client,
+    method: Callable[..., Awaitable[Any]],
+    *args,
+    limit_chat_id: Optional[Any] = None,
+    max_retries: int = TG_API_MAX_RETRIES,
+    **kwargs,
+) -> Any:
+    """
+    Calls a Telegram API method through the client's rate limiter, retrying what can be
+    retried.
+
+    A FloodWait (or SlowmodeWait) pauses the client's limiter for the requested time, so
+    every caller sharing the client backs off, then the call is repeated. Server errors and
+    connection problems are retried with jittered exponential backoff. Other RPC errors are
+    permanent and raised immediately.
+
+    Usage:
+        await call_api(client, client.send_message, chat_id=chat_id, text="Hello")
+
+    Args:
+        client (Client): The Pyrogram client making the call.
+        method (Callable[..., Awaitable[Any]]): The coroutine function to call.
+        *args: Positional arguments for the method.
+        limit_chat_id (Optional[Any]): The chat to rate limit against; defaults to the
+            `chat_id` keyword argument.
+        max_retries (int): How many times the call may be repeated.
+        **kwargs: Keyword arguments for the method.
+
+    Returns:
+        Any: The method's result.
+    """
+    chat_id = limit_chat_id if limit_chat_id is not None else kwargs.get("chat_id")
+    limiter = get_rate_limiter(client)
+    name = getattr(method, "__name__", repr(method))
+    api_metrics.calls += 1
+
+    attempt = 0
+    while True:
+        await limiter.acquire(chat_id)
+        try:
+            return await method(*args, **kwargs)
+        except Exception as e:
+            if not is_transient(e):
+                if isinstance(e, RPCError):
+                    api_metrics.permanent_errors += 1
+                raise
+            if attempt >= max_retries:
+                api_metrics.exhausted += 1
+                logger.error(f"{name} failed after {attempt} retries: {e}")
+                raise
+
+            if isinstance(e, Flood):
+                wait = float(e.value or 0)
+                if wait > TG_API_MAX_FLOOD_WAIT:
+                    api_metrics.exhausted += 1
+                    logger.error(f"{name}: FloodWait of {wait}s exceeds the limit")
+                    raise
+                api_metrics.flood_waits += 1
+                api_metrics.flood_wait_time += wait
+                logger.warning(f"{name}: FloodWait {wait}s (chat {chat_id})")
+                # Jitter keeps callers released together from colliding again
+                limiter.pause(wait + random.uniform(0, 1), chat_id)
+            else:
+                delay = backoff_delay(attempt)
+                api_metrics.transient_errors += 1
+                api_metrics.backoff_time += delay
+                logger.warning(f"{name}: {e!r}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+            attempt += 1
+            api_metrics.retries += 1
@@ -14,6 +14,7 @@ import pprint
 from sqlmodel import Field, SQLModel, Session, create_engine
 
 # Local Imports -------------------------------------------------------------------------------------------------------
+from telegram_agent.src.config import llm_stream
 from telegram_agent.src.telegram.config import (
     API_ID,
     API_HASH,
@@ -26,9 +27,18 @@ from telegram_agent.src.models.models import User, Chat, Message, MessageContext
 from telegram_agent.src.telegram.utils import (
     extract_context,
     store_message,
+    store_message_async,
     build_message_context_from_db,
 )
-from telegram_agent.src.telegram.database import get_session, init_db
+from telegram_agent.src.telegram.database import (
+    get_session,
+    get_async_session,
+    init_db,
+)
+from telegram_agent.src.telegram.ingest import get_ingest_queue
+from telegram_agent.src.telegram.api import call_api
+from telegram_agent.src.telegram.streaming import stream_message, split_message_text
+from telegram_agent.src.llm.summary import schedule_topic_summary
 from telegram_agent.src.telegram.bot import TelegramBot, Dispatcher, SimpleTelegramBot
 from telegram_agent.src.models.message.message_base import (
     new_idea_custom_message_processor,
@@ -144,38 +154,34 @@ def run_userbot():
 
 
 async def composed_bots():
-    scaffold_bot = ScaffoldBot(
-        api_id=API_ID,
-        api_hash=API_HASH,
-        bot_token=BOT_TOKEN,
-        bot_name="ScaffoldBot",
+    # The bots sharing the bot token share one connection; the idea bot needs the user account
+    bot_dispatcher = Dispatcher(
+        api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN, name="bot"
+    )
+    bot_dispatcher.register_bot(
+        ScaffoldBot(client=bot_dispatcher.client, bot_name="ScaffoldBot")
+    )
+    bot_dispatcher.register_bot(
+        ConceptBot(client=bot_dispatcher.client, bot_name="ConceptBot")
     )
     idea_bot = IdeaInitBot(
         api_id=API_ID,
         api_hash=API_HASH,
         bot_name="IdeaBot",
     )
-    concepting_bot = ConceptBot(
-        api_id=API_ID,
-        api_hash=API_HASH,
-        bot_token=BOT_TOKEN,
-        bot_name="ConceptBot",
-    )
 
-    bot_list = [scaffold_bot, idea_bot, concepting_bot]
-    await compose(bot_list)
+    await compose([bot_dispatcher, idea_bot])
 
 
 async def dispatch_bot():
-    idea_bot = IdeaInitBot(api_id=API_ID, api_hash=API_HASH)
-    scaffold_bot = ScaffoldBot(api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
+    dispatcher = Dispatcher(api_id=API_ID, api_hash=API_HASH, name="userbot")
 
-    dispatcher = Dispatcher(api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
-
-    dispatcher.register_bot(idea_bot)
-    dispatcher.register_bot(scaffold_bot)
+    dispatcher.register_bot(IdeaInitBot(client=dispatcher.client, bot_name="IdeaBot"))
+    dispatcher.register_bot(
+        ScaffoldBot(client=dispatcher.client, bot_name="ScaffoldBot")
+    )
 
-    await dispatcher.start()
+    await dispatcher.run()
 
 
 def main():
@@ -201,6 +207,10 @@ def get_chat_context(session, parsed_msg):
     return chat_context
 
 
+def chat_context_thread(chat_context):
+    return getattr(chat_context, "message_thread_id", None)
+
+
 def init():
     bot = Client("Test_Bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
     app = Client("NewUserBot", api_id=API_ID, api_hash=API_HASH)
@@ -282,7 +292,7 @@ def init():
         # for msg in history_list:
         #    print(f"\n{msg.message_thread_name} | {msg.user_id}  | {msg.text}\n")
         llm_init = LLMconfig()
-        llm_init_msg = llm_init.init_llm(topic_context=chat_context)
+        llm_init_msg = await llm_init.init_llm(topic_context=chat_context)
         print(f"\n\n\nLLM Obj:\n\n{llm_init_msg}\n\n\n")
 
     @bot.on_message(filters.chat(-1002407722343) & filters.topic(idea_list_topic_int))
@@ -317,7 +327,10 @@ def init():
         parsed_msg, chat_context = await get_msg_and_context(session, message)
 
         await chat_context.refresh_messages_to_db(
-            client=topic_bot.user_tg_client, chat_id=parsed_msg.chat_id, session=session
+            client=topic_bot.user_tg_client,
+            chat_id=parsed_msg.chat_id,
+            session=session,
+            deep=True,
         )
         print(f"    **Done with Refresh**")
         message.stop_propagation()
@@ -328,13 +341,15 @@ def init():
             f"\n---------------------------------------- Summary Response -------------------------------------------------"
         )
         parsed_msg, chat_context = await get_msg_and_context(session, message)
-        history_list = chat_context.get_history()
-        history_text = ""
-        for msg in history_list:
-            msg_context = build_message_context_from_db(session, msg)
-            history_text += f"{msg_context.user.username or msg_context.user.first_name}: {msg_context.text}\n"
+        # Show the stored summaries plus the messages they do not cover yet, and fold the new
+        # messages into the summaries in the background, as /ask does
+        llm_init = LLMconfig()
+        await llm_init.init_llm(topic_context=chat_context)
+        schedule_topic_summary(parsed_msg.chat_id, chat_context_thread(chat_context))
+        history_text = llm_init.window.text
         print(f"\n\n{history_text}\n\n")
-        await message.reply_text(history_text)
+        for part in split_message_text(history_text or "Nothing to summarize yet."):
+            await message.reply_text(part)
         message.stop_propagation()
 
     @bot.on_message(filters.command("ask"))
@@ -346,10 +361,26 @@ def init():
         parsed_msg, chat_context = await get_msg_and_context(session, message)
 
         llm_init = LLMconfig()
-        llm_init_msg = llm_init.init_llm(topic_context=chat_context)
-        response = llm_init.ask(message)
+        llm_init_msg = await llm_init.init_llm(topic_context=chat_context)
+        if not llm_init.goal:
+            logger.error("/ask without a project goal")
+            message.stop_propagation()
+        # Fold the new messages into the topic summary for the next question
+        schedule_topic_summary(parsed_msg.chat_id, chat_context_thread(chat_context))
+        if llm_stream:
+            # Post a placeholder right away and edit it as the response streams in
+            await stream_message(
+                topic_bot.bot_tg_client,
+                parsed_msg.chat_id,
+                llm_init.ask_stream(message),
+                message_thread_id=parsed_msg.message_thread_id,
+            )
+            message.stop_propagation()
+        response = await llm_init.ask_async(message)
         print(f"\n  >>> Returned Response: \n\n{response}\n\n")
-        await topic_bot.bot_tg_client.send_message(
+        await call_api(
+            topic_bot.bot_tg_client,
+            topic_bot.bot_tg_client.send_message,
             chat_id=parsed_msg.chat_id,
             message_thread_id=parsed_msg.message_thread_id,
             text=response,
@@ -360,7 +391,10 @@ def init():
 
     async def get_msg_and_context(session, message):
         parsed_msg = await extract_context(message)
-        store_message(session, parsed_msg)
+        # Commands read the history right away, so wait for the group commit
+        ingest_queue = get_ingest_queue()
+        await ingest_queue.enqueue(parsed_msg)
+        await ingest_queue.flush()
 
         chat_context = get_chat_context(session=session, parsed_msg=parsed_msg)
         return parsed_msg, chat_context
@@ -385,7 +419,14 @@ def init():
             all=True,
         )
 
-    asyncio.run(compose([bot, app]))
+    async def run_clients():
+        try:
+            await compose([bot, app])
+        finally:
+            # The handlers store messages through the write-behind queue; commit what is left
+            await get_ingest_queue().stop()
+
+    asyncio.run(run_clients())
     # app.run()
 
 
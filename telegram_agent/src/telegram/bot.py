@@ -1,16 +1,27 @@
 # bot.py
 
 import asyncio
-from typing import Callable, Optional
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional
 
 from pyrogram import Client, filters, idle
 from pyrogram.handlers import MessageHandler
 from pyrogram.types import Message as PyroMessage, ForumTopic
 from pyrogram.enums import MessageServiceType
 from pyrogram.types import ChatPrivileges
-from telegram_agent.src.telegram.database import get_session, init_db
+from telegram_agent.src.telegram.database import (
+    get_session,
+    get_async_session,
+    init_db,
+)
 from telegram_agent.src.models.models import MessageContext
-from telegram_agent.src.telegram.utils import extract_context, store_message
+from telegram_agent.src.telegram.utils import (
+    extract_context,
+    store_message,
+    store_message_async,
+)
+from telegram_agent.src.telegram.ingest import get_ingest_queue
+from telegram_agent.src.telegram.scheduler import KeyedScheduler, message_key
 
 # Logging -------------------------------------------------------------------------------------------------------------
 from telegram_agent.log.logger import get_logger
@@ -19,72 +30,147 @@ logger = get_logger("TelegramBot")
 
 # Classes -------------------------------------------------------------------------------------------------------------
 
-# Dispatcher:
-# dispatcher.py
 
-from pyrogram import Client
-from pyrogram.handlers import MessageHandler
-from pyrogram import filters
-from typing import List, Callable, Any
-import asyncio
-import logging
+class DispatchMetrics:
+    """
+    Counters describing the updates handled by a Dispatcher.
+
+    Attributes:
+        received (int): Messages received on the shared connection.
+        decode_errors (int): Messages that could not be turned into a MessageContext.
+        dispatched (int): Bot handlers started.
+        processed (Dict[str, int]): Handlers completed, per bot.
+        failed (Dict[str, int]): Handlers that raised, per bot.
+    """
+
+    def __init__(self):
+        self.received = 0
+        self.decode_errors = 0
+        self.dispatched = 0
+        self.processed: Dict[str, int] = defaultdict(int)
+        self.failed: Dict[str, int] = defaultdict(int)
 
-logger = logging.getLogger(__name__)
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "decode_errors": self.decode_errors,
+            "dispatched": self.dispatched,
+            "processed": dict(self.processed),
+            "failed": dict(self.failed),
+        }
 
 
 class Dispatcher:
     """
-    Central dispatcher that receives messages and notifies registered bots.
+    Receives the updates of one Telegram connection and fans them out to registered bots.
+
+    Each message is decoded into a MessageContext and queued for storage once, however many
+    bots are registered, and every bot processes that same context on the shared client.
+    Processing goes through a KeyedScheduler: the messages of a chat topic are handled in
+    order, different topics in parallel, and a full queue holds back Pyrogram's update
+    workers (with the default "block" policy). A failing bot is logged and counted without
+    affecting the others.
 
     Args:
         api_id (int): Telegram API ID.
         api_hash (str): Telegram API Hash.
-        bot_token (str): Bot token for authentication.
+        bot_token (Optional[str]): Bot token for authentication; a user account is used without it.
+        name (str): The session name of the shared client.
+        client (Optional[Client]): An existing client to share instead of creating one.
+        scheduler (Optional[KeyedScheduler]): The scheduler processing messages; one with the
+            configured workers, queue size and overflow policy is created by default.
     """
 
-    def __init__(self, api_id: int, api_hash: str, bot_token: str):
-        # self.client = Client(
-        #    "dispatcher_bot", api_id=api_id, api_hash=api_hash, bot_token=bot_token
-        # )
-        self.dispatcher_client = Client(
-            "user_dispatcher_bot", api_id=api_id, api_hash=api_hash
+    def __init__(
+        self,
+        api_id: Optional[int] = None,
+        api_hash: Optional[str] = None,
+        bot_token: Optional[str] = None,
+        name: str = "dispatcher",
+        client: Optional[Client] = None,
+        scheduler: Optional[KeyedScheduler] = None,
+    ):
+        # Registered bots share this client and leave database setup to the dispatcher
+        init_db()
+        self.client = client or Client(
+            name, api_id=api_id, api_hash=api_hash, bot_token=bot_token
         )
+        self.client.add_handler(MessageHandler(self.message_handler, filters.all))
         self.bots: List["TelegramBot"] = []  # List of registered bots
+        self.ingest_queue = get_ingest_queue()
+        self.scheduler = scheduler or KeyedScheduler(name=f"{name} scheduler")
+        self.metrics = DispatchMetrics()
 
     def register_bot(self, bot: "TelegramBot"):
         """
-        Registers a bot with the dispatcher.
+        Registers a bot with the dispatcher. The bot processes messages on the dispatcher's
+        client; its own client is never started.
 
         Args:
-            bot (BaseBot): The bot instance to register.
+            bot (TelegramBot): The bot instance to register.
         """
         self.bots.append(bot)
-        logger.info(f"Registered bot: {bot.__class__.__name__}")
+        logger.info(f"Registered bot: {bot.bot_name} ({bot.__class__.__name__})")
 
     async def start(self):
         """
-        Starts the dispatcher and the client.
+        Starts the shared client, the ingest writer and the scheduler workers.
         """
-        await self.dispatcher_client.start()
-        self.dispatcher_client.add_handler(
-            MessageHandler(self.message_handler, filters.all)
-        )
-        logger.info("Dispatcher started.")
-        await idle()  # Keeps the program running
+        await self.client.start()
+        self.ingest_queue.start()
+        self.scheduler.start()
+        logger.info(f"Dispatcher started with {len(self.bots)} bots.")
 
-    async def message_handler(self, client: Client, message):  # client: Client
+    async def stop(self):
+        """
+        Processes the queued messages, releases the shared ingest queue (flushed and stopped
+        by its last user) and stops the shared client.
         """
-        Handles incoming messages and notifies registered bots.
+        await self.scheduler.stop()
+        await self.ingest_queue.stop()
+        await self.client.stop()
+        logger.info(f"Dispatcher stopped. Metrics: {self.metrics.snapshot()}")
 
-        Args:
-            client (Client): The Pyrogram client.
-            message: The received message.
+    async def run(self):
         """
+        Starts the dispatcher, runs until interrupted, then stops it.
+        """
+        await self.start()
+        try:
+            await idle()
+        finally:
+            await self.stop()
 
-        logger.debug(f"Dispatcher received message: {message}")
-        # Notify all registered bots
-        for bot in self.bots:
-            asyncio.create_task(bot.process_message(message))
+    async def message_handler(self, client: Client, message: PyroMessage):
+        """
+        Decodes and stores an incoming message once, then schedules the registered bots on it.
+
+        Args:
+            client (Client): The shared Pyrogram client.
+            message (PyroMessage): The received message.
+        """
+        self.metrics.received += 1
+        try:
+            context = await extract_context(message)
+        except Exception as e:
+            self.metrics.decode_errors += 1
+            logger.error(f"Could not decode message {message.id}: {e}")
+            return
+        await self.ingest_queue.enqueue(context)
+        await self.scheduler.submit(message_key(context), self._dispatch, context)
+
+    async def _dispatch(self, context: MessageContext):
+        # The bots handle a message side by side; the topic's next message waits for all of them
+        await asyncio.gather(*(self._process(bot, context) for bot in self.bots))
+
+    async def _process(self, bot: "TelegramBot", context: MessageContext):
+        self.metrics.dispatched += 1
+        try:
+            await bot.process_context(context, client=self.client)
+            self.metrics.processed[bot.bot_name] += 1
+        except Exception as e:
+            self.metrics.failed[bot.bot_name] += 1
+            logger.exception(f"{bot.bot_name} failed on message {context.msg_id}: {e}")
 
 
 class SimpleTelegramBot:
@@ -128,21 +214,36 @@ class TelegramBot:
         api_hash (str): The API hash from Telegram.
         bot_token (Optional[str]): The bot token if using a bot account.
         message_processor (Optional[Callable[[Client, MessageContext], None]]): The message processor function.
+        bot_name (Optional[str]): The session name of the bot's client.
+        client (Optional[Client]): An existing client to use instead of creating one, e.g. a
+            Dispatcher's shared client. Its owner receives the updates, schedules them and
+            initializes the database, so the bot does neither.
+        scheduler (Optional[KeyedScheduler]): The scheduler running the message processor,
+            in order per chat topic; a default one is created for a bot with its own client.
     """
 
     def __init__(
         self,
-        api_id: int,
-        api_hash: str,
+        api_id: Optional[int] = None,
+        api_hash: Optional[str] = None,
         bot_token: Optional[str] = None,
         message_processor: Optional[Callable[[Client, MessageContext], None]] = None,
         bot_name: Optional[str] = None,
+        client: Optional[Client] = None,
+        scheduler: Optional[KeyedScheduler] = None,
     ):
-        init_db()
+        if client is None:
+            init_db()
         self.session_factory = get_session
+        self.async_session_factory = get_async_session
+        self.ingest_queue = get_ingest_queue()
         self.message_processor = message_processor or self.default_message_processor
         # self.logger = get_logger(self.__class__.__name__)
-        if bot_token:
+        if client:
+            # Shared client: whoever owns it receives the updates and calls process_context
+            self.bot_name = bot_name or client.name
+            self.client = client
+        elif bot_token:
             if bot_name:
                 self.bot_name = bot_name
             else:
@@ -160,17 +261,31 @@ class TelegramBot:
             self.client = Client(self.bot_name, api_id=api_id, api_hash=api_hash)
             self.client.add_handler(MessageHandler(self.message_handler, filters.all))
 
-        self.logger = get_logger(self.client.name)
+        self.logger = get_logger(self.bot_name)
+        if client is None:
+            self.scheduler = scheduler or KeyedScheduler(name=f"{self.bot_name} scheduler")
+        else:
+            self.scheduler = scheduler
 
         self.logger.info(
-            f"{self.client.name} | Initialized Telegram bot with message processor: {message_processor}"
+            f"{self.bot_name} | Initialized Telegram bot with message processor: {message_processor}"
         )
 
     def run(self):
         """
-        Starts the bot.
+        Runs the bot until interrupted (see `serve`) on the client's event loop.
+        """
+        self.client.run(self.serve())
+
+    async def serve(self):
+        """
+        Starts the bot, runs until interrupted, then stops it, storing the queued messages.
         """
-        self.client.run()
+        await self.start()
+        try:
+            await idle()
+        finally:
+            await self.stop()
 
     def init_bot(self):
         async def set_priv():
@@ -231,20 +346,33 @@ class TelegramBot:
             )
             # return
         """
-        context = extract_context(message)
+        context = await extract_context(message)
         self.logger.info(f"{self.client.name} | Extracted context: \n\n{context}\n")
         print(f"\n{self.client.name} | Received message: {context.text}\n")
+        # Queue the message for storage; processors only handle it
+        await self.ingest_queue.enqueue(context)
+        await self.scheduler.submit(message_key(context), self.process_context, context)
+
+    async def process_context(
+        self, context: MessageContext, client: Optional[Client] = None
+    ):
+        """
+        Runs the message processor on a decoded message.
+
+        Args:
+            context (MessageContext): The message context.
+            client (Optional[Client]): The client to process with; defaults to the bot's own.
+        """
+        client = client or self.client
         # Ensure asynchronous processing
         if asyncio.iscoroutinefunction(self.message_processor):
-            self.logger.info(f"{self.client.name} | IsCoroutine!")
-            await self.message_processor(self.client, context)
+            self.logger.debug(f"{self.bot_name} | IsCoroutine!")
+            await self.message_processor(client, context)
         else:
-            self.logger.info(f"{self.client.name} | Is not Coroutine.")
+            self.logger.debug(f"{self.bot_name} | Is not Coroutine.")
             # Run synchronous message processor in an executor
             loop = asyncio.get_running_loop()
-            await loop.run_in_executor(
-                None, self.message_processor, self.client, context
-            )
+            await loop.run_in_executor(None, self.message_processor, client, context)
 
     async def default_message_processor(self, client: Client, context: MessageContext):
         """
@@ -254,13 +382,8 @@ class TelegramBot:
             client (Client): The Pyrogram client.
             context (MessageContext): The message context.
         """
-        # Store the message
-        with self.session_factory() as session:
-            # from .utils import store_message
-            store_message(session, context)
-
         # Send a message in the appropriate context
-        await self.client.send_message(
+        await client.send_message(
             chat_id=context.chat_id,
             text=f"Echo: {context.text}",
             message_thread_id=context.message_thread_id,  # Reply in the same forum topic if applicable
@@ -300,6 +423,9 @@ class TelegramBot:
         Starts the bot by starting the underlying Pyrogram client.
         """
         await self.client.start()
+        self.ingest_queue.start()
+        if self.scheduler:
+            self.scheduler.start()
         # if self.client.name != "userbot":
         #    result = await self.client.set_bot_default_privileges(
         #        ChatPrivileges(
@@ -318,8 +444,12 @@ class TelegramBot:
 
     async def stop(self):
         """
-        Stops the bot by stopping the underlying Pyrogram client.
+        Stops the bot by processing its queued messages, releasing the shared ingest queue
+        (flushed and stopped by its last user) and stopping the underlying Pyrogram client.
         """
+        if self.scheduler:
+            await self.scheduler.stop()
+        await self.ingest_queue.stop()
         await self.client.stop()
 
     # To make start and stop methods available as instance methods
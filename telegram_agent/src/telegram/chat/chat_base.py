@@ -1,14 +1,55 @@
 # Imports
-from typing import List, Optional
+from datetime import datetime, timedelta
+from typing import AsyncIterator, List, Optional, Tuple
 from pydantic import BaseModel, PrivateAttr
-from sqlmodel import Session
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload
+from sqlmodel import Session, select
 from pyrogram.types import Message as PyroMessage
 from pyrogram import Client
 import re
 
 # Library Imports -----------------------------------------------------------------------------------------------------
-from telegram_agent.src.telegram.utils import extract_context, store_message
-from telegram_agent.src.models.models import Message
+from telegram_agent.src.telegram.utils import (
+    extract_context,
+    store_message,
+    build_message_context_from_db,
+    bulk_sync_messages,
+    get_sync_cursor,
+    advance_sync_cursor,
+)
+from telegram_agent.src.models.models import ChatConfig, Message, MessageContext
+from telegram_agent.src.telegram.database import get_async_session
+from telegram_agent.src.telegram.search import search_messages
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("ChatContext")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+# How often an incremental refresh is upgraded to a full reconcile that catches edits and deletions
+DEEP_RECONCILE_INTERVAL = timedelta(hours=6)
+HISTORY_PAGE_SIZE = 500
+
+
+# Functions -----------------------------------------------------------------------------------------------------------
+def _after_key(query, after: Optional[Tuple[datetime, int]]):
+    if after is None:
+        return query
+    date, message_id = after
+    return query.where(
+        or_(Message.date > date, and_(Message.date == date, Message.id > message_id))
+    )
+
+
+def _before_key(query, before: Optional[Tuple[datetime, int]]):
+    if before is None:
+        return query
+    date, message_id = before
+    return query.where(
+        or_(Message.date < date, and_(Message.date == date, Message.id < message_id))
+    )
 
 
 class ChatContext(BaseModel):
@@ -18,146 +59,283 @@ class ChatContext(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
-    def get_history(self, all: Optional[bool] = False) -> List[Message]:
+    def _history_conditions(
+        self, all: Optional[bool] = False, since: Optional[datetime] = None
+    ) -> list:
         thread_id = getattr(self, "message_thread_id", None)
+        conditions = [Message.chat_id == self.chat_id, Message.deleted == False]
+        if not all and thread_id is not None:
+            conditions.append(Message.message_thread_id == thread_id)
+        if since is not None:
+            conditions.append(Message.date >= since)
+        return conditions
 
-        if all or thread_id is None:
-            # print(f"Getting History for Everything")
-            messages = (
-                self.session.query(Message)
-                .filter(Message.chat_id == self.chat_id, Message.deleted == False)
-                .order_by(Message.date)
-                .distinct(Message.msg_id)
-                .all()
-                # .unique()
+    def _history_query(
+        self, all: Optional[bool] = False, since: Optional[datetime] = None
+    ):
+        # Sender and chat are joined into the same query to avoid per-message lookups
+        return (
+            select(Message)
+            .options(joinedload(Message.user), joinedload(Message.chat))
+            .where(*self._history_conditions(all, since))
+        )
+
+    def get_history(
+        self,
+        all: Optional[bool] = False,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+    ) -> List[Message]:
+        """
+        Returns the stored, non-deleted messages of the chat (or topic), oldest first.
+
+        Args:
+            all (Optional[bool]): Include every topic of the chat.
+            limit (Optional[int]): Only return the most recent `limit` messages.
+            since (Optional[datetime]): Only return messages sent at or after this date.
+
+        Returns:
+            List[Message]: The messages in chronological order.
+        """
+        query = self._history_query(all, since)
+        if limit is None:
+            return list(self.session.exec(query.order_by(Message.date, Message.id)))
+        recent = self.session.exec(
+            query.order_by(Message.date.desc(), Message.id.desc()).limit(limit)
+        )
+        return list(reversed(recent.all()))
+
+    def get_history_contexts(
+        self,
+        all: Optional[bool] = False,
+        limit: Optional[int] = None,
+        since: Optional[datetime] = None,
+    ) -> List[MessageContext]:
+        """
+        Returns the history as fully-populated MessageContext objects, fetched together with
+        their users and chats in a single joined query.
+
+        Args:
+            all (Optional[bool]): Include every topic of the chat.
+            limit (Optional[int]): Only return the most recent `limit` messages.
+            since (Optional[datetime]): Only return messages sent at or after this date.
+
+        Returns:
+            List[MessageContext]: The message contexts in chronological order.
+        """
+        return [
+            build_message_context_from_db(self.session, message)
+            for message in self.get_history(all, limit=limit, since=since)
+        ]
+
+    def get_history_page(
+        self,
+        all: Optional[bool] = False,
+        after: Optional[Tuple[datetime, int]] = None,
+        page_size: int = HISTORY_PAGE_SIZE,
+        since: Optional[datetime] = None,
+    ) -> List[Message]:
+        """
+        Returns one page of history using keyset pagination on (date, id).
+
+        Args:
+            all (Optional[bool]): Include every topic of the chat.
+            after (Optional[Tuple[datetime, int]]): The (date, id) of the last message of the
+                previous page, or None for the first page.
+            page_size (int): The maximum number of messages to return.
+            since (Optional[datetime]): Only return messages sent at or after this date.
+
+        Returns:
+            List[Message]: Up to `page_size` messages in chronological order.
+        """
+        query = _after_key(self._history_query(all, since), after)
+        return list(
+            self.session.exec(
+                query.order_by(Message.date, Message.id).limit(page_size)
             )
-            # print(f"   Found {len(messages)} messages")
+        )
+
+    async def iter_history(
+        self,
+        all: Optional[bool] = False,
+        page_size: int = HISTORY_PAGE_SIZE,
+        since: Optional[datetime] = None,
+        limit: Optional[int] = None,
+        newest_first: bool = False,
+    ) -> AsyncIterator[Message]:
+        """
+        Streams the history oldest first, fetching one keyset page at a time through an
+        async session so that arbitrarily long histories use bounded memory and never block
+        the event loop.
+
+        Args:
+            all (Optional[bool]): Include every topic of the chat.
+            page_size (int): The number of messages fetched per query.
+            since (Optional[datetime]): Only yield messages sent at or after this date.
+            limit (Optional[int]): Stop after yielding this many messages.
+            newest_first (bool): Stream newest first instead, so callers that only need the
+                latest messages can stop early without loading the rest.
+
+        Yields:
+            Message: The next message in chronological (or reverse) order.
+        """
+        if newest_first:
+            page_key = _before_key
+            order = (Message.date.desc(), Message.id.desc())
         else:
-            # print(f"Getting History for Thread")
-            messages = (
-                self.session.query(Message)
-                .filter(
-                    Message.chat_id == self.chat_id,
-                    Message.message_thread_id == thread_id,
-                    Message.deleted == False,
-                )
-                .order_by(Message.date)
-                .distinct(Message.msg_id)
-                .all()
-                # .unique()
-            )
-            # print(f"   Found {len(messages)} messages")
-        return messages
+            page_key = _after_key
+            order = (Message.date, Message.id)
+        key = None
+        remaining = limit
+        async with get_async_session() as session:
+            while remaining is None or remaining > 0:
+                size = page_size if remaining is None else min(page_size, remaining)
+                query = page_key(self._history_query(all, since), key)
+                result = await session.exec(query.order_by(*order).limit(size))
+                page = result.all()
+                for message in page:
+                    yield message
+                if len(page) < size:
+                    return
+                key = (page[-1].date, page[-1].id)
+                if remaining is not None:
+                    remaining -= len(page)
 
-    async def get_all_messages(self, client, all: bool = False) -> List[PyroMessage]:
+    async def get_all_messages(
+        self, client, all: bool = False, min_msg_id: int = 0
+    ) -> List[PyroMessage]:
         """
         Retrieve messages from the specified chat and topic.
+
+        Args:
+            client (Client): The Pyrogram client.
+            all (bool): Retrieve the whole chat instead of the current topic.
+            min_msg_id (int): Only retrieve messages with an ID greater than this watermark.
         """
         message_list = []
         thread_id = getattr(self, "message_thread_id", None)
         if self.chat_id and thread_id and not all:
             # print(f"Get All Messages - Topic")
             all_messages = client.get_discussion_replies(self.chat_id, thread_id)
-            async for msg in all_messages:
-                # sleep(0.25)
-                if msg.text:
-                    message_list.append(msg)
-
         elif self.chat_id:
             # print(f"Get All Messages - No Topic")
-            all_messages = client.get_chat_history(self.chat_id)
-            async for msg in all_messages:
-                # sleep(0.25)
-                if msg.text:
-                    message_list.append(msg)
+            all_messages = client.get_chat_history(self.chat_id, min_id=min_msg_id)
+        else:
+            return message_list
+
+        # Both iterators return the newest messages first
+        async for msg in all_messages:
+            if msg.id <= min_msg_id:
+                break
+            if msg.text:
+                message_list.append(msg)
         return message_list
 
     async def refresh_messages_to_db(
-        self, client: Client, chat_id: int, session: Session, all: bool = False
+        self,
+        client: Client,
+        chat_id: int,
+        session: Session,
+        all: bool = False,
+        deep: bool = False,
     ):
         """
         Fetch messages from the specified chat and synchronize them with the database.
-        For each message:
-        - If it doesn't exist in the database, add it.
-        - If it exists, compare the fields and update if necessary.
+
+        By default only messages newer than the persisted sync cursor of the chat (or of the
+        topic, unless `all` is set) are fetched and stored. A deep reconcile re-reads the
+        whole history of the same scope and diffs it against the database in bulk:
+        - Messages that don't exist in the database are inserted.
+        - Messages whose fields changed are updated.
+        - Stored messages that are no longer in the chat are marked as deleted.
+
+        A deep reconcile runs when `deep` is set, when the scope has never been synchronized,
+        or when the last one is older than DEEP_RECONCILE_INTERVAL.
         """
-        # print(f"\n  - Refreshing DB\n")
-        # Fetch all existing messages from the database for the given chat
-        existing_messages = self.get_history(
-            all
-        )  # Create a dictionary mapping msg_id to Message objects for quick lookup
+        thread_id = None if all else getattr(self, "message_thread_id", None)
+        cursor = get_sync_cursor(session, chat_id, thread_id)
+        deep = (
+            deep
+            or cursor.last_reconciled is None
+            or datetime.now() - cursor.last_reconciled > DEEP_RECONCILE_INTERVAL
+        )
 
-        existing_messages_dict = {
-            message.msg_id: message for message in existing_messages
-        }
-        msg_list = await self.get_all_messages(client, all=True)
-        # print(
-        #    f"Refreshing DB messages - Msg Count - DB/Chat | {len(existing_messages)}/{len(msg_list)}"
-        # )
-        messages_in_chat = {}
-        for msg in msg_list:
-            messages_in_chat[msg.id] = msg
-        # Process messages in the chat
-        for msg_id, msg in messages_in_chat.items():
-            # Extract message context
-            context = await extract_context(msg)
-            # Check if the message exists in the database
-            existing_message = existing_messages_dict.get(context.msg_id)
-            if not existing_message:
-                # Message doesn't exist, so add it
-                store_message(session, context)
-            else:
-                # Message exists, compare fields and update if necessary
-                needs_update = False
-                fields_to_compare = [
-                    "user_id",
-                    "chat_type",
-                    "chat_title",
-                    "message_thread_id",
-                    "message_thread_name",
-                    "date",
-                    "text",
-                    "deleted",
-                ]
-                for field in fields_to_compare:
-                    db_value = getattr(existing_message, field)
-                    new_value = getattr(context, field)
-                    if db_value != new_value:
-                        setattr(existing_message, field, new_value)
-                        needs_update = True
-                if needs_update:
-                    session.add(existing_message)
-                    session.commit()
-            ## Ensure the message is marked as not deleted
-            # existing_messages_dict[msg_id].deleted = False
-
-        # Identify messages in the database that are no longer in the chat
-        chat_msg_ids = set(messages_in_chat.keys())
-        db_msg_ids = set(existing_messages_dict.keys())
-        deleted_msg_ids = db_msg_ids - chat_msg_ids
-
-        for msg_id in deleted_msg_ids:
-            message = existing_messages_dict[msg_id]
-            if not message.deleted:
-                message.deleted = True
-                session.add(message)
-                session.commit()
-
-    def search(self, pattern: str, all: Optional[bool] = False) -> List[Message]:
-        # print(f"Searching for: {pattern}")
-        messages = self.get_history(all)
+        if deep:
+            msg_list = await self.get_all_messages(client, all=all)
+        else:
+            msg_list = await self.get_all_messages(
+                client, all=all, min_msg_id=cursor.last_msg_id
+            )
+        contexts = [await extract_context(msg) for msg in msg_list]
+
+        counts = bulk_sync_messages(
+            session,
+            chat_id,
+            contexts,
+            message_thread_id=thread_id,
+            soft_delete=deep,
+        )
+
+        advance_sync_cursor(
+            session,
+            cursor,
+            last_msg_id=max((msg.id for msg in msg_list), default=None),
+            reconciled=deep,
+        )
+        session.commit()
+        logger.info(
+            f"Refreshed chat {chat_id} (thread {thread_id}, deep={deep}): {counts}"
+        )
+        return counts
+
+    def search(
+        self,
+        query: str,
+        all: Optional[bool] = False,
+        prefix: bool = False,
+        phrase: bool = False,
+        limit: Optional[int] = None,
+    ) -> List[Message]:
+        """
+        Searches the chat (or topic) history through the full-text index.
+
+        Args:
+            query (str): The words to search for; all of them must match.
+            all (Optional[bool]): Search every topic of the chat.
+            prefix (bool): Match words as prefixes.
+            phrase (bool): Match the words as one contiguous phrase.
+            limit (Optional[int]): The maximum number of messages to return.
+
+        Returns:
+            List[Message]: The matching messages in chronological order.
+        """
+        thread_id = None if all else getattr(self, "message_thread_id", None)
+        return search_messages(
+            self.session,
+            self.chat_id,
+            query,
+            message_thread_id=thread_id,
+            prefix=prefix,
+            phrase=phrase,
+            limit=limit,
+        )
+
+    def search_regex(self, pattern: str, all: Optional[bool] = False) -> List[Message]:
+        """
+        Searches the history with a regular expression. Unlike `search`, this scans every
+        message of the chat (or topic).
+
+        Args:
+            pattern (str): The regular expression to search for.
+            all (Optional[bool]): Search every topic of the chat.
+
+        Returns:
+            List[Message]: The matching messages in chronological order.
+        """
         regex = re.compile(pattern)
-        matching_messages = [
-            msg for msg in messages if msg.text and regex.search(msg.text)
+        return [
+            msg for msg in self.get_history(all) if msg.text and regex.search(msg.text)
         ]
-        msg_id = None
-        return_messages = []
-        for msg in matching_messages:
-            if msg.msg_id != msg_id:
-                msg_id = msg.msg_id
-                # print(f"  >>> Search found: {msg.text}")
-                return_messages.append(msg)
-        return return_messages
 
     def get_goal(self): ...
 
@@ -167,14 +345,65 @@ class ChatContext(BaseModel):
         """
         Searches for configuration messages in the chat history that match the given label.
 
+        Configuration labels are parsed when messages are stored, so this is an indexed
+        lookup rather than a scan of the history.
+
         Args:
             label (str): The label inside the square brackets to search for.
 
         Returns:
             List[Message]: A list of messages that match the label.
         """
-        pattern = rf"^\[{label}\](.*)"
-        return self.search(pattern, all)
+        query = self._history_query(all).where(Message.config_label == label)
+        return list(self.session.exec(query.order_by(Message.date, Message.id)))
+
+    def get_config(self, label: str, all: Optional[bool] = False) -> Optional[ChatConfig]:
+        """
+        Returns the latest configuration message for a label from the ChatConfig table,
+        which the storage path keeps current on every insert, edit and delete.
+
+        Args:
+            label (str): The label inside the square brackets, e.g. "Goal".
+            all (Optional[bool]): Take the latest value across the whole chat instead of
+                the current topic.
+
+        Returns:
+            Optional[ChatConfig]: The configuration entry, or None if the label is not set.
+        """
+        if all:
+            return self.session.exec(self._config_query(label)).first()
+        thread_id = getattr(self, "message_thread_id", None) or 0
+        return self.session.get(ChatConfig, (self.chat_id, thread_id, label))
+
+    async def get_config_async(
+        self, label: str, all: Optional[bool] = False
+    ) -> Optional[ChatConfig]:
+        """
+        Like `get_config`, but reads through an async session so the event loop is not
+        blocked.
+
+        Args:
+            label (str): The label inside the square brackets, e.g. "Goal".
+            all (Optional[bool]): Take the latest value across the whole chat instead of
+                the current topic.
+
+        Returns:
+            Optional[ChatConfig]: The configuration entry, or None if the label is not set.
+        """
+        async with get_async_session() as session:
+            if all:
+                return (await session.exec(self._config_query(label))).first()
+            thread_id = getattr(self, "message_thread_id", None) or 0
+            return await session.get(ChatConfig, (self.chat_id, thread_id, label))
+
+    def _config_query(self, label: str):
+        # The latest value of a label across every topic of the chat
+        return (
+            select(ChatConfig)
+            .where(ChatConfig.chat_id == self.chat_id, ChatConfig.label == label)
+            .order_by(ChatConfig.date.desc())
+            .limit(1)
+        )
 
     def init_prompt(self):
         pass
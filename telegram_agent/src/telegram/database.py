@@ -1,16 +1,260 @@
 # database.py
 
+from typing import Optional, Tuple
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlmodel import SQLModel, Session, create_engine
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from telegram_agent.src.models.models import ChatConfig, Message
+from telegram_agent.src.telegram.search import init_search_index, parse_config_label
+from telegram_agent.src.telegram.utils import rebuild_chat_config
+from telegram_agent.src.telegram.config import (
+    DATABASE_URL as CONFIGURED_DATABASE_URL,
+    ASYNC_DATABASE_URL as CONFIGURED_ASYNC_DATABASE_URL,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_CACHE_SIZE_KB,
+    SQLITE_MMAP_SIZE,
+    SQLITE_BUSY_TIMEOUT_MS,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE_S,
+)
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("Database")
+
+# Sync and async drivers used for each supported backend
+SYNC_DRIVERS = {"sqlite": "sqlite", "postgresql": "postgresql+psycopg"}
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+psycopg"}
+
+# Applied to every new SQLite connection. WAL lets readers proceed while the ingest writer
+# commits, and NORMAL synchronous is durable in WAL mode except across power loss.
+SQLITE_PRAGMAS = {
+    "journal_mode": SQLITE_JOURNAL_MODE,
+    "synchronous": SQLITE_SYNCHRONOUS,
+    "cache_size": -SQLITE_CACHE_SIZE_KB,
+    "mmap_size": SQLITE_MMAP_SIZE,
+    "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    "temp_store": "MEMORY",
+}
+
+_schema_initialized = False
+
+
+# Functions -----------------------------------------------------------------------------------------------------------
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {pragma}={value}")
+    cursor.close()
+
+
+def _is_memory_database(url: str) -> bool:
+    parsed = make_url(url)
+    return parsed.get_backend_name() == "sqlite" and (
+        parsed.database in (None, "", ":memory:")
+        or parsed.query.get("mode") == "memory"
+    )
+
+
+def _with_driver(url: str, drivers: dict) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in drivers:
+        raise ValueError(
+            f"Unsupported database backend '{backend}'. Supported: {list(drivers)}"
+        )
+    if _is_memory_database(url):
+        # A named shared-cache database, so sync and async connections see the same data
+        parsed = parsed.set(
+            database="file:telegram_agent",
+            query={"mode": "memory", "cache": "shared", "uri": "true"},
+        )
+    return parsed.set(drivername=drivers[backend]).render_as_string(
+        hide_password=False
+    )
+
+
+def resolve_database_urls(
+    url: str = CONFIGURED_DATABASE_URL,
+    async_url: Optional[str] = CONFIGURED_ASYNC_DATABASE_URL,
+) -> Tuple[str, str]:
+    """
+    Resolves the sync and async URLs for the configured database, picking a driver for
+    each backend (psycopg for PostgreSQL, aiosqlite for async SQLite) unless the URL
+    names one explicitly.
+
+    An in-memory SQLite URL ("sqlite://") is mapped to a shared-cache in-memory database
+    that both engines can see, which makes a convenient throwaway stand-in for a server.
+
+    Args:
+        url (str): The configured database URL.
+        async_url (Optional[str]): An explicit async URL, derived from `url` if omitted.
+
+    Returns:
+        Tuple[str, str]: The sync and async database URLs.
+    """
+    has_driver = "+" in make_url(url).drivername
+    sync_url = url if has_driver else _with_driver(url, SYNC_DRIVERS)
+    return sync_url, async_url or _with_driver(url, ASYNC_DRIVERS)
+
+
+def _engine_options(url: str) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        if _is_memory_database(url):
+            return {}
+        return {"pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": True,
+        "pool_recycle": DB_POOL_RECYCLE_S,
+    }
+
+
+def create_db_engine(url: str = None, **kwargs):
+    """
+    Creates a pooled database engine, applying the SQLite tuning profile when the URL
+    points at a SQLite database.
+
+    Args:
+        url (str): The database URL. Defaults to the configured DATABASE_URL.
+        **kwargs: Additional keyword arguments for create_engine.
+
+    Returns:
+        Engine: The configured engine.
+    """
+    url = url or DATABASE_URL
+    new_engine = create_engine(url, echo=False, **{**_engine_options(url), **kwargs})
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+    return new_engine
 
-DATABASE_URL = "sqlite:///database.db"
-engine = create_engine(DATABASE_URL, echo=False)
+
+def create_async_db_engine(url: str = None, **kwargs):
+    """
+    Creates a pooled async database engine, applying the SQLite tuning profile when the
+    URL points at a SQLite database.
+
+    Args:
+        url (str): The async database URL. Defaults to the configured async URL.
+        **kwargs: Additional keyword arguments for create_async_engine.
+
+    Returns:
+        AsyncEngine: The configured async engine.
+    """
+    url = url or ASYNC_DATABASE_URL
+    new_engine = create_async_engine(
+        url, echo=False, **{**_engine_options(url), **kwargs}
+    )
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+    return new_engine
+
+
+# Engines -------------------------------------------------------------------------------------------------------------
+DATABASE_URL, ASYNC_DATABASE_URL = resolve_database_urls()
+
+# Shared by every bot in the process
+engine = create_db_engine()
+async_engine = create_async_db_engine()
+async_session_factory = async_sessionmaker(
+    async_engine, class_=AsyncSession, expire_on_commit=False
+)
+
+
+def migrate_db(conn):
+    """
+    Upgrades an existing database to the current schema.
+
+    `create_all` only creates missing tables, so indexes added to existing tables are
+    created here, along with columns added since (back-filled from existing rows). Before
+    the unique (chat_id, msg_id) index is built, duplicate messages left by older versions
+    are removed, keeping the most recently stored row.
+
+    Args:
+        conn (Connection): An open connection inside a transaction.
+    """
+    inspector = inspect(conn)
+    if not inspector.has_table(Message.__tablename__):
+        return
+
+    columns = {column["name"] for column in inspector.get_columns(Message.__tablename__)}
+    if "config_label" not in columns:
+        conn.execute(text("ALTER TABLE message ADD COLUMN config_label VARCHAR"))
+        rows = conn.execute(
+            text("SELECT id, text FROM message WHERE text LIKE '[%'")
+        ).all()
+        labels = [
+            {"id": row.id, "label": parse_config_label(row.text)} for row in rows
+        ]
+        labels = [label for label in labels if label["label"]]
+        if labels:
+            conn.execute(
+                text("UPDATE message SET config_label = :label WHERE id = :id"), labels
+            )
+        logger.info(f"Added config_label column ({len(labels)} configuration messages)")
+
+    existing = {index["name"] for index in inspector.get_indexes(Message.__tablename__)}
+    for index in Message.__table__.indexes:
+        if index.name in existing:
+            continue
+        if index.unique:
+            result = conn.execute(
+                text(
+                    "DELETE FROM message WHERE id NOT IN "
+                    "(SELECT MAX(id) FROM message GROUP BY chat_id, msg_id)"
+                )
+            )
+            logger.info(f"Removed {result.rowcount} duplicate messages")
+        index.create(conn)
+        logger.info(f"Created index {index.name}")
+
+
+def _init_schema(conn):
+    migrate_db(conn)
+    populate_chat_config = inspect(conn).has_table(
+        Message.__tablename__
+    ) and not inspect(conn).has_table(ChatConfig.__tablename__)
+    SQLModel.metadata.create_all(conn)
+    init_search_index(conn)
+    if populate_chat_config:
+        with Session(bind=conn) as session:
+            rebuild_chat_config(session)
+            session.flush()
 
 
 def init_db():
     """
-    Initializes the database by creating all tables.
+    Initializes the database by migrating existing tables and creating missing ones.
+    Runs once per process; later calls return immediately.
+    """
+    global _schema_initialized
+    if _schema_initialized:
+        return
+    with engine.begin() as conn:
+        _init_schema(conn)
+    _schema_initialized = True
+
+
+async def init_async_db():
+    """
+    Initializes the database by migrating existing tables and creating missing ones, without
+    blocking the event loop. Runs once per process; later calls return immediately.
     """
-    SQLModel.metadata.create_all(engine)
+    global _schema_initialized
+    if _schema_initialized:
+        return
+    async with async_engine.begin() as conn:
+        await conn.run_sync(_init_schema)
+    _schema_initialized = True
 
 
 def get_session():
@@ -21,3 +265,17 @@ def get_session():
         Session: A new SQLModel session.
     """
     return Session(engine)
+
+
+def get_async_session():
+    """
+    Creates a new asynchronous database session.
+
+    Usage:
+        async with get_async_session() as session:
+            await store_message_async(session, context)
+
+    Returns:
+        AsyncSession: A new SQLModel async session.
+    """
+    return async_session_factory()
@@ -0,0 +1,310 @@
+# ingest.py
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from telegram_agent.src.models.models import MessageContext
+from telegram_agent.src.telegram.database import get_async_session
+from telegram_agent.src.telegram.utils import store_messages_async
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("MessageIngest")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_FLUSH_INTERVAL_MS = 250
+DEFAULT_MAX_QUEUE_SIZE = 10_000
+# Attempts at committing a whole batch before it is split to isolate bad rows
+DEFAULT_COMMIT_RETRIES = 3
+DEFAULT_RETRY_BACKOFF_MS = 100
+# Queued by the last `stop()` so the writer exits after committing what is ahead of it
+_STOP = object()
+
+# Classes -------------------------------------------------------------------------------------------------------------
+
+
+class IngestMetrics:
+    """
+    Counters describing the state of a MessageIngestQueue.
+
+    Attributes:
+        enqueued (int): Total number of message contexts enqueued.
+        stored (int): Total number of message contexts committed to the database.
+        commits (int): Number of group commits performed.
+        failed_batches (int): Number of batches that failed to commit and were split.
+        retries (int): Number of group commits retried after a failure.
+        dropped (int): Number of message contexts that could not be stored and were discarded.
+        last_commit_latency_ms (float): Duration of the most recent group commit.
+        max_commit_latency_ms (float): Longest group commit observed.
+        total_commit_latency_ms (float): Sum of all group commit durations.
+    """
+
+    def __init__(self):
+        self.enqueued = 0
+        self.stored = 0
+        self.commits = 0
+        self.failed_batches = 0
+        self.retries = 0
+        self.dropped = 0
+        self.last_commit_latency_ms = 0.0
+        self.max_commit_latency_ms = 0.0
+        self.total_commit_latency_ms = 0.0
+
+    def record_commit(self, batch_size: int, latency_ms: float):
+        self.stored += batch_size
+        self.commits += 1
+        self.last_commit_latency_ms = latency_ms
+        self.max_commit_latency_ms = max(self.max_commit_latency_ms, latency_ms)
+        self.total_commit_latency_ms += latency_ms
+
+    @property
+    def avg_commit_latency_ms(self) -> float:
+        return self.total_commit_latency_ms / self.commits if self.commits else 0.0
+
+
+class MessageIngestQueue:
+    """
+    Write-behind queue that coalesces incoming message contexts into group commits.
+
+    Handlers enqueue MessageContext objects and return immediately; a single writer task
+    drains the queue and commits a batch every `batch_size` messages or every
+    `flush_interval_ms` milliseconds, whichever comes first. When the queue is full,
+    `enqueue` waits for the writer to catch up.
+
+    A failed commit is retried with exponential backoff; a batch that keeps failing is
+    split in halves and each half committed on its own, so only the rows that cannot be
+    stored are dropped.
+
+    The queue is shared by every bot of the process, so `start` and `stop` are counted:
+    the writer keeps running until each `start` has been matched by a `stop`.
+
+    Args:
+        session_factory (Callable): Factory returning an async database session.
+        batch_size (int): Maximum number of messages per group commit.
+        flush_interval_ms (int): Maximum time a message waits before its batch is committed.
+        max_queue_size (int): Maximum number of pending messages before enqueue blocks.
+        commit_retries (int): Attempts at committing a batch before it is split.
+        retry_backoff_ms (int): Delay before the first retry, doubled on each further one.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable = get_async_session,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_ms: int = DEFAULT_FLUSH_INTERVAL_MS,
+        max_queue_size: int = DEFAULT_MAX_QUEUE_SIZE,
+        commit_retries: int = DEFAULT_COMMIT_RETRIES,
+        retry_backoff_ms: int = DEFAULT_RETRY_BACKOFF_MS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_queue_size = max_queue_size
+        self.commit_retries = max(commit_retries, 1)
+        self.retry_backoff = retry_backoff_ms / 1000
+        self.metrics = IngestMetrics()
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer: Optional[asyncio.Task] = None
+        self._users = 0
+        self._closed = False
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def start(self):
+        """
+        Registers a user of the queue and starts the writer task if it is not already
+        running. Each call must be matched by a call to `stop`.
+        """
+        self._users += 1
+        self._closed = False
+        self._start_writer()
+
+    def _start_writer(self):
+        if self._writer and not self._writer.done():
+            return
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._writer = asyncio.create_task(self._write_loop())
+        logger.info(
+            f"Started ingest writer (batch_size={self.batch_size}, flush_interval={self.flush_interval}s)"
+        )
+
+    async def enqueue(self, context: MessageContext):
+        """
+        Queues a message context for storage, waiting if the queue is full. After the last
+        user has stopped the queue, the context is dropped (and logged) instead, as no
+        writer would ever store it.
+
+        Args:
+            context (MessageContext): The message context to store.
+        """
+        if self._closed:
+            self.metrics.dropped += 1
+            logger.error(
+                f"Ingest queue is stopped; dropped message {context.msg_id} of chat {context.chat_id}"
+            )
+            return
+        self._start_writer()
+        await self._queue.put(context)
+        self.metrics.enqueued += 1
+
+    async def flush(self):
+        """
+        Waits until every message enqueued so far has been committed.
+        """
+        if self._queue is not None and self._writer and not self._writer.done():
+            await self._queue.join()
+
+    async def stop(self):
+        """
+        Unregisters a user of the queue. The last user to stop flushes pending messages and
+        stops the writer once it has committed them; earlier calls return immediately.
+        """
+        self._users = max(self._users - 1, 0)
+        if self._users:
+            logger.debug(f"Ingest writer kept running for {self._users} other users")
+            return
+        self._closed = True
+        if self._writer and not self._writer.done():
+            await self._queue.put(_STOP)
+            await self._writer
+        self._writer = None
+        # Messages that were already waiting to be enqueued while the writer finished
+        while self._queue is not None and not self._queue.empty():
+            remaining = []
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is _STOP:
+                    self._queue.task_done()
+                else:
+                    remaining.append(item)
+            if remaining:
+                await self._write(remaining)
+        logger.info(f"Stopped ingest writer. Metrics: {self.snapshot()}")
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Returns the current queue metrics.
+
+        Returns:
+            Dict[str, float]: Queue depth, counters and commit latencies.
+        """
+        return {
+            "queue_depth": self.queue_depth,
+            "enqueued": self.metrics.enqueued,
+            "stored": self.metrics.stored,
+            "commits": self.metrics.commits,
+            "failed_batches": self.metrics.failed_batches,
+            "retries": self.metrics.retries,
+            "dropped": self.metrics.dropped,
+            "last_commit_latency_ms": self.metrics.last_commit_latency_ms,
+            "avg_commit_latency_ms": self.metrics.avg_commit_latency_ms,
+            "max_commit_latency_ms": self.metrics.max_commit_latency_ms,
+        }
+
+    async def _next_batch(self) -> Tuple[List[MessageContext], bool]:
+        item = await self._queue.get()
+        if item is _STOP:
+            self._queue.task_done()
+            return [], True
+        batch = [item]
+        deadline = asyncio.get_running_loop().time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if item is _STOP:
+                self._queue.task_done()
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    async def _commit(self, batch: List[MessageContext]):
+        start = time.perf_counter()
+        async with self.session_factory() as session:
+            await store_messages_async(session, batch)
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.metrics.record_commit(len(batch), latency_ms)
+        logger.debug(
+            f"Committed {len(batch)} messages in {latency_ms:.1f}ms (queue depth {self.queue_depth})"
+        )
+
+    async def _store(self, batch: List[MessageContext]):
+        for attempt in range(self.commit_retries):
+            try:
+                await self._commit(batch)
+                return
+            except Exception as e:
+                error = e
+            if attempt + 1 < self.commit_retries:
+                self.metrics.retries += 1
+                delay = self.retry_backoff * 2**attempt
+                logger.warning(
+                    f"Commit of {len(batch)} messages failed ({error}), retrying in {delay:.2f}s"
+                )
+                await asyncio.sleep(delay)
+
+        self.metrics.failed_batches += 1
+        logger.error(f"Failed to commit batch of {len(batch)} messages: {error}")
+        await self._isolate(batch)
+
+    async def _isolate(self, batch: List[MessageContext]):
+        # The retries are spent by now, so each half gets a single attempt: a failing
+        # half is split again until the rows that cannot be stored are found
+        if len(batch) == 1:
+            self.metrics.dropped += 1
+            context = batch[0]
+            logger.error(
+                f"Dropped message {context.msg_id} of chat {context.chat_id}: it cannot be stored"
+            )
+            return
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                await self._commit(half)
+            except Exception:
+                await self._isolate(half)
+
+    async def _write(self, batch: List[MessageContext]):
+        try:
+            await self._store(batch)
+        except Exception as e:
+            self.metrics.dropped += len(batch)
+            logger.exception(f"Dropped batch of {len(batch)} messages: {e}")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _write_loop(self):
+        while True:
+            batch, stopping = await self._next_batch()
+            if batch:
+                await self._write(batch)
+            if stopping:
+                return
+
+
+# Functions -----------------------------------------------------------------------------------------------------------
+_ingest_queue: Optional[MessageIngestQueue] = None
+
+
+def get_ingest_queue() -> MessageIngestQueue:
+    """
+    Returns the process-wide message ingest queue, creating it on first use.
+
+    Returns:
+        MessageIngestQueue: The shared ingest queue.
+    """
+    global _ingest_queue
+    if _ingest_queue is None:
+        _ingest_queue = MessageIngestQueue()
+    return _ingest_queue
@@ -0,0 +1,204 @@
+# rate_limit.py
+
+import asyncio
+from collections import OrderedDict
+from typing import Dict, Optional
+from weakref import WeakKeyDictionary
+
+from pyrogram import Client
+
+from telegram_agent.src.telegram.config import (
+    TG_GLOBAL_RATE,
+    TG_GLOBAL_BURST,
+    TG_CHAT_RATE,
+    TG_CHAT_BURST,
+)
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("RateLimit")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+# Per-chat buckets kept per client; the least recently used are dropped beyond this
+MAX_CHAT_BUCKETS = 10_000
+
+# Classes -------------------------------------------------------------------------------------------------------------
+
+
+class TokenBucket:
+    """
+    An awaitable token bucket.
+
+    Tokens refill continuously at `rate` per second up to `capacity`. A caller that finds
+    the bucket empty reserves its tokens anyway (the balance goes negative) and sleeps until
+    they have refilled, so waiters are served in arrival order and only the caller waits;
+    the event loop keeps running other handlers.
+
+    Args:
+        rate (float): Tokens added per second.
+        capacity (float): Maximum number of tokens, i.e. the allowed burst.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity <= 0:
+            raise ValueError("rate and capacity must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated: Optional[float] = None
+        self.waits = 0
+        self.wait_time = 0.0
+
+    def _refill(self, now: float):
+        if self.updated is not None:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+        self.updated = now
+
+    def delay(self, tokens: float = 1) -> float:
+        """
+        Reserves tokens and returns how long the caller must wait before using them.
+
+        Args:
+            tokens (float): The number of tokens to take.
+
+        Returns:
+            float: Seconds until the reserved tokens are available.
+        """
+        self._refill(asyncio.get_running_loop().time())
+        self.tokens -= tokens
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    async def acquire(self, tokens: float = 1):
+        """
+        Waits until `tokens` tokens are available and takes them.
+
+        Args:
+            tokens (float): The number of tokens to take.
+        """
+        wait = self.delay(tokens)
+        if wait > 0:
+            self.waits += 1
+            self.wait_time += wait
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds: float):
+        """
+        Holds back every caller of this bucket for at least `seconds`, e.g. after Telegram
+        answered with a FloodWait.
+
+        Args:
+            seconds (float): How long no tokens may be handed out.
+        """
+        self._refill(asyncio.get_running_loop().time())
+        # The next caller's own token is the one that becomes available after `seconds`
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class RateLimiter:
+    """
+    Paces the API calls of one Telegram client with a client-wide bucket plus one bucket
+    per chat, matching Telegram's global and per-chat limits.
+
+    Args:
+        rate (float): Requests per second across the client.
+        burst (int): Requests the client may send at once.
+        chat_rate (float): Requests per second to a single chat.
+        chat_burst (int): Requests to a single chat that may be sent at once.
+    """
+
+    def __init__(
+        self,
+        rate: float = TG_GLOBAL_RATE,
+        burst: int = TG_GLOBAL_BURST,
+        chat_rate: float = TG_CHAT_RATE,
+        chat_burst: int = TG_CHAT_BURST,
+    ):
+        self.bucket = TokenBucket(rate, burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets: "OrderedDict[int, TokenBucket]" = OrderedDict()
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self.chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self.chat_buckets[chat_id] = bucket
+            if len(self.chat_buckets) > MAX_CHAT_BUCKETS:
+                self.chat_buckets.popitem(last=False)
+        else:
+            self.chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id: Optional[int] = None):
+        """
+        Waits for a slot to call the API, for a specific chat if one is given.
+
+        Args:
+            chat_id (Optional[int]): The chat the call targets.
+        """
+        if chat_id is not None:
+            await self._chat_bucket(chat_id).acquire()
+        await self.bucket.acquire()
+
+    def pause(self, seconds: float, chat_id: Optional[int] = None):
+        """
+        Holds back calls to `chat_id` (or every call of the client) for `seconds`.
+
+        Args:
+            seconds (float): How long to hold calls back.
+            chat_id (Optional[int]): The chat Telegram asked us to slow down for.
+        """
+        bucket = self._chat_bucket(chat_id) if chat_id is not None else self.bucket
+        bucket.pause(seconds)
+
+    def snapshot(self) -> Dict[str, float]:
+        """
+        Returns the limiter metrics.
+
+        Returns:
+            Dict[str, float]: Wait counts and total wait time, client-wide and across chats.
+        """
+        chat_buckets = self.chat_buckets.values()
+        return {
+            "waits": self.bucket.waits,
+            "wait_time_s": self.bucket.wait_time,
+            "chat_waits": sum(bucket.waits for bucket in chat_buckets),
+            "chat_wait_time_s": sum(bucket.wait_time for bucket in chat_buckets),
+            "tracked_chats": len(self.chat_buckets),
+        }
+
+
+# Functions -----------------------------------------------------------------------------------------------------------
+_limiters: "WeakKeyDictionary[Client, RateLimiter]" = WeakKeyDictionary()
+
+
+def get_rate_limiter(client: Client) -> RateLimiter:
+    """
+    Returns the rate limiter shared by every caller using `client`, creating it on first use.
+
+    Args:
+        client (Client): The Pyrogram client.
+
+    Returns:
+        RateLimiter: The client's rate limiter.
+    """
+    limiter = _limiters.get(client)
+    if limiter is None:
+        limiter = RateLimiter()
+        _limiters[client] = limiter
+    return limiter
+
+
+async def throttle(client: Client, chat_id: Optional[int] = None):
+    """
+    Waits until `client` may make another API call (to `chat_id`, if given) without
+    blocking the event loop.
+
+    Args:
+        client (Client): The Pyrogram client making the call.
+        chat_id (Optional[int]): The chat the call targets.
+    """
+    await get_rate_limiter(client).acquire(chat_id)
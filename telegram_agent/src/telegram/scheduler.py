@@ -0,0 +1,241 @@
+# scheduler.py
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+from telegram_agent.src.telegram.config import (
+    SCHEDULER_WORKERS,
+    SCHEDULER_MAX_QUEUE_SIZE,
+    SCHEDULER_OVERFLOW,
+)
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("Scheduler")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+# What `submit` does when the key's queue is full:
+#   "block"       - wait for room, pushing back on the caller
+#   "drop_new"    - reject the new job
+#   "drop_oldest" - discard the oldest queued job to make room
+OVERFLOW_POLICIES = ("block", "drop_new", "drop_oldest")
+
+Job = Tuple[Callable[..., Awaitable[Any]], tuple, float]
+
+# Classes -------------------------------------------------------------------------------------------------------------
+
+
+class SchedulerMetrics:
+    """
+    Counters describing the state of a KeyedScheduler.
+
+    Attributes:
+        submitted (int): Jobs accepted into a queue.
+        completed (int): Jobs that finished without raising.
+        failed (int): Jobs that raised.
+        dropped (int): Jobs rejected or discarded by the overflow policy.
+        blocked (int): Submissions that had to wait for room in a full queue.
+        max_queue_depth (int): Deepest worker queue observed.
+        total_queue_wait_ms (float): Time jobs spent queued before starting, in total.
+        max_queue_wait_ms (float): Longest time a job spent queued.
+    """
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.max_queue_depth = 0
+        self.total_queue_wait_ms = 0.0
+        self.max_queue_wait_ms = 0.0
+
+    def record_start(self, wait_ms: float):
+        self.total_queue_wait_ms += wait_ms
+        self.max_queue_wait_ms = max(self.max_queue_wait_ms, wait_ms)
+
+    @property
+    def avg_queue_wait_ms(self) -> float:
+        started = self.completed + self.failed
+        return self.total_queue_wait_ms / started if started else 0.0
+
+
+class KeyedScheduler:
+    """
+    A fixed pool of workers that runs jobs in order per key and in parallel across keys.
+
+    Every key is hashed to one worker, so the jobs submitted under a key, e.g. the messages
+    of one forum topic, run one at a time in submission order, while jobs for keys on other
+    workers run concurrently. Each worker has a bounded queue; what happens when it is full
+    is decided by the overflow policy.
+
+    Args:
+        workers (int): Number of worker tasks, i.e. the maximum number of jobs running at once.
+        max_queue_size (int): Maximum number of queued jobs per worker.
+        overflow (str): One of OVERFLOW_POLICIES.
+        name (str): Used in log messages.
+    """
+
+    def __init__(
+        self,
+        workers: int = SCHEDULER_WORKERS,
+        max_queue_size: int = SCHEDULER_MAX_QUEUE_SIZE,
+        overflow: str = SCHEDULER_OVERFLOW,
+        name: str = "scheduler",
+    ):
+        if workers < 1 or max_queue_size < 1:
+            raise ValueError("workers and max_queue_size must be positive")
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.overflow = overflow
+        self.name = name
+        self.metrics = SchedulerMetrics()
+        self._queues: List[asyncio.Queue] = []
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def queue_depths(self) -> List[int]:
+        return [queue.qsize() for queue in self._queues]
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self):
+        """
+        Starts the worker tasks if they are not already running.
+        """
+        if self.running:
+            return
+        if not self._queues:
+            self._queues = [
+                asyncio.Queue(maxsize=self.max_queue_size) for _ in range(self.workers)
+            ]
+        self._tasks = [
+            asyncio.create_task(self._work(queue)) for queue in self._queues
+        ]
+        logger.info(
+            f"Started {self.name} with {self.workers} workers (max_queue_size={self.max_queue_size}, overflow={self.overflow})"
+        )
+
+    def worker_for(self, key: Hashable) -> int:
+        """
+        Returns the index of the worker that runs the jobs of `key`.
+
+        Args:
+            key (Hashable): The ordering key, e.g. (chat_id, message_thread_id).
+
+        Returns:
+            int: The worker index.
+        """
+        return hash(key) % self.workers
+
+    async def submit(
+        self, key: Hashable, func: Callable[..., Awaitable[Any]], *args
+    ) -> bool:
+        """
+        Queues `func(*args)` to run after the jobs already submitted under `key`.
+
+        Args:
+            key (Hashable): The ordering key, e.g. (chat_id, message_thread_id).
+            func (Callable[..., Awaitable[Any]]): The coroutine function to run.
+            *args: Arguments for `func`.
+
+        Returns:
+            bool: False if the job was rejected by the "drop_new" policy.
+        """
+        self.start()
+        queue = self._queues[self.worker_for(key)]
+        job: Job = (func, args, time.perf_counter())
+
+        if queue.full():
+            if self.overflow == "drop_new":
+                self.metrics.dropped += 1
+                logger.warning(f"{self.name}: queue full, dropped job for {key}")
+                return False
+            if self.overflow == "drop_oldest":
+                queue.get_nowait()
+                queue.task_done()
+                self.metrics.dropped += 1
+                logger.warning(f"{self.name}: queue full, dropped oldest job before {key}")
+            else:
+                self.metrics.blocked += 1
+
+        await queue.put(job)
+        self.metrics.submitted += 1
+        self.metrics.max_queue_depth = max(self.metrics.max_queue_depth, queue.qsize())
+        return True
+
+    async def join(self):
+        """
+        Waits until every job submitted so far has finished.
+        """
+        if self.running:
+            await asyncio.gather(*(queue.join() for queue in self._queues))
+
+    async def stop(self, drain: bool = True):
+        """
+        Stops the workers, after finishing the queued jobs unless `drain` is False.
+
+        Args:
+            drain (bool): Run the queued jobs before stopping.
+        """
+        if drain:
+            await self.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Stopped {self.name}. Metrics: {self.snapshot()}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the current scheduler metrics.
+
+        Returns:
+            Dict[str, Any]: Queue depths, job counters and queue wait times.
+        """
+        return {
+            "queue_depths": self.queue_depths,
+            "submitted": self.metrics.submitted,
+            "completed": self.metrics.completed,
+            "failed": self.metrics.failed,
+            "dropped": self.metrics.dropped,
+            "blocked": self.metrics.blocked,
+            "max_queue_depth": self.metrics.max_queue_depth,
+            "avg_queue_wait_ms": self.metrics.avg_queue_wait_ms,
+            "max_queue_wait_ms": self.metrics.max_queue_wait_ms,
+        }
+
+    async def _work(self, queue: asyncio.Queue):
+        while True:
+            func, args, submitted_at = await queue.get()
+            self.metrics.record_start((time.perf_counter() - submitted_at) * 1000)
+            try:
+                await func(*args)
+                self.metrics.completed += 1
+            except Exception as e:
+                self.metrics.failed += 1
+                logger.exception(f"{self.name}: job {func.__qualname__} failed: {e}")
+            finally:
+                queue.task_done()
+
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+def message_key(context) -> Tuple[int, int]:
+    """
+    Returns the ordering key of a message: its chat and forum topic.
+
+    Args:
+        context (MessageContext): The message context.
+
+    Returns:
+        Tuple[int, int]: (chat_id, message_thread_id), with 0 outside forum topics.
+    """
+    return (context.chat_id, context.message_thread_id or 0)
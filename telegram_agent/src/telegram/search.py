@@ -0,0 +1,191 @@
+# search.py
+
+import re
+from typing import List, Optional
+
+from sqlalchemy import func, literal_column, text
+from sqlmodel import Session, select
+
+from telegram_agent.src.models.models import Message
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("MessageSearch")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+# A configuration message starts with a bracketed label, e.g. "[Goal] Build a bot"
+CONFIG_LABEL_PATTERN = re.compile(r"^\[([^\]\n]+)\]")
+TERM_PATTERN = re.compile(r"\w+")
+
+# SQLite: an external-content FTS5 table over message.text, kept in sync by triggers so every
+# write path (store_message, the ingest queue, bulk sync) updates it automatically.
+SQLITE_FTS_STATEMENTS = [
+    """CREATE VIRTUAL TABLE message_fts USING fts5(
+        text, content='message', content_rowid='id', tokenize='unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message BEGIN
+        INSERT INTO message_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF text ON message BEGIN
+        INSERT INTO message_fts(message_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO message_fts(rowid, text) VALUES (new.id, new.text);
+    END""",
+    "INSERT INTO message_fts(message_fts) VALUES ('rebuild')",
+]
+
+# PostgreSQL: a GIN expression index; queries must use the same expression to hit it.
+POSTGRES_TSVECTOR = func.to_tsvector(
+    literal_column("'simple'::regconfig"),
+    func.coalesce(Message.text, literal_column("''")),
+)
+POSTGRES_FTS_STATEMENT = (
+    "CREATE INDEX IF NOT EXISTS ix_message_text_fts ON message "
+    "USING gin (to_tsvector('simple'::regconfig, coalesce(text, '')))"
+)
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+def parse_config_label(message_text: Optional[str]) -> Optional[str]:
+    """
+    Extracts the configuration label of a message, e.g. "Goal" from "[Goal] Build a bot".
+
+    Args:
+        message_text (Optional[str]): The message text.
+
+    Returns:
+        Optional[str]: The label, or None if the message is not a configuration message.
+    """
+    if not message_text:
+        return None
+    match = CONFIG_LABEL_PATTERN.match(message_text)
+    return match.group(1) if match else None
+
+
+def init_search_index(conn):
+    """
+    Creates the full-text index for the connection's dialect if it does not exist yet.
+    A newly created SQLite index is populated from the existing messages.
+
+    Args:
+        conn (Connection): An open connection inside a transaction.
+    """
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        exists = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type='table' AND name='message_fts'")
+        ).first()
+        if exists:
+            return
+        for statement in SQLITE_FTS_STATEMENTS:
+            conn.execute(text(statement))
+        logger.info("Created FTS5 index message_fts")
+    elif dialect == "postgresql":
+        conn.execute(text(POSTGRES_FTS_STATEMENT))
+    else:
+        logger.warning(f"No full-text index available for dialect '{dialect}'")
+
+
+def _terms(query: str) -> List[str]:
+    return TERM_PATTERN.findall(query)
+
+
+def build_fts5_query(query: str, prefix: bool = False, phrase: bool = False) -> str:
+    """
+    Builds an FTS5 MATCH expression from free text, quoting every term so user input
+    cannot inject FTS5 operators.
+
+    Args:
+        query (str): The text to search for.
+        prefix (bool): Match terms (or the phrase) as prefixes.
+        phrase (bool): Match the terms as one contiguous phrase instead of all terms anywhere.
+
+    Returns:
+        str: The MATCH expression.
+    """
+    terms = _terms(query)
+    star = "*" if prefix else ""
+    if phrase:
+        return f'"{" ".join(terms)}"{star}'
+    return " AND ".join(f'"{term}"{star}' for term in terms)
+
+
+def build_tsquery(query: str, prefix: bool = False, phrase: bool = False) -> str:
+    """
+    Builds a PostgreSQL tsquery expression from free text.
+
+    Args:
+        query (str): The text to search for.
+        prefix (bool): Match terms as prefixes.
+        phrase (bool): Match the terms as one contiguous phrase.
+
+    Returns:
+        str: The tsquery expression.
+    """
+    suffix = ":*" if prefix else ""
+    return (" <-> " if phrase else " & ").join(
+        f"{term}{suffix}" for term in _terms(query)
+    )
+
+
+def search_messages(
+    session: Session,
+    chat_id: int,
+    query: str,
+    message_thread_id: Optional[int] = None,
+    prefix: bool = False,
+    phrase: bool = False,
+    limit: Optional[int] = None,
+) -> List[Message]:
+    """
+    Searches the non-deleted messages of a chat through the full-text index.
+
+    Args:
+        session (Session): The database session.
+        chat_id (int): The ID of the chat to search.
+        query (str): The text to search for.
+        message_thread_id (Optional[int]): Restrict the search to this forum topic.
+        prefix (bool): Match terms as prefixes (e.g. "proj" matches "project").
+        phrase (bool): Match the terms as one contiguous phrase.
+        limit (Optional[int]): The maximum number of messages to return.
+
+    Returns:
+        List[Message]: The matching messages in chronological order.
+    """
+    if not _terms(query):
+        return []
+
+    statement = select(Message).where(
+        Message.chat_id == chat_id, Message.deleted == False
+    )
+    if message_thread_id is not None:
+        statement = statement.where(Message.message_thread_id == message_thread_id)
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        statement = statement.where(
+            text(
+                "message.id IN (SELECT rowid FROM message_fts WHERE message_fts MATCH :match)"
+            ).bindparams(match=build_fts5_query(query, prefix, phrase))
+        )
+    elif dialect == "postgresql":
+        statement = statement.where(
+            POSTGRES_TSVECTOR.op("@@")(
+                func.to_tsquery(
+                    literal_column("'simple'::regconfig"),
+                    build_tsquery(query, prefix, phrase),
+                )
+            )
+        )
+    else:
+        pattern = " ".join(_terms(query)) if phrase else query
+        statement = statement.where(Message.text.ilike(f"%{pattern}%"))
+
+    statement = statement.order_by(Message.date, Message.id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return list(session.exec(statement))
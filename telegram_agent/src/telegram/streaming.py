@@ -0,0 +1,172 @@
+# streaming.py
+
+import asyncio
+from typing import AsyncIterable, List, Optional
+
+from pyrogram import Client
+from pyrogram.errors import MessageNotModified
+from pyrogram.types import Message as PyroMessage
+
+from telegram_agent.src.telegram.api import call_api
+from telegram_agent.src.telegram.config import TG_STREAM_EDIT_INTERVAL
+
+# Logging -------------------------------------------------------------------------------------------------------------
+from telegram_agent.log.logger import get_logger
+
+logger = get_logger("StreamingMessage")
+
+# Constants -----------------------------------------------------------------------------------------------------------
+STREAM_PLACEHOLDER = "…"
+# Appended to the partial text when the stream fails
+STREAM_ERROR_MARKER = "\n\n⚠️ Response interrupted"
+# Telegram rejects longer message texts
+MAX_MESSAGE_LENGTH = 4096
+
+# Functions -----------------------------------------------------------------------------------------------------------
+
+
+def split_message_text(text: str, limit: int = MAX_MESSAGE_LENGTH) -> List[str]:
+    """
+    Splits a text into parts Telegram accepts, preferring to break at newlines.
+
+    Args:
+        text (str): The text to split.
+        limit (int): The maximum length of a part.
+
+    Returns:
+        List[str]: The parts, in order.
+    """
+    parts = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    parts.append(text)
+    return parts
+
+
+async def _edit(client: Client, message: PyroMessage, text: str):
+    try:
+        await call_api(
+            client,
+            client.edit_message_text,
+            chat_id=message.chat.id,
+            message_id=message.id,
+            text=text,
+        )
+    except MessageNotModified:
+        pass
+
+
+async def _abort(client: Client, message: PyroMessage, text: str):
+    # Best effort: the stream's own error is the one worth raising
+    try:
+        if text:
+            limit = MAX_MESSAGE_LENGTH - len(STREAM_ERROR_MARKER)
+            await _edit(client, message, text[:limit] + STREAM_ERROR_MARKER)
+        else:
+            await call_api(
+                client,
+                client.delete_messages,
+                chat_id=message.chat.id,
+                message_ids=message.id,
+            )
+    except Exception as e:
+        logger.error(f"Could not clean up interrupted message {message.id}: {e}")
+
+
+async def stream_message(
+    client: Client,
+    chat_id: int,
+    chunks: AsyncIterable[str],
+    message_thread_id: Optional[int] = None,
+    placeholder: str = STREAM_PLACEHOLDER,
+    edit_interval: float = TG_STREAM_EDIT_INTERVAL,
+) -> Optional[PyroMessage]:
+    """
+    Posts a placeholder message right away, then edits it as text chunks arrive.
+
+    Edits are sent at most every `edit_interval` seconds (and go through the client's rate
+    limiter), each showing everything received so far; the final text is always applied
+    once the chunks run out. Text beyond Telegram's length limit is posted as follow-up
+    messages at the end.
+
+    If the chunks raise (or the call is cancelled), the message is left showing the text
+    received so far followed by STREAM_ERROR_MARKER, or deleted if nothing was received,
+    and the error is re-raised.
+
+    Args:
+        client (Client): The Pyrogram client posting the message.
+        chat_id (int): The chat to post in.
+        chunks (AsyncIterable[str]): The text, piece by piece, e.g. LLM tokens.
+        message_thread_id (Optional[int]): The forum topic to post in.
+        placeholder (str): The text shown until the first chunk arrives.
+        edit_interval (float): Minimum seconds between two edits.
+
+    Returns:
+        Optional[PyroMessage]: The first posted message, or None if nothing was received.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    message = await call_api(
+        client,
+        client.send_message,
+        chat_id=chat_id,
+        message_thread_id=message_thread_id,
+        text=placeholder,
+    )
+    logger.debug(f"Placeholder posted after {loop.time() - started:.2f}s")
+
+    text = ""
+    shown = placeholder
+    last_edit = loop.time()
+    first_chunk = None
+    try:
+        async for chunk in chunks:
+            if not chunk:
+                continue
+            if first_chunk is None:
+                first_chunk = loop.time() - started
+            text += chunk
+            visible = text.strip()[:MAX_MESSAGE_LENGTH]
+            if (
+                visible
+                and visible != shown
+                and loop.time() - last_edit >= edit_interval
+            ):
+                await _edit(client, message, visible)
+                shown = visible
+                last_edit = loop.time()
+    except (Exception, asyncio.CancelledError) as e:
+        logger.error(
+            f"Stream for chat {chat_id} failed after {len(text)} chars: {e!r}"
+        )
+        await _abort(client, message, text.strip())
+        raise
+
+    parts = split_message_text(text.strip())
+    if not parts[0]:
+        await call_api(
+            client,
+            client.delete_messages,
+            chat_id=chat_id,
+            message_ids=message.id,
+        )
+        logger.warning(f"Stream for chat {chat_id} ended without text")
+        return None
+    if parts[0] != shown:
+        await _edit(client, message, parts[0])
+    for part in parts[1:]:
+        await call_api(
+            client,
+            client.send_message,
+            chat_id=chat_id,
+            message_thread_id=message_thread_id,
+            text=part,
+        )
+    logger.info(
+        f"Streamed {len(text)} chars to chat {chat_id}: first chunk after {first_chunk:.2f}s, done after {loop.time() - started:.2f}s"
+    )
+    return message
@@ -1,18 +1,49 @@
 # utils.py
 
-from typing import Optional
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
 from pyrogram.enums import ChatType
 from pyrogram.types import Message as PyroMessage
-from sqlmodel import Session
+from sqlalchemy import Insert, or_, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from telegram_agent.src.models.models import Chat, Message, MessageContext, User
+from telegram_agent.src.telegram.search import parse_config_label
+from telegram_agent.src.models.models import (
+    Chat,
+    ChatConfig,
+    Message,
+    MessageContext,
+    SyncCursor,
+    User,
+)
 
 # Logging -------------------------------------------------------------------------------------------------------------
 from telegram_agent.log.logger import get_logger
 
 logger = get_logger("Bot_Utils")
 
+# Constants -----------------------------------------------------------------------------------------------------------
+MESSAGE_FIELDS_TO_COMPARE = [
+    "user_id",
+    "chat_type",
+    "chat_title",
+    "message_thread_id",
+    "message_thread_name",
+    "date",
+    "text",
+    "deleted",
+]
+# Columns derived from the message content rather than copied from the context
+MESSAGE_DERIVED_FIELDS = ["config_label"]
+# Dialect-specific INSERT constructs that support ON CONFLICT
+UPSERT_INSERTS = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}
+# Rows per statement for bulk operations, kept well below SQLite's bound-parameter limit
+SQL_CHUNK_SIZE = 500
+
 # Functions -----------------------------------------------------------------------------------------------------------
 
 
@@ -113,7 +144,10 @@ async def extract_context(message: PyroMessage) -> MessageContext:
 
 def build_message_context_from_db(session: Session, message: Message) -> MessageContext:
     """
-    Builds a MessageContext instance from a Message instance by fetching related User and Chat objects.
+    Builds a MessageContext instance from a Message instance using its related User and Chat objects.
+
+    When the relationships were eager-loaded (see ChatContext.get_history), no further
+    queries are issued; otherwise they are loaded lazily through `session`.
 
     Args:
         session (Session): The database session.
@@ -122,11 +156,8 @@ def build_message_context_from_db(session: Session, message: Message) -> Message
     Returns:
         MessageContext: The constructed MessageContext instance.
     """
-    # Fetch the User object if user_id exists
-    user = session.get(User, message.user_id) if message.user_id else None
-
-    # Fetch the Chat object if chat_id exists
-    chat = session.get(Chat, message.chat_id) if message.chat_id else None
+    user = message.user if message.user_id else None
+    chat = message.chat if message.chat_id else None
 
     # Construct the MessageContext
     context = MessageContext(
@@ -146,69 +177,373 @@ def build_message_context_from_db(session: Session, message: Message) -> Message
     return context
 
 
+def _message_row(context: MessageContext) -> Dict:
+    row = {"msg_id": context.msg_id, "chat_id": context.chat_id}
+    for field in MESSAGE_FIELDS_TO_COMPARE:
+        row[field] = getattr(context, field)
+    row["config_label"] = parse_config_label(context.text)
+    return row
+
+
+def upsert_statements(
+    contexts: List[MessageContext], dialect: str = "sqlite"
+) -> List[Tuple[Insert, List[Dict]]]:
+    """
+    Builds `INSERT ... ON CONFLICT DO UPDATE` statements for the users, chats and messages
+    referenced by a list of message contexts.
+
+    Duplicates within the list are coalesced so that the latest context wins. Messages are
+    matched on their unique (chat_id, msg_id) key and only rewritten when a field changed.
+    Each statement is compiled once and executed with all of its rows (executemany).
+
+    Args:
+        contexts (List[MessageContext]): The message contexts, oldest first.
+        dialect (str): The database dialect name ("sqlite" or "postgresql").
+
+    Returns:
+        List[Tuple[Insert, List[Dict]]]: (statement, rows) pairs to execute, in foreign-key order.
+    """
+    insert = UPSERT_INSERTS[dialect]
+    users = {c.user.id: c.user.model_dump() for c in contexts if c.user}
+    chats = {c.chat.id: c.chat.model_dump() for c in contexts if c.chat and c.chat_id}
+    messages = {(c.chat_id, c.msg_id): _message_row(c) for c in contexts}
+
+    statements = []
+    for model, rows in ((User, users), (Chat, chats)):
+        if not rows:
+            continue
+        table = model.__table__
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["id"],
+            set_={
+                column.name: stmt.excluded[column.name]
+                for column in table.columns
+                if column.name != "id"
+            },
+        )
+        statements.append((stmt, list(rows.values())))
+
+    if messages:
+        table = Message.__table__
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["chat_id", "msg_id"],
+            set_={
+                field: stmt.excluded[field]
+                for field in MESSAGE_FIELDS_TO_COMPARE + MESSAGE_DERIVED_FIELDS
+            },
+            where=or_(
+                *[
+                    table.c[field].is_distinct_from(stmt.excluded[field])
+                    for field in MESSAGE_FIELDS_TO_COMPARE
+                ]
+            ),
+        )
+        statements.append((stmt, list(messages.values())))
+    return statements
+
+
+def _dialect(session) -> str:
+    return session.get_bind().dialect.name
+
+
 def store_message(session: Session, context: MessageContext):
     """
     Stores or updates a message and its context into the database.
     """
-    # Upsert User
-    if context.user:
-        user = session.get(User, context.user.id)
-        if not user:
-            session.add(context.user)
-        else:
-            for field in context.user.__fields_set__:
-                setattr(user, field, getattr(context.user, field))
-
-    # Upsert Chat
-    if context.chat and context.chat_id:
-        chat = session.get(Chat, context.chat.id)
-        if not chat:
-            session.add(context.chat)
-        else:
-            for field in context.chat.__fields_set__:
-                setattr(chat, field, getattr(context.chat, field))
-
-    # Upsert Message
-    existing_message = (
-        session.query(Message)
-        .filter(Message.msg_id == context.msg_id, Message.chat_id == context.chat_id)
-        .first()
-    )
+    for stmt, rows in upsert_statements([context], _dialect(session)):
+        session.execute(stmt, rows)
+    refresh_chat_config(session, [context])
+    session.commit()
 
-    if not existing_message:
-        # Message doesn't exist, so add it
-        message = Message(
-            msg_id=context.msg_id,
-            user_id=context.user_id,
-            chat_id=context.chat_id,
-            chat_type=context.chat_type,
-            chat_title=context.chat_title,
-            message_thread_id=context.message_thread_id,
-            message_thread_name=context.message_thread_name,
-            date=context.date,
-            text=context.text,
-            deleted=context.deleted,
-        )
-        session.add(message)
+
+async def store_message_async(session: AsyncSession, context: MessageContext):
+    """
+    Stores or updates a message and its context into the database without blocking the event loop.
+
+    Args:
+        session (AsyncSession): The async database session.
+        context (MessageContext): The message context to store.
+    """
+    for stmt, rows in upsert_statements([context], _dialect(session)):
+        await session.execute(stmt, rows)
+    await session.run_sync(refresh_chat_config, [context])
+    await session.commit()
+
+
+async def store_messages_async(session: AsyncSession, contexts: List[MessageContext]):
+    """
+    Stores or updates a batch of messages and their contexts in a single transaction.
+
+    Duplicate messages within the batch are coalesced so that the latest context wins, and
+    each table is written with one set-based upsert instead of one statement per message.
+
+    Args:
+        session (AsyncSession): The async database session.
+        contexts (List[MessageContext]): The message contexts to store, oldest first.
+    """
+    if not contexts:
+        return
+    for stmt, rows in upsert_statements(contexts, _dialect(session)):
+        await session.execute(stmt, rows)
+    await session.run_sync(refresh_chat_config, contexts)
+    await session.commit()
+
+
+def _chunks(items: List, size: int = SQL_CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def bulk_sync_messages(
+    session: Session,
+    chat_id: int,
+    contexts: List[MessageContext],
+    message_thread_id: Optional[int] = None,
+    soft_delete: bool = True,
+) -> Dict[str, int]:
+    """
+    Synchronizes the stored messages of a chat (or a topic within it) with the messages
+    currently present in the chat, using a handful of set-based statements and a single
+    commit.
+
+    - Messages missing from the database are bulk upserted.
+    - Messages whose fields changed are bulk updated by primary key.
+    - Stored messages no longer present in the chat are soft-deleted with
+      `UPDATE ... WHERE id IN (...)`.
+
+    With `soft_delete=False`, `contexts` may be a partial history (e.g. only messages newer
+    than a sync cursor): only the matching stored rows are compared and nothing is deleted.
+
+    Args:
+        session (Session): The database session.
+        chat_id (int): The ID of the chat being synchronized.
+        contexts (List[MessageContext]): Contexts for every message currently in the chat.
+        message_thread_id (Optional[int]): Restrict the sync to this topic, if given; contexts
+            from other topics are ignored.
+        soft_delete (bool): Whether stored messages missing from `contexts` are marked as deleted.
+
+    Returns:
+        Dict[str, int]: The number of inserted, updated and deleted messages.
+    """
+    columns = [Message.id, Message.msg_id] + [
+        getattr(Message, field) for field in MESSAGE_FIELDS_TO_COMPARE
+    ]
+    # The diff only sees the topic's stored rows, so messages from other topics would
+    # otherwise all look new
+    chat_contexts = {
+        context.msg_id: context
+        for context in contexts
+        if message_thread_id is None or context.message_thread_id == message_thread_id
+    }
+    query = select(*columns).where(Message.chat_id == chat_id)
+    if message_thread_id is not None:
+        query = query.where(Message.message_thread_id == message_thread_id)
+    if soft_delete:
+        existing_rows = {row.msg_id: row for row in session.execute(query)}
     else:
-        # Message exists, update fields if necessary
-        needs_update = False
-        fields_to_compare = [
-            "user_id",
-            "chat_type",
-            "chat_title",
-            "message_thread_id",
-            "message_thread_name",
-            "date",
-            "text",
-            "deleted",
-        ]
-        for field in fields_to_compare:
-            db_value = getattr(existing_message, field)
-            new_value = getattr(context, field)
-            if db_value != new_value:
-                setattr(existing_message, field, new_value)
-                needs_update = True
-        if needs_update:
-            session.add(existing_message)
+        existing_rows = {}
+        for chunk in _chunks(list(chat_contexts.keys())):
+            for row in session.execute(query.where(Message.msg_id.in_(chunk))):
+                existing_rows[row.msg_id] = row
+    inserts = []
+    updates = []
+    updated_msg_ids = []
+    for msg_id, context in chat_contexts.items():
+        row = existing_rows.get(msg_id)
+        values = {field: getattr(context, field) for field in MESSAGE_FIELDS_TO_COMPARE}
+        if row is None:
+            inserts.append(context)
+        elif any(getattr(row, field) != value for field, value in values.items()):
+            values["config_label"] = parse_config_label(context.text)
+            updates.append({"id": row.id, **values})
+            updated_msg_ids.append(msg_id)
+
+    deleted_msg_ids = [
+        msg_id
+        for msg_id, row in existing_rows.items()
+        if soft_delete and msg_id not in chat_contexts and not row.deleted
+    ]
+    deleted_ids = [existing_rows[msg_id].id for msg_id in deleted_msg_ids]
+
+    # New messages go through the upsert path so rows written concurrently by the
+    # ingest queue are merged instead of violating the (chat_id, msg_id) key
+    for stmt, rows in upsert_statements(inserts, _dialect(session)):
+        session.execute(stmt, rows)
+    if updates:
+        session.execute(update(Message), updates)
+    for chunk in _chunks(deleted_ids):
+        session.execute(
+            update(Message)
+            .where(Message.id.in_(chunk))
+            .values(deleted=True)
+            .execution_options(synchronize_session=False)
+        )
+    refresh_chat_config(
+        session,
+        inserts + [chat_contexts[msg_id] for msg_id in updated_msg_ids],
+        deleted=[(chat_id, msg_id) for msg_id in deleted_msg_ids],
+    )
     session.commit()
+
+    counts = {
+        "inserted": len(inserts),
+        "updated": len(updates),
+        "deleted": len(deleted_ids),
+    }
+    logger.info(f"Synchronized chat {chat_id}: {counts}")
+    return counts
+
+
+def get_sync_cursor(
+    session: Session, chat_id: int, message_thread_id: Optional[int] = None
+) -> SyncCursor:
+    """
+    Fetches the sync cursor for a chat or forum topic, creating an empty one if needed.
+
+    Args:
+        session (Session): The database session.
+        chat_id (int): The ID of the chat.
+        message_thread_id (Optional[int]): The forum topic ID, or None for the whole chat.
+
+    Returns:
+        SyncCursor: The (possibly unsaved) sync cursor.
+    """
+    thread_key = message_thread_id or 0
+    cursor = session.get(SyncCursor, (chat_id, thread_key))
+    if cursor is None:
+        cursor = SyncCursor(chat_id=chat_id, message_thread_id=thread_key)
+    return cursor
+
+
+def advance_sync_cursor(
+    session: Session,
+    cursor: SyncCursor,
+    last_msg_id: Optional[int] = None,
+    reconciled: bool = False,
+):
+    """
+    Moves a sync cursor forward after a successful synchronization. The message watermark
+    never moves backwards.
+
+    Args:
+        session (Session): The database session.
+        cursor (SyncCursor): The cursor to update.
+        last_msg_id (Optional[int]): The highest message ID seen during the sync.
+        reconciled (bool): Whether the sync was a full (deep) reconcile.
+    """
+    now = datetime.now()
+    if last_msg_id is not None and last_msg_id > cursor.last_msg_id:
+        cursor.last_msg_id = last_msg_id
+    cursor.last_synced = now
+    if reconciled:
+        cursor.last_reconciled = now
+    session.add(cursor)
+
+
+def _config_value(message_text: str) -> str:
+    return message_text.split("]", 1)[1].strip()
+
+
+def refresh_chat_config(
+    session: Session,
+    contexts: List[MessageContext],
+    deleted: Optional[List[Tuple[int, int]]] = None,
+):
+    """
+    Brings the ChatConfig table up to date after messages were written.
+
+    Every (chat, topic, label) touched by the written messages is recomputed from the latest
+    non-deleted message carrying that label, so edits that change or remove a label and
+    deletions of configuration messages fall back to the previous value. Must be called
+    after the messages themselves were written, in the same transaction.
+
+    Args:
+        session (Session): The database session.
+        contexts (List[MessageContext]): The message contexts that were stored.
+        deleted (Optional[List[Tuple[int, int]]]): (chat_id, msg_id) of messages marked as deleted.
+    """
+    keys = set()
+    written = set(deleted or [])
+    for context in contexts:
+        if context.chat_id is None:
+            continue
+        written.add((context.chat_id, context.msg_id))
+        label = parse_config_label(context.text)
+        if label:
+            keys.add((context.chat_id, context.message_thread_id or 0, label))
+
+    # Labels currently served by a written message may have been edited away or deleted
+    written = list(written)
+    for chunk in _chunks(written):
+        configs = session.exec(
+            select(ChatConfig).where(
+                tuple_(ChatConfig.chat_id, ChatConfig.msg_id).in_(chunk)
+            )
+        )
+        for config in configs:
+            keys.add((config.chat_id, config.message_thread_id, config.label))
+
+    for chat_id, thread_key, label in keys:
+        thread_filter = (
+            Message.message_thread_id == thread_key
+            if thread_key
+            else Message.message_thread_id == None
+        )
+        # Plain columns, so rows bulk-updated above are not served stale from the identity map
+        latest = session.exec(
+            select(Message.msg_id, Message.date, Message.text)
+            .where(
+                Message.chat_id == chat_id,
+                Message.config_label == label,
+                thread_filter,
+                Message.deleted == False,
+            )
+            .order_by(Message.date.desc(), Message.id.desc())
+            .limit(1)
+        ).first()
+        config = session.get(ChatConfig, (chat_id, thread_key, label))
+        if latest is None:
+            if config is not None:
+                session.delete(config)
+            continue
+        if config is None:
+            config = ChatConfig(chat_id=chat_id, message_thread_id=thread_key, label=label)
+        config.msg_id = latest.msg_id
+        config.date = latest.date
+        config.text = latest.text
+        config.value = _config_value(latest.text)
+        session.add(config)
+
+
+def rebuild_chat_config(session: Session):
+    """
+    Rebuilds the whole ChatConfig table from the stored messages.
+
+    Args:
+        session (Session): The database session.
+    """
+    session.execute(ChatConfig.__table__.delete())
+    messages = session.exec(
+        select(Message)
+        .where(Message.config_label != None, Message.deleted == False)
+        .order_by(Message.date, Message.id)
+    )
+    latest = {}
+    for message in messages:
+        key = (message.chat_id, message.message_thread_id or 0, message.config_label)
+        latest[key] = message
+    for (chat_id, thread_key, label), message in latest.items():
+        session.add(
+            ChatConfig(
+                chat_id=chat_id,
+                message_thread_id=thread_key,
+                label=label,
+                msg_id=message.msg_id,
+                date=message.date,
+                text=message.text,
+                value=_config_value(message.text),
+            )
+        )
+    logger.info(f"Rebuilt {len(latest)} chat configuration entries")
@@ -0,0 +1,48 @@
+# conftest.py
+
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+# Read when the package modules are imported, so set before any test module imports them
+os.environ.setdefault("LOGDIR", os.path.join(tempfile.gettempdir(), "telegram_agent_test_logs"))
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+
+
+class FakeClock:
+    """
+    Stands in for the asyncio module of code under test: `get_running_loop().time()` reads
+    the fake time and `sleep` advances it instantly, recording each delay. Everything else
+    comes from the real module.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def get_running_loop(self):
+        return self
+
+    def time(self) -> float:
+        return self.now
+
+    async def sleep(self, seconds, *args):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+
+@pytest.fixture
+def fake_clock(monkeypatch):
+    from telegram_agent.src.telegram import rate_limit
+
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, "asyncio", clock)
+    return clock
@@ -0,0 +1,101 @@
+# test_api.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from pyrogram.errors import ChatWriteForbidden, FloodWait, InternalServerError
+
+from telegram_agent.src.telegram import api
+from telegram_agent.src.telegram.api import ApiMetrics, call_api
+from telegram_agent.src.telegram.config import (
+    TG_API_BACKOFF_BASE,
+    TG_API_BACKOFF_MAX,
+    TG_API_MAX_FLOOD_WAIT,
+)
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+
+
+class FakeClient:
+    pass
+
+
+class FlakyMethod:
+    """
+    An API method that raises the given errors in turn, then returns "ok".
+    """
+
+    __name__ = "send_message"
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.fixture
+def metrics(fake_clock, monkeypatch):
+    # Sleeps advance the fake clock; jitter always takes its upper bound
+    monkeypatch.setattr(api, "asyncio", fake_clock)
+    monkeypatch.setattr(api, "random", SimpleNamespace(uniform=lambda low, high: high))
+    fresh = ApiMetrics()
+    monkeypatch.setattr(api, "api_metrics", fresh)
+    return fresh
+
+
+def call(method, **kwargs):
+    return asyncio.run(call_api(FakeClient(), method, chat_id=1, text="hi", **kwargs))
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_flood_wait_pauses_the_limiter_and_retries(metrics, fake_clock):
+    method = FlakyMethod(FloodWait(value=5))
+    assert call(method) == "ok"
+    assert method.calls == 2
+    # The retry waited in the chat's limiter: 5s plus the 1s of jitter
+    assert fake_clock.sleeps == [6.0]
+    assert metrics.flood_waits == 1
+    assert metrics.flood_wait_time == 5.0
+    assert metrics.retries == 1
+
+
+def test_transient_errors_back_off_exponentially_and_retry(metrics, fake_clock):
+    method = FlakyMethod(InternalServerError(), ConnectionResetError(), InternalServerError())
+    assert call(method) == "ok"
+    assert method.calls == 4
+    assert fake_clock.sleeps == [
+        min(TG_API_BACKOFF_MAX, TG_API_BACKOFF_BASE * 2**attempt) for attempt in range(3)
+    ]
+    assert metrics.transient_errors == 3
+    assert metrics.retries == 3
+
+
+def test_permanent_rpc_error_is_raised_immediately(metrics, fake_clock):
+    method = FlakyMethod(ChatWriteForbidden())
+    with pytest.raises(ChatWriteForbidden):
+        call(method)
+    assert method.calls == 1
+    assert fake_clock.sleeps == []
+    assert metrics.permanent_errors == 1
+    assert metrics.retries == 0
+
+
+def test_retries_and_flood_waits_are_bounded(metrics, fake_clock):
+    method = FlakyMethod(*[InternalServerError() for _ in range(3)])
+    with pytest.raises(InternalServerError):
+        call(method, max_retries=2)
+    assert method.calls == 3
+
+    method = FlakyMethod(FloodWait(value=TG_API_MAX_FLOOD_WAIT + 1))
+    with pytest.raises(FloodWait):
+        call(method)
+    assert method.calls == 1
+    assert metrics.exhausted == 2
@@ -0,0 +1,61 @@
+# test_bot.py
+
+import asyncio
+from types import SimpleNamespace
+
+from telegram_agent.src.telegram import bot as bot_module
+from telegram_agent.src.telegram.bot import Dispatcher, TelegramBot
+from telegram_agent.src.telegram.scheduler import KeyedScheduler
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+
+
+class FakeClient:
+    name = "shared"
+
+    def __init__(self):
+        self.handlers = []
+
+    def add_handler(self, handler):
+        self.handlers.append(handler)
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_dispatcher_owns_scheduling_and_database_setup(monkeypatch):
+    init_calls = []
+    monkeypatch.setattr(bot_module, "init_db", lambda: init_calls.append(True))
+    processed = []
+
+    async def processor(client, context):
+        processed.append((client, context.msg_id))
+
+    dispatcher = Dispatcher(client=FakeClient(), name="test")
+    bots = [
+        TelegramBot(client=dispatcher.client, bot_name=name, message_processor=processor)
+        for name in ("first", "second")
+    ]
+    for bot in bots:
+        dispatcher.register_bot(bot)
+
+    assert len(init_calls) == 1
+    assert all(bot.scheduler is None for bot in bots)
+    # Only the dispatcher receives the shared client's updates
+    assert len(dispatcher.client.handlers) == 1
+
+    asyncio.run(dispatcher._dispatch(SimpleNamespace(msg_id=5)))
+    assert processed == [(dispatcher.client, 5), (dispatcher.client, 5)]
+
+
+def test_bot_with_its_own_client_schedules_and_sets_up_the_database(monkeypatch):
+    init_calls = []
+    monkeypatch.setattr(bot_module, "init_db", lambda: init_calls.append(True))
+
+    async def build():
+        # Pyrogram clients are created on a running event loop
+        return TelegramBot(api_id=1, api_hash="test", bot_name="standalone")
+
+    bot = asyncio.run(build())
+    assert init_calls == [True]
+    assert isinstance(bot.scheduler, KeyedScheduler)
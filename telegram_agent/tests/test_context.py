@@ -0,0 +1,95 @@
+# test_context.py
+
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from telegram_agent.src.llm.context import build_context_window
+from telegram_agent.src.models.models import Chat, ChatConfig, Message, TopicSummary, User
+from telegram_agent.src.telegram.chat.chat_base import TopicContext
+from telegram_agent.src.telegram.database import get_session, init_db
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+CHAT_ID = -500
+THREAD_ID = 3
+EPOCH = datetime(2024, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def session():
+    init_db()
+    with get_session() as session:
+        session.add(User(id=1, username="alice"))
+        session.add(Chat(id=CHAT_ID, type="supergroup", title="context"))
+        texts = ["[Goal] ship it"] + [f"message {i}" for i in range(2, 13)]
+        # A command and a deleted message in the middle of the discussion
+        texts[5] = "/ask what now"
+        for msg_id, text in enumerate(texts, start=1):
+            session.add(
+                Message(
+                    msg_id=msg_id,
+                    user_id=1,
+                    chat_id=CHAT_ID,
+                    chat_type="supergroup",
+                    message_thread_id=THREAD_ID,
+                    date=EPOCH + timedelta(minutes=msg_id),
+                    text=text,
+                    deleted=msg_id == 8,
+                )
+            )
+        session.add(
+            ChatConfig(
+                chat_id=CHAT_ID,
+                message_thread_id=THREAD_ID,
+                label="Goal",
+                msg_id=1,
+                date=EPOCH + timedelta(minutes=1),
+                text="[Goal] ship it",
+                value="ship it",
+            )
+        )
+        session.commit()
+        yield session
+
+
+def build(session, **kwargs):
+    context = TopicContext(chat_id=CHAT_ID, message_thread_id=THREAD_ID, session=session)
+    return asyncio.run(build_context_window(context, **kwargs))
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_window_leaves_out_pinned_commands_and_deleted_messages(session):
+    window = build(session)
+    assert window.goal == "[Goal] ship it"
+    assert window.history.splitlines() == [
+        f"alice: message {i}" for i in (2, 3, 4, 5, 7, 9, 10, 11, 12)
+    ]
+    assert window.included == 9
+    assert window.omitted == 0
+
+
+def test_omitted_counts_exactly_the_discussion_messages_skipped(session):
+    window = build(session, max_messages=3)
+    assert window.history.splitlines() == [f"alice: message {i}" for i in (10, 11, 12)]
+    # 2, 3, 4, 5, 7 and 9; not the goal, the command or the deleted message
+    assert window.omitted == 6
+
+
+def test_summarized_messages_are_neither_included_nor_omitted(session):
+    summary = TopicSummary(
+        chat_id=CHAT_ID,
+        message_thread_id=THREAD_ID,
+        level=0,
+        first_msg_id=1,
+        last_msg_id=7,
+        message_count=5,
+        text="- the team agreed to ship",
+    )
+    window = build(session, max_messages=2, summaries=[summary])
+    assert window.summary == "- the team agreed to ship"
+    assert window.summarized == 5
+    assert window.history.splitlines() == ["alice: message 11", "alice: message 12"]
+    assert window.omitted == 2
@@ -0,0 +1,162 @@
+# test_ingest.py
+
+import asyncio
+import contextlib
+from types import SimpleNamespace
+
+import pytest
+
+from telegram_agent.src.telegram import ingest
+from telegram_agent.src.telegram.ingest import MessageIngestQueue
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+
+
+@contextlib.asynccontextmanager
+async def no_session():
+    yield None
+
+
+class FakeStore:
+    """
+    Stands in for store_messages_async: records committed msg_ids, fails the first
+    `transient` calls and every batch containing one of the `bad` msg_ids.
+    """
+
+    def __init__(self, transient=0, bad=(), delay=0.0):
+        self.transient = transient
+        self.bad = set(bad)
+        self.delay = delay
+        self.calls = 0
+        self.stored = []
+
+    async def __call__(self, session, batch):
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.calls <= self.transient:
+            raise RuntimeError("database is locked")
+        if any(context.msg_id in self.bad for context in batch):
+            raise ValueError("bad row")
+        self.stored.extend(context.msg_id for context in batch)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    def install(**kwargs):
+        fake = FakeStore(**kwargs)
+        monkeypatch.setattr(ingest, "store_messages_async", fake)
+        return fake
+
+    return install
+
+
+def message(msg_id):
+    return SimpleNamespace(msg_id=msg_id, chat_id=1)
+
+
+def make_queue(**kwargs):
+    options = dict(session_factory=no_session, flush_interval_ms=10, retry_backoff_ms=1)
+    options.update(kwargs)
+    return MessageIngestQueue(**options)
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_failed_commit_is_retried_with_exponential_backoff(store, monkeypatch):
+    fake = store(transient=2)
+    delays = []
+    sleep = asyncio.sleep
+
+    async def record_sleep(delay, *args):
+        delays.append(delay)
+        await sleep(0)
+
+    async def scenario():
+        queue = make_queue(batch_size=5, retry_backoff_ms=100)
+        monkeypatch.setattr(ingest.asyncio, "sleep", record_sleep)
+        queue.start()
+        for msg_id in range(5):
+            await queue.enqueue(message(msg_id))
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert delays == [0.1, 0.2]
+    assert fake.stored == [0, 1, 2, 3, 4]
+    assert queue.metrics.retries == 2
+    assert queue.metrics.failed_batches == 0
+    assert queue.metrics.dropped == 0
+
+
+def test_batch_that_keeps_failing_is_bisected_down_to_the_bad_rows(store):
+    fake = store(bad={3, 6})
+
+    async def scenario():
+        queue = make_queue(batch_size=8)
+        queue.start()
+        for msg_id in range(8):
+            await queue.enqueue(message(msg_id))
+        await queue.stop()
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert sorted(fake.stored) == [0, 1, 2, 4, 5, 7]
+    assert queue.metrics.failed_batches == 1
+    assert queue.metrics.dropped == 2
+    assert queue.metrics.stored == 6
+
+
+def test_stop_commits_the_batch_in_progress_and_everything_queued(store):
+    fake = store(delay=0.02)
+
+    async def scenario():
+        queue = make_queue(batch_size=10)
+        queue.start()
+        for msg_id in range(95):
+            await queue.enqueue(message(msg_id))
+        # The writer is in the middle of a commit when stop is called
+        await asyncio.sleep(0.01)
+        await asyncio.wait_for(queue.stop(), 5)
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert sorted(fake.stored) == list(range(95))
+    assert queue.queue_depth == 0
+    assert queue._queue._unfinished_tasks == 0
+
+
+def test_writer_keeps_running_until_every_user_has_stopped(store):
+    fake = store()
+
+    async def scenario():
+        queue = make_queue()
+        queue.start()
+        queue.start()
+        await queue.stop()
+        running_after_first_stop = queue._writer is not None and not queue._writer.done()
+        await queue.enqueue(message(1))
+        await queue.stop()
+        return queue, running_after_first_stop
+
+    queue, running_after_first_stop = asyncio.run(scenario())
+    assert running_after_first_stop
+    assert fake.stored == [1]
+    assert queue._writer is None
+
+
+def test_enqueue_after_the_last_stop_is_rejected(store):
+    fake = store()
+
+    async def scenario():
+        queue = make_queue()
+        queue.start()
+        await queue.stop()
+        await queue.enqueue(message(1))
+        return queue
+
+    queue = asyncio.run(scenario())
+    assert fake.stored == []
+    assert queue._writer is None
+    assert queue.metrics.dropped == 1
@@ -0,0 +1,47 @@
+# test_llm_cache.py
+
+import asyncio
+import time
+
+from telegram_agent.src.llm.cache import LLMCache
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_cache_file_is_opened_by_the_first_lookup(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.db"), ttl=60, max_entries=10)
+    assert cache.conn is None
+    assert not (tmp_path / "cache.db").exists()
+    assert asyncio.run(cache.get("missing")) is None
+    assert cache.conn is not None
+    assert cache.metrics.misses == 1
+
+
+def test_processes_sharing_the_file_stay_within_max_entries(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = LLMCache(path=path, ttl=60, max_entries=3)
+    second = LLMCache(path=path, ttl=60, max_entries=3)
+
+    async def scenario():
+        for n in range(4):
+            await first.put(f"first-{n}", "a")
+            await second.put(f"second-{n}", "b")
+        # Storing an existing key again replaces it without growing the cache
+        await second.put("second-3", "c")
+
+    asyncio.run(scenario())
+    assert len(first) == len(second) == 3
+    assert first.metrics.evictions + second.metrics.evictions == 5
+    # The least recently used entries went first
+    assert asyncio.run(first.get("second-3")) == "c"
+    assert asyncio.run(first.get("first-3")) == "a"
+    assert asyncio.run(first.get("first-2")) is None
+
+
+def test_expired_entry_is_a_miss_and_removed(tmp_path):
+    cache = LLMCache(path=str(tmp_path / "cache.db"), ttl=60, max_entries=10)
+    asyncio.run(cache.put("key", "response"))
+    cache.conn.execute("UPDATE llm_response SET created = ?", (time.time() - 61,))
+    assert asyncio.run(cache.get("key")) is None
+    assert cache.metrics.expired == 1
+    assert len(cache) == 0
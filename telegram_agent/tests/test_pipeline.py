@@ -0,0 +1,120 @@
+# test_pipeline.py
+
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+
+from telegram_agent.src.models.models import MessageContext
+from telegram_agent.src.pipeline.actions import BaseAction
+from telegram_agent.src.pipeline.filters import ChatFilter, EqualsFilter
+from telegram_agent.src.pipeline.pipeline_base import Pipeline, PipelineStep
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+always = ChatFilter("always", lambda ctx: True)
+
+
+def message(text="hello"):
+    return SimpleNamespace(
+        msg_id=1,
+        text=text,
+        chat_type="supergroup",
+        chat_id=1,
+        message_thread_id=None,
+        message_thread_name=None,
+    )
+
+
+class TrackingAction(BaseAction):
+    """
+    Records how many tracking actions run at once; raises `error` if given.
+    """
+
+    def __init__(self, tracker, error=None):
+        self.tracker = tracker
+        self.error = error
+
+    async def execute(self, client, context):
+        self.tracker.running += 1
+        self.tracker.peak = max(self.tracker.peak, self.tracker.running)
+        try:
+            await asyncio.sleep(0.01)
+            if self.error:
+                raise self.error
+        finally:
+            self.tracker.running -= 1
+        self.tracker.finished += 1
+
+
+def tracker():
+    return SimpleNamespace(running=0, peak=0, finished=0)
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_concurrent_step_runs_at_most_max_concurrency_actions_at_once():
+    counts = tracker()
+    actions = [TrackingAction(counts) for _ in range(10)]
+    step = PipelineStep(filters=[always], actions=actions, concurrent=True, max_concurrency=3)
+    asyncio.run(step.process(None, message()))
+    assert counts.peak == 3
+    assert counts.finished == 10
+
+
+def test_failing_action_does_not_cancel_its_siblings():
+    counts = tracker()
+    actions = [TrackingAction(counts) for _ in range(4)]
+    actions.insert(1, TrackingAction(counts, error=RuntimeError("boom")))
+    step = PipelineStep(filters=[always], actions=actions, concurrent=True, max_concurrency=2)
+    asyncio.run(step.process(None, message()))
+    assert counts.finished == 4
+    assert counts.running == 0
+
+
+def test_sequential_step_runs_one_action_at_a_time():
+    counts = tracker()
+    step = PipelineStep(filters=[always], actions=[TrackingAction(counts) for _ in range(3)])
+    asyncio.run(step.process(None, message()))
+    assert counts.peak == 1
+    assert counts.finished == 3
+
+
+def test_filter_shared_by_several_pipelines_runs_once_per_update():
+    calls = []
+    counting = ChatFilter("counting", lambda ctx: calls.append(ctx.msg_id) or True)
+    is_supergroup = EqualsFilter("is_supergroup", "chat_type", "supergroup")
+    counts = tracker()
+    # The way several bots behind one Dispatcher share the filters module
+    pipelines = [
+        Pipeline([PipelineStep([counting], [TrackingAction(counts)])]),
+        Pipeline(
+            [
+                PipelineStep([is_supergroup, counting], [TrackingAction(counts)]),
+                PipelineStep([counting & is_supergroup], [TrackingAction(counts)]),
+            ]
+        ),
+    ]
+
+    def update(msg_id):
+        return MessageContext(
+            msg_id=msg_id,
+            user_id=1,
+            chat_id=1,
+            chat_type="supergroup",
+            chat_title="pipelines",
+            message_thread_id=None,
+            message_thread_name=None,
+            date=datetime(2024, 1, 1),
+            text="hello",
+            user=None,
+            chat=None,
+        )
+
+    async def scenario():
+        for msg_id in (1, 2):
+            context = update(msg_id)
+            await asyncio.gather(*(pipeline.process(None, context) for pipeline in pipelines))
+
+    asyncio.run(scenario())
+    assert calls == [1, 2]
+    assert counts.finished == 6
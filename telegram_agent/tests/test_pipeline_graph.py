@@ -0,0 +1,150 @@
+# test_pipeline_graph.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from telegram_agent.src.pipeline.actions import BaseAction
+from telegram_agent.src.pipeline.models.project_scaffold import supergroup_scaffold_graph
+from telegram_agent.src.pipeline.pipeline_base import PipelineGraph, PipelineNode
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+CONTEXT = SimpleNamespace(msg_id=1, chat_id=10, message_thread_id=None, text="idea")
+
+
+class RecordingAction(BaseAction):
+    """
+    Appends its name to `log` when it starts and when it ends, then returns `result`
+    (or raises it, if it is an exception).
+    """
+
+    def __init__(self, name, log, result=None, delay=0.0):
+        self.name = name
+        self.log = log
+        self.result = result
+        self.delay = delay
+        self.inputs = None
+
+    async def execute(self, client, context, inputs=None):
+        self.inputs = inputs
+        self.log.append(("start", self.name))
+        await asyncio.sleep(self.delay)
+        self.log.append(("end", self.name))
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def node(name, log, after=None, inputs=None, **kwargs):
+    action = RecordingAction(name, log, **kwargs)
+    return PipelineNode(name, action, inputs=inputs, after=after)
+
+
+def run(graph, client=None):
+    return asyncio.run(graph.process(client, CONTEXT))
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_cycles_and_unknown_dependencies_are_rejected():
+    log = []
+    with pytest.raises(ValueError, match="cycle"):
+        PipelineGraph(
+            [
+                node("a", log, after=["c"]),
+                node("b", log, after=["a"]),
+                node("c", log, after=["b"]),
+            ]
+        )
+    with pytest.raises(ValueError, match="unknown node 'missing'"):
+        PipelineGraph([node("a", log, inputs={"x": "missing.id"})])
+    with pytest.raises(ValueError, match="already exists"):
+        PipelineGraph([node("a", log), node("a", log)])
+
+
+def test_nodes_start_after_their_dependencies_and_branches_overlap():
+    log = []
+    graph = PipelineGraph(
+        [
+            node("d", log, after=["b", "c"]),
+            node("b", log, after=["a"], delay=0.02),
+            node("c", log, after=["a"], delay=0.02),
+            node("a", log),
+        ]
+    )
+    assert graph.order == ["a", "b", "c", "d"]
+    run(graph)
+    position = {event: index for index, event in enumerate(log)}
+    assert position[("end", "a")] < position[("start", "b")]
+    assert position[("end", "a")] < position[("start", "c")]
+    # b and c run at the same time
+    assert position[("start", "c")] < position[("end", "b")]
+    assert position[("end", "b")] < position[("start", "d")]
+    assert position[("end", "c")] < position[("start", "d")]
+
+
+def test_results_flow_to_downstream_inputs():
+    log = []
+    chat = SimpleNamespace(id=-100, owner=SimpleNamespace(name="bot"))
+    consumer = node(
+        "consumer", log, inputs={"chat_id": "chat.id", "owner": "chat.owner.name"}
+    )
+    graph = PipelineGraph([node("chat", log, result=chat), consumer])
+    results = run(graph)
+    assert consumer.action.inputs == {"chat_id": -100, "owner": "bot"}
+    assert results["chat"] is chat
+
+
+def test_failing_node_skips_its_dependents_only():
+    log = []
+    graph = PipelineGraph(
+        [
+            node("a", log, result=RuntimeError("boom")),
+            node("b", log, after=["a"]),
+            node("c", log, inputs={"x": "b"}),
+            node("independent", log, result="ok"),
+        ]
+    )
+    results = run(graph)
+    started = {name for kind, name in log if kind == "start"}
+    assert started == {"a", "independent"}
+    assert results == {"independent": "ok"}
+
+
+def test_node_without_upstream_result_is_skipped():
+    log = []
+    consumer = node("consumer", log, inputs={"chat_id": "chat.id"})
+    graph = PipelineGraph([node("chat", log, result=None), consumer])
+    results = run(graph)
+    assert ("start", "consumer") not in log
+    assert "consumer" not in results
+
+
+def test_scaffold_graph_creates_topics_in_order_and_seeds_each_prompt():
+    calls = []
+
+    class FakeClient:
+        async def create_forum_topic(self, chat_id, title):
+            calls.append(("topic", chat_id, title))
+            topic = SimpleNamespace(id=len(calls))
+            await asyncio.sleep(0.001)
+            return topic
+
+        async def send_message(self, chat_id, text, message_thread_id=None):
+            calls.append(("message", chat_id, message_thread_id, text))
+
+    prompts = {"Goal": "[Goal]", "Ideas": "[Prompt] ideas", "MVP": "[Prompt] mvp"}
+    graph = supergroup_scaffold_graph(prompts)
+    graph.nodes["supergroup"].action = RecordingAction(
+        "supergroup", [], SimpleNamespace(id=-100)
+    )
+    run(graph, FakeClient())
+
+    topics = [call for call in calls if call[0] == "topic"]
+    assert topics == [("topic", -100, title) for title in prompts]
+    topic_ids = {call[2]: calls.index(call) + 1 for call in topics}
+    messages = {call[3]: call for call in calls if call[0] == "message"}
+    for title, prompt in prompts.items():
+        assert messages[prompt] == ("message", -100, topic_ids[title], prompt)
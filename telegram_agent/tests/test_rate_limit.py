@@ -0,0 +1,76 @@
+# test_rate_limit.py
+
+import asyncio
+
+import pytest
+
+from telegram_agent.src.telegram import rate_limit
+from telegram_agent.src.telegram.rate_limit import RateLimiter, TokenBucket
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_empty_bucket_reserves_tokens_and_serves_callers_in_order(fake_clock):
+    bucket = TokenBucket(rate=2, capacity=2)
+    # The burst, then each caller waits for the tokens reserved before it
+    assert [bucket.delay() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    assert bucket.tokens == -2
+
+    fake_clock.now = 1.0
+    assert bucket.delay() == 0.5
+    # Refilling never goes past the capacity
+    fake_clock.now = 100.0
+    assert [bucket.delay() for _ in range(3)] == [0.0, 0.0, 0.5]
+
+
+def test_acquire_sleeps_only_for_the_reserved_wait(fake_clock):
+    bucket = TokenBucket(rate=4, capacity=1)
+
+    async def scenario():
+        for _ in range(3):
+            await bucket.acquire()
+
+    asyncio.run(scenario())
+    assert fake_clock.sleeps == [0.25, 0.25]
+    assert bucket.waits == 2
+    assert bucket.wait_time == 0.5
+
+
+def test_pause_holds_back_the_next_caller_without_shortening_a_longer_wait(fake_clock):
+    bucket = TokenBucket(rate=1, capacity=5)
+    bucket.pause(3)
+    assert bucket.delay() == 3.0
+
+    # Already 3s in debt: a shorter pause changes nothing
+    bucket.pause(1)
+    assert bucket.delay() == 4.0
+
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0, capacity=1)
+
+
+def test_chat_pause_only_holds_back_that_chat(fake_clock):
+    limiter = RateLimiter(rate=100, burst=100, chat_rate=1, chat_burst=1)
+    limiter.pause(10, chat_id=1)
+
+    async def scenario():
+        await limiter.acquire(2)
+        await limiter.acquire(1)
+
+    asyncio.run(scenario())
+    assert fake_clock.sleeps == [10.0]
+
+
+def test_least_recently_used_chat_buckets_are_evicted(fake_clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "MAX_CHAT_BUCKETS", 3)
+    limiter = RateLimiter(rate=100, burst=100, chat_rate=1, chat_burst=1)
+    for chat_id in (1, 2, 3):
+        limiter.pause(5, chat_id=chat_id)
+    # Chat 1 is used again, so chat 2 is now the least recently used
+    limiter.pause(5, chat_id=1)
+    limiter.pause(5, chat_id=4)
+    assert list(limiter.chat_buckets) == [3, 1, 4]
+    assert limiter.snapshot()["tracked_chats"] == 3
+    # An evicted chat starts over with a full bucket
+    assert limiter._chat_bucket(2).delay() == 0.0
+    assert 3 not in limiter.chat_buckets
@@ -0,0 +1,122 @@
+# test_routing.py
+
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from telegram_agent.src.pipeline.filters import ChatFilter, EqualsFilter, KeywordFilter
+from telegram_agent.src.pipeline.pipeline_base import PipelineStep
+from telegram_agent.src.pipeline.routing import KeywordMatcher, PipelineRouter, route_keys
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+is_private = EqualsFilter("is_private", "chat_type", "private")
+is_supergroup = EqualsFilter("is_supergroup", "chat_type", "supergroup")
+in_chat = EqualsFilter("in_chat", "chat_id", 42)
+in_ideas = EqualsFilter("in_ideas", "message_thread_name", "Ideas")
+has_init = KeywordFilter("has_init", "/init")
+has_idea = KeywordFilter("has_idea", "[Idea]")
+is_long = ChatFilter("is_long", lambda ctx: len(ctx.text or "") > 20)
+
+
+def message(text="", chat_type="supergroup", chat_id=1, thread=None):
+    return SimpleNamespace(
+        text=text,
+        chat_type=chat_type,
+        chat_id=chat_id,
+        message_thread_id=None,
+        message_thread_name=thread,
+    )
+
+
+def step(*filters):
+    return PipelineStep(filters=list(filters), actions=[])
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_keyword_matcher_finds_overlapping_keywords():
+    matcher = KeywordMatcher(["he", "she", "his", "hers"])
+    assert matcher.find("ushers") == {"he", "she", "hers"}
+    assert matcher.find("this") == {"his"}
+    assert matcher.find("hi there") == {"he"}
+    assert matcher.find("xyz") == set()
+
+
+def test_keyword_matcher_finds_keywords_nested_in_each_other():
+    matcher = KeywordMatcher(["/init", "/init_project", "init"])
+    assert matcher.find("/init_project now") == {"/init", "/init_project", "init"}
+    assert matcher.find("reinit") == {"init"}
+
+
+def test_route_keys_of_indexable_filters():
+    assert route_keys(is_private) == [("chat_type", "private")]
+    assert route_keys(has_init) == [("keyword", "/init")]
+    assert route_keys(is_long) is None
+
+
+def test_route_keys_of_and_picks_most_selective_filter():
+    assert route_keys(is_supergroup & in_chat) == [("chat_id", 42)]
+    assert route_keys(is_long & has_idea) == [("keyword", "[idea]")]
+    assert route_keys(is_long & is_long) is None
+
+
+def test_route_keys_of_or_needs_every_option_indexable():
+    assert route_keys(is_private | has_init) == [
+        ("chat_type", "private"),
+        ("keyword", "/init"),
+    ]
+    assert route_keys(is_private | is_long) is None
+    assert route_keys((is_private | is_long) & in_ideas) == [
+        ("message_thread_name", "Ideas")
+    ]
+
+
+def test_router_keeps_unindexable_steps_for_every_message():
+    steps = [step(is_private | is_long), step(has_init), step(is_long)]
+    router = PipelineRouter(steps)
+    assert router.unindexed == [0, 2]
+    assert router.candidates(message("hello")) == [steps[0], steps[2]]
+    assert router.candidates(message("/init")) == steps
+
+
+def test_router_candidates_keep_pipeline_order():
+    steps = [
+        step(has_idea),
+        step(is_long),
+        step(is_supergroup),
+        step(is_private, has_init),
+        step(in_ideas),
+        step(has_init | is_supergroup),
+    ]
+    router = PipelineRouter(steps)
+    candidates = router.candidates(message("[Idea] plan", thread="Ideas"))
+    assert candidates == [steps[0], steps[1], steps[2], steps[4], steps[5]]
+    assert router.candidates(message("/init", chat_type="private")) == [
+        steps[1],
+        steps[3],
+        steps[5],
+    ]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_router_never_skips_a_matching_step(seed):
+    rng = random.Random(seed)
+    filters = [is_private, is_supergroup, in_chat, in_ideas, has_init, has_idea, is_long]
+    steps = []
+    for _ in range(30):
+        chosen = rng.sample(filters, rng.randint(1, 3))
+        steps.append(step(chosen[0] | chosen[-1]) if rng.random() < 0.3 else step(*chosen))
+    router = PipelineRouter(steps)
+
+    for _ in range(200):
+        context = message(
+            text=rng.choice(["", "/init", "an [IDEA] worth a long message", "/INIT [idea]"]),
+            chat_type=rng.choice(["private", "supergroup"]),
+            chat_id=rng.choice([1, 42]),
+            thread=rng.choice([None, "Ideas", "MVP"]),
+        )
+        candidates = router.candidates(context)
+        matching = [s for s in steps if s.condition(context)]
+        assert [s for s in candidates if s.condition(context)] == matching
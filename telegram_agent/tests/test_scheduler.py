@@ -0,0 +1,144 @@
+# test_scheduler.py
+
+import asyncio
+import random
+from collections import defaultdict
+
+import pytest
+
+from telegram_agent.src.telegram.scheduler import KeyedScheduler
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_jobs_run_in_order_per_key_and_concurrently_across_keys():
+    async def scenario():
+        scheduler = KeyedScheduler(workers=4, max_queue_size=10, name="test")
+        rng = random.Random(0)
+        done = defaultdict(list)
+        running = {"now": 0, "max": 0}
+
+        async def job(key, n):
+            running["now"] += 1
+            running["max"] = max(running["max"], running["now"])
+            await asyncio.sleep(rng.random() / 1000)
+            done[key].append(n)
+            running["now"] -= 1
+
+        async def producer(key):
+            for n in range(25):
+                await scheduler.submit(key, job, key, n)
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*(producer((1, topic)) for topic in range(12)))
+        await scheduler.stop()
+        return scheduler, done, running["max"]
+
+    scheduler, done, max_running = asyncio.run(scenario())
+    assert all(done[(1, topic)] == list(range(25)) for topic in range(12))
+    assert 1 < max_running <= 4
+    assert scheduler.metrics.completed == 300
+    assert scheduler.metrics.dropped == 0
+
+
+def test_failing_job_does_not_stop_its_worker():
+    async def scenario():
+        scheduler = KeyedScheduler(workers=1, max_queue_size=5, name="test")
+        done = []
+
+        async def fail():
+            raise RuntimeError("boom")
+
+        async def ok():
+            done.append(True)
+
+        await scheduler.submit("key", fail)
+        await scheduler.submit("key", ok)
+        await scheduler.stop()
+        return scheduler, done
+
+    scheduler, done = asyncio.run(scenario())
+    assert done == [True]
+    assert scheduler.metrics.failed == 1
+    assert scheduler.metrics.completed == 1
+
+
+async def _fill(scheduler, done):
+    """
+    Occupies the only worker with a job waiting on the returned event, then fills its
+    queue with jobs 0 and 1.
+    """
+    release = asyncio.Event()
+    started = asyncio.Event()
+
+    async def blocker():
+        started.set()
+        await release.wait()
+
+    async def job(n):
+        done.append(n)
+
+    await scheduler.submit("key", blocker)
+    await started.wait()
+    for n in range(scheduler.max_queue_size):
+        assert await scheduler.submit("key", job, n)
+    return release, job
+
+
+def test_block_policy_waits_for_room():
+    async def scenario():
+        scheduler = KeyedScheduler(workers=1, max_queue_size=2, overflow="block")
+        done = []
+        release, job = await _fill(scheduler, done)
+        submit = asyncio.create_task(scheduler.submit("key", job, 2))
+        await asyncio.sleep(0.01)
+        blocked = not submit.done()
+        release.set()
+        accepted = await submit
+        await scheduler.stop()
+        return scheduler, done, blocked, accepted
+
+    scheduler, done, blocked, accepted = asyncio.run(scenario())
+    assert blocked and accepted
+    assert done == [0, 1, 2]
+    assert scheduler.metrics.blocked == 1
+    assert scheduler.metrics.dropped == 0
+
+
+def test_drop_new_policy_rejects_the_new_job():
+    async def scenario():
+        scheduler = KeyedScheduler(workers=1, max_queue_size=2, overflow="drop_new")
+        done = []
+        release, job = await _fill(scheduler, done)
+        accepted = await scheduler.submit("key", job, 2)
+        release.set()
+        await scheduler.stop()
+        return scheduler, done, accepted
+
+    scheduler, done, accepted = asyncio.run(scenario())
+    assert not accepted
+    assert done == [0, 1]
+    assert scheduler.metrics.dropped == 1
+
+
+def test_drop_oldest_policy_discards_the_oldest_queued_job():
+    async def scenario():
+        scheduler = KeyedScheduler(workers=1, max_queue_size=2, overflow="drop_oldest")
+        done = []
+        release, job = await _fill(scheduler, done)
+        accepted = await scheduler.submit("key", job, 2)
+        release.set()
+        await scheduler.stop()
+        return scheduler, done, accepted
+
+    scheduler, done, accepted = asyncio.run(scenario())
+    assert accepted
+    assert done == [1, 2]
+    assert scheduler.metrics.dropped == 1
+
+
+def test_invalid_settings_are_rejected():
+    with pytest.raises(ValueError):
+        KeyedScheduler(overflow="drop_everything")
+    with pytest.raises(ValueError):
+        KeyedScheduler(workers=0)
@@ -0,0 +1,155 @@
+# test_storage.py
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlmodel import select
+
+from telegram_agent.src.models.models import Chat, ChatConfig, Message, MessageContext, User
+from telegram_agent.src.telegram.database import get_session, init_db
+from telegram_agent.src.telegram.utils import (
+    bulk_sync_messages,
+    rebuild_chat_config,
+    store_message,
+    upsert_statements,
+)
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+EPOCH = datetime(2024, 1, 1)
+USER = User(id=7, username="bob")
+
+
+@pytest.fixture
+def session():
+    init_db()
+    with get_session() as session:
+        yield session
+
+
+def context(chat_id, msg_id, text="hello", thread=None):
+    return MessageContext(
+        msg_id=msg_id,
+        user_id=USER.id,
+        chat_id=chat_id,
+        chat_type="supergroup",
+        chat_title="storage",
+        message_thread_id=thread,
+        message_thread_name=None,
+        date=EPOCH + timedelta(minutes=msg_id),
+        text=text,
+        user=USER,
+        chat=Chat(id=chat_id, type="supergroup", title="storage"),
+    )
+
+
+def upsert(session, contexts):
+    """
+    Runs the upsert statements one row at a time and returns the rows each one wrote.
+    """
+    written = 0
+    for stmt, rows in upsert_statements(contexts):
+        if stmt.table.name == "message":
+            for row in rows:
+                written += session.execute(stmt, [row]).rowcount
+        else:
+            session.execute(stmt, rows)
+    session.commit()
+    return written
+
+
+def config(session, chat_id, label, thread=0):
+    entry = session.get(ChatConfig, (chat_id, thread, label))
+    return entry and (entry.msg_id, entry.value)
+
+
+def stored(session, chat_id):
+    query = select(Message).where(Message.chat_id == chat_id).order_by(Message.msg_id)
+    return {message.msg_id: message for message in session.exec(query)}
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_bulk_sync_counts_inserts_updates_and_soft_deletes(session):
+    chat_id = -301
+    counts = bulk_sync_messages(session, chat_id, [context(chat_id, i) for i in (1, 2, 3)])
+    assert counts == {"inserted": 3, "updated": 0, "deleted": 0}
+
+    current = [context(chat_id, 1), context(chat_id, 2, text="edited"), context(chat_id, 4)]
+    counts = bulk_sync_messages(session, chat_id, current)
+    assert counts == {"inserted": 1, "updated": 1, "deleted": 1}
+    messages = stored(session, chat_id)
+    assert messages[2].text == "edited"
+    assert messages[3].deleted
+    assert not messages[4].deleted
+
+    # Nothing changed, and a message already marked deleted is not deleted again
+    counts = bulk_sync_messages(session, chat_id, current)
+    assert counts == {"inserted": 0, "updated": 0, "deleted": 0}
+
+
+def test_upsert_of_an_unchanged_message_writes_nothing(session):
+    chat_id = -302
+    assert upsert(session, [context(chat_id, 1, text=None)]) == 1
+    # IS DISTINCT FROM treats two NULLs as equal...
+    assert upsert(session, [context(chat_id, 1, text=None)]) == 0
+    # ...and a NULL and a value as different
+    assert upsert(session, [context(chat_id, 1, text="now with text")]) == 1
+    assert upsert(session, [context(chat_id, 1, text="now with text")]) == 0
+    assert stored(session, chat_id)[1].text == "now with text"
+
+
+def test_topic_sync_leaves_other_topics_untouched(session):
+    chat_id = -303
+    bulk_sync_messages(
+        session,
+        chat_id,
+        [context(chat_id, 1, thread=10), context(chat_id, 2, thread=20)],
+    )
+    # A topic sync that also sees a message of another topic
+    counts = bulk_sync_messages(
+        session,
+        chat_id,
+        [context(chat_id, 3, thread=10), context(chat_id, 4, thread=20)],
+        message_thread_id=10,
+    )
+    assert counts == {"inserted": 1, "updated": 0, "deleted": 1}
+    messages = stored(session, chat_id)
+    assert messages[1].deleted
+    assert not messages[2].deleted
+    assert 3 in messages and 4 not in messages
+
+
+def test_chat_config_follows_edits_and_deletions_of_labeled_messages(session):
+    chat_id = -304
+    store_message(session, context(chat_id, 1, "[Goal] v1"))
+    store_message(session, context(chat_id, 2, "[Goal] v2"))
+    assert config(session, chat_id, "Goal") == (2, "v2")
+
+    store_message(session, context(chat_id, 2, "[Goal] v3"))
+    assert config(session, chat_id, "Goal") == (2, "v3")
+
+    # Editing the label away falls back to the previous goal
+    store_message(session, context(chat_id, 2, "no longer a goal"))
+    assert config(session, chat_id, "Goal") == (1, "v1")
+
+    # Deleting the last goal message clears the entry
+    bulk_sync_messages(session, chat_id, [context(chat_id, 2, "no longer a goal")])
+    assert config(session, chat_id, "Goal") is None
+
+
+def test_rebuild_chat_config_restores_every_topic(session):
+    chat_id = -305
+    for msg_id, thread, text in (
+        (1, 5, "[Prompt] plan"),
+        (2, 6, "[Prompt] build"),
+        (3, 5, "[Prompt] plan better"),
+        (4, 6, "[Goal] ship"),
+    ):
+        store_message(session, context(chat_id, msg_id, text, thread=thread))
+    session.execute(ChatConfig.__table__.delete().where(ChatConfig.chat_id == chat_id))
+    rebuild_chat_config(session)
+    session.commit()
+    assert config(session, chat_id, "Prompt", thread=5) == (3, "plan better")
+    assert config(session, chat_id, "Prompt", thread=6) == (2, "build")
+    assert config(session, chat_id, "Goal", thread=6) == (4, "ship")
@@ -0,0 +1,119 @@
+# test_streaming.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from telegram_agent.src.telegram import streaming
+from telegram_agent.src.telegram.streaming import (
+    MAX_MESSAGE_LENGTH,
+    STREAM_ERROR_MARKER,
+    split_message_text,
+    stream_message,
+)
+
+# Fixtures ------------------------------------------------------------------------------------------------------------
+
+
+class FakeClient:
+    """
+    Records the messages posted, edited and deleted; edits raise `edit_error` if given.
+    """
+
+    def __init__(self, edit_error=None):
+        self.edit_error = edit_error
+        self.sent = []
+        self.edits = []
+        self.deleted = []
+
+    async def send_message(self, chat_id, text, message_thread_id=None):
+        self.sent.append(text)
+        return SimpleNamespace(id=len(self.sent), chat=SimpleNamespace(id=chat_id))
+
+    async def edit_message_text(self, chat_id, message_id, text):
+        if self.edit_error:
+            raise self.edit_error
+        self.edits.append((message_id, text))
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.deleted.append(message_ids)
+
+
+@pytest.fixture
+def clock(fake_clock, monkeypatch):
+    async def direct(client, method, *args, **kwargs):
+        return await method(*args, **kwargs)
+
+    # Time only moves when the test says so; calls skip the rate limiter
+    monkeypatch.setattr(streaming, "asyncio", fake_clock)
+    monkeypatch.setattr(streaming, "call_api", direct)
+    return fake_clock
+
+
+def chunks(clock, timeline, error=None):
+    async def generate():
+        for at, chunk in timeline:
+            clock.now = at
+            yield chunk
+        if error:
+            raise error
+
+    return generate()
+
+
+def stream(client, generator, **kwargs):
+    return asyncio.run(stream_message(client, -1, generator, **kwargs))
+
+
+# Tests ---------------------------------------------------------------------------------------------------------------
+
+
+def test_edits_are_throttled_and_the_final_text_is_always_applied(clock):
+    client = FakeClient()
+    timeline = [(0.0, "a"), (0.3, "b"), (0.6, "c"), (1.2, "d"), (1.5, "e"), (2.0, "f")]
+    message = stream(client, chunks(clock, timeline), edit_interval=1.0)
+    assert client.sent == [streaming.STREAM_PLACEHOLDER]
+    assert client.edits == [(1, "abcd"), (1, "abcdef")]
+    assert message.id == 1
+
+
+def test_failed_stream_keeps_the_partial_text_with_a_marker(clock):
+    client = FakeClient()
+    generator = chunks(clock, [(1.0, "partial answer")], error=RuntimeError("llm down"))
+    with pytest.raises(RuntimeError, match="llm down"):
+        stream(client, generator, edit_interval=5.0)
+    assert client.edits == [(1, "partial answer" + STREAM_ERROR_MARKER)]
+    assert client.deleted == []
+
+
+def test_failed_stream_without_text_deletes_the_placeholder(clock):
+    client = FakeClient()
+    with pytest.raises(RuntimeError):
+        stream(client, chunks(clock, [], error=RuntimeError("llm down")))
+    assert client.deleted == [1]
+
+
+def test_cleanup_failure_does_not_hide_the_stream_error(clock):
+    client = FakeClient(edit_error=ConnectionError("offline"))
+    generator = chunks(clock, [(1.0, "partial")], error=RuntimeError("llm down"))
+    with pytest.raises(RuntimeError, match="llm down"):
+        stream(client, generator, edit_interval=5.0)
+
+
+def test_long_text_is_split_at_the_message_limit():
+    lines = [f"line {i:05d} " + "x" * 90 for i in range(100)]
+    text = "\n".join(lines)
+    parts = split_message_text(text)
+    assert all(len(part) <= MAX_MESSAGE_LENGTH for part in parts)
+    assert "\n".join(parts) == text
+    # Without newlines the text is cut at the limit
+    assert [len(part) for part in split_message_text("y" * 9000)] == [4096, 4096, 808]
+
+
+def test_stream_beyond_the_limit_posts_follow_up_messages(clock):
+    client = FakeClient()
+    timeline = [(0.1 * i, "z" * 1000) for i in range(9)]
+    stream(client, chunks(clock, timeline), edit_interval=60.0)
+    assert client.edits == [(1, "z" * 4096)]
+    assert client.sent == [streaming.STREAM_PLACEHOLDER, "z" * 4096, "z" * 808]